@@ -0,0 +1,327 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from metrics import registry as metrics
+from payloads import MESSAGE_SIZE
+from rollups import ROLLUPS
+
+# Upper bounds (exclusive) of the gap distribution buckets in microseconds:
+# 1 ms, 10 ms, 100 ms, 1 s, 10 s, 1 min, 10 min, 1 h and above
+GAP_BUCKETS = (
+    1000,
+    10000,
+    100000,
+    1000000,
+    10000000,
+    60000000,
+    600000000,
+    3600000000,
+)
+
+_GAP_CASE = (
+    "CASE "
+    + " ".join(f"WHEN gap < {bound} THEN {i}" for i, bound in enumerate(GAP_BUCKETS))
+    + f" ELSE {len(GAP_BUCKETS)} END"
+)
+
+
+class _Aggregate:
+    """Cached state of one analytics query"""
+
+    __slots__ = ("generation", "max_id", "state")
+
+    def __init__(self, generation, max_id, state):
+        self.generation = generation
+        self.max_id = max_id
+        self.state = state
+
+
+class MessageAnalytics:
+    """Aggregation queries over the stored messages of an MQTTDatabase
+
+    The work is done in SQL: every query returns partial aggregates per
+    database file, which are merged here. Results are cached per query and
+    filter set, keyed by the newest message id. When new messages arrived,
+    only the rows after the cached id are aggregated and merged into the
+    cached state; deletes (retention, clearing) invalidate the cache.
+    Histograms in whole minutes are read from the rollup tables instead
+    (see rollups.py), which hold one row per topic and minute or hour.
+    """
+
+    # Cached queries, the least recently used are dropped
+    CACHE_SIZE = 32
+
+    def __init__(self, database):
+        """Create the analytics of *database*"""
+        self.database = database
+        self.lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def clear_cache(self):
+        """Forget all cached results"""
+        with self.lock:
+            self._cache.clear()
+
+    def _run(self, key, filters, queries, merge):
+        """Return the merged state of *queries*, updating the cache
+
+        *queries* are (sql, params) with {tables} and {where} placeholders;
+        *merge(state, results)* merges the results of one file into the
+        state dict.
+        """
+        key = (key, tuple(sorted((filters or {}).items())))
+        # One query at a time, a concurrent refresh would merge rows twice
+        with self.lock:
+            generation, max_id = self.database._data_version()
+            cached = self._cache.get(key)
+            if cached is not None and cached.generation == generation:
+                self._cache.move_to_end(key)
+                if cached.max_id == max_id:
+                    metrics.inc("analytics_cache_hits")
+                    return cached.state
+                after_id = cached.max_id
+                metrics.inc("analytics_incremental")
+            else:
+                cached = _Aggregate(generation, 0, {})
+                after_id = None
+                metrics.inc("analytics_full")
+
+            for results in self.database._aggregate_rows(
+                queries, filters, (after_id, max_id)
+            ):
+                merge(cached.state, results)
+            cached.max_id = max_id
+            self._cache[key] = cached
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+            return cached.state
+
+    def topic_stats(self, filters=None):
+        """Return per topic dicts of count, bytes, first_ts and last_ts
+
+        Sorted by count, busiest first. Timestamps are epoch microseconds.
+        """
+        sql = (
+            f"SELECT t.name, COUNT(*), SUM({MESSAGE_SIZE}), MIN(m.ts), MAX(m.ts)"
+            " FROM {tables}{where} GROUP BY m.topic_id"
+        )
+        state = self._run("topics", filters, [(sql, [])], _merge_topic_stats)
+        stats = [
+            {
+                "topic": topic,
+                "count": count,
+                "bytes": size,
+                "first_ts": first,
+                "last_ts": last,
+            }
+            for topic, (count, size, first, last) in state.items()
+        ]
+        stats.sort(key=lambda s: (-s["count"], s["topic"]))
+        return stats
+
+    def top_topics(self, limit=10, by="count", filters=None):
+        """Return the *limit* topics with the most messages (or "bytes")"""
+        if by not in ("count", "bytes"):
+            raise ValueError(f"Unknown ranking: {by}")
+        stats = self.topic_stats(filters)
+        if by == "bytes":
+            stats.sort(key=lambda s: (-s["bytes"], s["topic"]))
+        return stats[:limit]
+
+    def histogram(self, bucket_seconds=60, filters=None, per_topic=False):
+        """Return message counts per time bucket
+
+        Rows are (bucket_start, count), or (topic, bucket_start, count) with
+        *per_topic*, sorted by time. Buckets start at multiples of
+        *bucket_seconds* since the epoch.
+        """
+        bucket = int(bucket_seconds * 1000000)
+        if bucket <= 0:
+            raise ValueError("bucket_seconds must be positive")
+        resolution = self._rollup_resolution(bucket, filters)
+        if resolution is not None:
+            sql = (
+                "SELECT t.name, r.bucket / ? * ? AS b, SUM(r.count)"
+                " FROM {tables}{where} GROUP BY r.topic_id, b"
+            )
+            state = {}
+            for results in self.database._aggregate_rollups(
+                [(sql, [bucket, bucket])], resolution, filters
+            ):
+                _merge_histogram(state, results)
+            metrics.inc("analytics_rollups")
+            if not per_topic:
+                totals = {}
+                for (_, start), count in state.items():
+                    totals[("", start)] = totals.get(("", start), 0) + count
+                state = totals
+        elif per_topic:
+            sql = (
+                "SELECT t.name, m.ts / ? * ? AS bucket, COUNT(*)"
+                " FROM {tables}{where} GROUP BY m.topic_id, bucket"
+            )
+        else:
+            sql = (
+                "SELECT '', m.ts / ? * ? AS bucket, COUNT(*)"
+                " FROM {tables}{where} GROUP BY bucket"
+            )
+        if resolution is None:
+            state = self._run(
+                ("histogram", bucket, per_topic),
+                filters,
+                [(sql, [bucket, bucket])],
+                _merge_histogram,
+            )
+        if per_topic:
+            return sorted(
+                ((topic, start, count) for (topic, start), count in state.items()),
+                key=lambda row: (row[1], row[0]),
+            )
+        return sorted((start, count) for (_, start), count in state.items())
+
+    def _rollup_resolution(self, bucket, filters):
+        """Rollup table that can answer a histogram of *bucket* µs, or None
+
+        Rollups only answer for whole buckets, so the time range has to
+        cover whole buckets as well: the start on a bucket start and the
+        inclusive end on the last microsecond of a bucket. Otherwise the
+        raw rows are used, which count the edge buckets partially.
+        """
+        from database import to_epoch_us
+
+        filters = filters or {}
+        if not self.database.rollups_ready or filters.get("direction"):
+            return None
+        start, end = (filters.get(key) for key in ("start", "end"))
+        for resolution in ("hour", "minute"):
+            length = ROLLUPS[resolution]
+            if bucket % length:
+                continue
+            if start is not None and to_epoch_us(start) % length:
+                continue
+            if end is not None and (to_epoch_us(end) + 1) % length:
+                continue
+            return resolution
+        return None
+
+    def rollups(self, resolution="minute", filters=None):
+        """Return the rollup rows as dicts, see MQTTDatabase.get_rollups()"""
+        sql = (
+            "SELECT t.name, r.bucket, r.count, r.bytes, r.num_count, r.num_min,"
+            " r.num_max, r.num_sum FROM {tables}{where}"
+        )
+        state = {}
+        for results in self.database._aggregate_rollups(
+            [(sql, [])], resolution, filters
+        ):
+            _merge_rollups(state, results)
+        rows = []
+        for (start, topic), (count, size, num_count, low, high, total) in sorted(
+            state.items()
+        ):
+            rows.append(
+                {
+                    "topic": topic,
+                    "bucket": start,
+                    "count": count,
+                    "bytes": size,
+                    "num_count": num_count,
+                    "min": low if num_count else None,
+                    "max": high if num_count else None,
+                    "mean": total / num_count if num_count else None,
+                }
+            )
+        return rows
+
+    def gap_distribution(self, filters=None):
+        """Return the distribution of the time between messages of a topic
+
+        Gaps are measured per topic in timestamp order. The result has the
+        count, min_us, max_us and mean_us of all gaps and "buckets", a list
+        of (upper bound in µs or None, count) over GAP_BUCKETS.
+        """
+        gaps = (
+            f"SELECT {_GAP_CASE} AS bucket, COUNT(*), SUM(gap), MIN(gap), MAX(gap)"
+            " FROM (SELECT m.ts - LAG(m.ts) OVER"
+            " (PARTITION BY m.topic_id ORDER BY m.ts) AS gap"
+            " FROM {tables}{where}) WHERE gap IS NOT NULL GROUP BY bucket"
+        )
+        # First and last timestamps join the gaps across files and refreshes
+        bounds = (
+            "SELECT t.name, MIN(m.ts), MAX(m.ts) FROM {tables}{where}"
+            " GROUP BY m.topic_id"
+        )
+        state = self._run(
+            "gaps", filters, [(gaps, []), (bounds, [])], _merge_gaps
+        )
+        buckets = state.get("buckets", [0] * (len(GAP_BUCKETS) + 1))
+        count = sum(buckets)
+        return {
+            "count": count,
+            "min_us": state.get("min"),
+            "max_us": state.get("max"),
+            "mean_us": state["sum"] / count if count else None,
+            "buckets": list(zip(GAP_BUCKETS + (None,), buckets)),
+        }
+
+
+def _merge_topic_stats(state, results):
+    """Add (topic, count, bytes, first, last) rows"""
+    for topic, count, size, first, last in results[0]:
+        current = state.get(topic)
+        if current is None:
+            state[topic] = [count, size or 0, first, last]
+        else:
+            current[0] += count
+            current[1] += size or 0
+            current[2] = min(current[2], first)
+            current[3] = max(current[3], last)
+
+
+def _merge_histogram(state, results):
+    """Add (topic, bucket, count) rows"""
+    for topic, start, count in results[0]:
+        key = (topic, start)
+        state[key] = state.get(key, 0) + count
+
+
+def _merge_rollups(state, results):
+    """Add (topic, bucket, count, bytes, num_count, min, max, sum) rows"""
+    for topic, start, *row in results[0]:
+        current = state.get((start, topic))
+        if current is None:
+            state[(start, topic)] = row
+            continue
+        current[0] += row[0]
+        current[1] += row[1]
+        current[2] += row[2]
+        current[5] += row[5]
+        if row[3] is not None:
+            current[3] = row[3] if current[3] is None else min(current[3], row[3])
+            current[4] = row[4] if current[4] is None else max(current[4], row[4])
+
+
+def _merge_gaps(state, results):
+    """Add gap bucket rows and the gaps to the previous rows of each topic"""
+    gap_rows, bound_rows = results
+    if "buckets" not in state:
+        state.update(
+            buckets=[0] * (len(GAP_BUCKETS) + 1), sum=0, min=None, max=None, last={}
+        )
+
+    def add(bucket, count, total, low, high):
+        state["buckets"][bucket] += count
+        state["sum"] += total
+        state["min"] = low if state["min"] is None else min(state["min"], low)
+        state["max"] = high if state["max"] is None else max(state["max"], high)
+
+    for bucket, count, total, low, high in gap_rows:
+        add(bucket, count, total, low, high)
+    last = state["last"]
+    for topic, first, newest in bound_rows:
+        previous = last.get(topic)
+        if previous is not None and first >= previous:
+            gap = first - previous
+            add(bisect_right(GAP_BUCKETS, gap), 1, gap, gap, gap)
+        if previous is None or newest > previous:
+            last[topic] = newest
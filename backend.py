@@ -2,19 +2,71 @@ import paho.mqtt.client as mqtt
 import ssl
 import json
 import os
+import time
 from datetime import datetime
 from database import MQTTDatabase
+from last_values import LastValueCache
+from metrics import registry as metrics
+from payload_format import Payload
+from probe import ProbeMonitor
+from records import Direction, Message, topics
+from subscriptions import SubscriptionManager, validate_filter
+from timeseries import TimeSeriesStore
+from topic_tree import TopicTree
 
 
 class MQTTBackend:
-    def __init__(self, message_callback=None, status_callback=None):
-        """Initialize MQTT backend"""
+    # Every n-th received message is timed step by step for the metrics
+    TIMING_SAMPLE = 16
+
+    def __init__(
+        self,
+        message_callback=None,
+        status_callback=None,
+        database=None,
+        last_value_capacity=None,
+    ):
+        """Initialize MQTT backend, optionally with a configured database
+
+        *last_value_capacity* limits the number of topics whose last value
+        is kept in memory, older topics are then looked up in the database.
+        """
         self.client = None
-        self.database = MQTTDatabase()
+        self.database = database if database is not None else MQTTDatabase()
+        self.topic_tree = TopicTree()
         self.message_callback = message_callback
         self.status_callback = status_callback
-        self.subscribed_topics = set()
-        self.current_topic = None  # Track currently subscribed topic
+        self.subscriptions = SubscriptionManager()
+        self.probes = ProbeMonitor(self)
+        self.last_values = LastValueCache(last_value_capacity, store=self.database)
+        self.last_values.start()
+        # Numbers of the topics tracked for charting, see timeseries.py
+        self.timeseries = TimeSeriesStore()
+
+        # Receive path instrumentation, see metrics.py
+        self.received_messages = 0
+        self.received_bytes = 0
+        # Registered with the backend as owner, so the registry doesn't
+        # keep it alive; close() unregisters them
+        metrics.counter(
+            "messages_received", lambda backend: backend.received_messages, self
+        )
+        metrics.counter("bytes_received", lambda backend: backend.received_bytes, self)
+        metrics.counter(
+            "last_value_evictions",
+            lambda backend: backend.last_values.evictions,
+            self,
+        )
+        metrics.gauge(
+            "last_value_topics", lambda backend: len(backend.last_values), self
+        )
+        metrics.gauge(
+            "timeseries_series", lambda backend: len(backend.timeseries.series), self
+        )
+        self._on_message_timing = metrics.timing("on_message")
+        self._decode_timing = metrics.timing("decode")
+        self._save_timing = metrics.timing("save_message")
+        self._callback_timing = metrics.timing("message_callback")
 
         # Ensure storage folder exists
         os.makedirs("./Storage/", exist_ok=True)
@@ -63,61 +115,76 @@ class MQTTBackend:
             return True
         return False
 
-    def subscribe(self, topic):
+    def subscribe(self, topic, qos=0, handler=None):
         """Subscribe to a topic"""
+        return self.subscribe_many([(topic, qos)], handler)
+
+    def subscribe_many(self, filters, handler=None):
+        """Subscribe to several (topic, qos) filters with one SUBSCRIBE packet
+
+        Existing subscriptions are kept. *handler* is called as
+        handler(topic, payload, timestamp) for messages matching any of
+        the filters.
+        """
         if not self.client or not self.client.is_connected():
             if self.status_callback:
                 self.status_callback("error", "Not connected to broker")
             return False
 
-        self.client.subscribe(topic)
-        self.subscribed_topics.add(topic)
-        self.current_topic = topic  # Track current topic
+        filters = [(topic, int(qos)) for topic, qos in filters]
+        try:
+            for topic, qos in filters:
+                validate_filter(topic)
+        except ValueError as e:
+            if self.status_callback:
+                self.status_callback("error", str(e))
+            return False
+
+        result, _ = self.client.subscribe(filters)
+        if result != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        for topic, qos in filters:
+            self.subscriptions.add(topic, qos, handler)
         return True
 
     def unsubscribe(self, topic):
         """Unsubscribe from a topic"""
+        return self.unsubscribe_many([topic])
+
+    def unsubscribe_many(self, topics):
+        """Unsubscribe from several filters with one UNSUBSCRIBE packet"""
         if not self.client or not self.client.is_connected():
             if self.status_callback:
                 self.status_callback("error", "Not connected to broker")
             return False
 
-        # If no specific topic provided, unsubscribe from current topic
-        if not topic and self.current_topic:
-            topic = self.current_topic
-
-        if topic == "#":
-            # For wildcard topics, disconnect to properly unsubscribe
-            self.disconnect()
-            if self.status_callback:
-                self.status_callback(
-                    "disconnected", "Disconnected to unsubscribe from wildcard topic"
-                )
-            self.current_topic = None
-            return True
-
-        self.client.unsubscribe(topic)
-        self.subscribed_topics.discard(topic)
-
-        # Clear current topic if we unsubscribed from it
-        if topic == self.current_topic:
-            self.current_topic = None
-
+        topics = list(topics)
+        result, _ = self.client.unsubscribe(topics)
+        if result != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        for topic in topics:
+            self.subscriptions.remove(topic)
         return True
 
-    def publish(self, topic, message):
-        """Publish a message to a topic"""
+    def publish(self, topic, message, qos=0, retain=False, record=True):
+        """Publish a message to a topic
+
+        Returns the sent Message record, or False if not connected. With
+        *record* the record is saved to the database as "sent" and has the
+        id it is stored under.
+        """
         if not self.client or not self.client.is_connected():
             if self.status_callback:
                 self.status_callback("error", "Not connected to broker")
             return False
 
-        # Save published message to database
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.database.save_message(current_time, topic, message, "sent")
+        sent = Message.create(topic, message, direction=Direction.SENT)
+        if record:
+            self.database.save(sent)
 
-        self.client.publish(topic, message)
-        return True
+        self.client.publish(topic, message, qos=qos, retain=retain)
+        metrics.inc("messages_published")
+        return sent
 
     def is_connected(self):
         """Check if client is connected"""
@@ -126,6 +193,10 @@ class MQTTBackend:
     def _on_connect(self, client, userdata, flags, rc):
         """Handle connection callback"""
         if rc == 0:
+            # Clean sessions forget subscriptions, restore them in one packet
+            filters = self.subscriptions.filters()
+            if filters:
+                client.subscribe(filters)
             if self.status_callback:
                 self.status_callback("connected", "Connected successfully")
         else:
@@ -158,20 +229,49 @@ class MQTTBackend:
 
     def _on_message(self, client, userdata, msg):
         """Handle received messages"""
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            # Attempt to decode the payload as UTF-8
-            message = msg.payload.decode("utf-8")
-        except UnicodeDecodeError:
-            # Handle non-UTF-8 payloads
-            message = f"<Binary Data: {msg.payload.hex()}>"
-
-        # Save to database with direction as "received"
-        self.database.save_message(current_time, msg.topic, message, "received")
+        received_ns = time.perf_counter_ns()
+        self.received_messages += 1
+        self.received_bytes += len(msg.payload)
+        timed = not self.received_messages % self.TIMING_SAMPLE
+        # Our own latency probes are only accounted, not stored or shown
+        if self.probes.handle(msg.topic, msg.payload, received_ns):
+            return
+        # One record from here to the database and the UI: the bytes are
+        # kept as received and decoded by the writer thread for storage and
+        # by the UI only when displayed, the topic name is interned
+        record = Message(
+            None,
+            time.time_ns(),
+            topics.intern(msg.topic),
+            msg.payload,
+            Direction.RECEIVED,
+        )
+        topic = record.topic
+        # Epoch microseconds
+        current_time = record.timestamp
+        if timed:
+            self._decode_timing.record(time.perf_counter_ns() - received_ns)
+
+        # Update per-topic statistics and subscription counters
+        self.topic_tree.update(topic, msg.payload, current_time)
+        self.timeseries.update(topic, msg.payload, current_time)
+        self.subscriptions.dispatch(topic, msg.payload, current_time)
+
+        if timed:
+            save_ns = time.perf_counter_ns()
+        message_id = self.database.save(record)
+        self.last_values.update(topic, Payload(msg.payload), current_time, message_id)
+        if timed:
+            callback_ns = time.perf_counter_ns()
+            self._save_timing.record(callback_ns - save_ns)
 
         # Call message callback if provided
         if self.message_callback:
-            self.message_callback(msg.topic, message, current_time)
+            self.message_callback(record)
+        if timed:
+            done_ns = time.perf_counter_ns()
+            self._callback_timing.record(done_ns - callback_ns)
+            self._on_message_timing.record(done_ns - received_ns)
 
     def store_broker_to_file(self, broker, filename="brokers.txt"):
         """Store broker to file"""
@@ -305,11 +405,39 @@ class MQTTBackend:
         """Get database instance"""
         return self.database
 
+    def get_topic_tree(self):
+        """Get the tree of received topics and their statistics"""
+        return self.topic_tree
+
+    def get_metrics(self):
+        """Get a snapshot of counters, gauges and timings"""
+        return metrics.snapshot()
+
+    def get_last_value(self, topic):
+        """Get the last received value of *topic* as a LastValue, or None"""
+        return self.last_values.get(topic)
+
+    def get_last_values(self):
+        """Get the cache of last received values"""
+        return self.last_values
+
+    def get_timeseries(self):
+        """Get the store of numeric time series for charting"""
+        return self.timeseries
+
+    def get_probe_monitor(self):
+        """Get the latency probe monitor"""
+        return self.probes
+
     def close(self):
         """Close backend connections"""
+        metrics.unregister(self)
+        self.probes.stop()
         if self.client:
             self.client.loop_stop()
             self.client.disconnect()
+        # Written after the client stopped, so the snapshot is complete
+        self.last_values.close()
         if self.database:
             self.database.close()
 
@@ -317,10 +445,6 @@ class MQTTBackend:
         """Cleanup on exit"""
         self.close()
 
-    def get_current_topic(self):
-        """Get the currently subscribed topic"""
-        return self.current_topic
-
-    def clear_current_topic(self):
-        """Clear the current topic tracking"""
-        self.current_topic = None
+    def get_subscriptions(self):
+        """Get the subscription manager"""
+        return self.subscriptions
@@ -0,0 +1,6 @@
+"""Benchmarks for the ingest, storage and UI paths and retained memory
+
+Run from the project root:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare bench.json --output bench_new.json
+"""
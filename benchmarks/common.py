@@ -0,0 +1,102 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# Suffixes of result keys where a lower value is better. Rates end in
+# "_per_sec" and are better when higher.
+LOWER_IS_BETTER = (
+    "_us",
+    "_ms",
+    "_s",
+    "_bytes",
+    "_bytes_per_message",
+    "_bytes_per_row",
+    "dropped",
+)
+
+
+def timed(function, *args, **kwargs):
+    """Call *function*, returns (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def retained_memory(function, *args, **kwargs):
+    """Call *function* under tracemalloc, returns (result, retained, peak bytes)
+
+    The result is kept alive, so objects it references count as retained.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current - before, peak - before
+
+
+def environment():
+    """Describe the machine and code version the results were taken on"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(results, filepath):
+    """Write the results as JSON"""
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return filepath
+
+
+def _flatten(results, prefix=""):
+    """Flatten nested result dicts into {"a.b.c": number}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old, new, threshold=0.1):
+    """Compare two result dicts, returns (metric, old, new, change, regressed)
+
+    *change* is the relative difference. A metric regresses when it got
+    worse by more than *threshold*; see LOWER_IS_BETTER for the direction.
+    """
+    old_flat = _flatten(old.get("benchmarks", {}))
+    new_flat = _flatten(new.get("benchmarks", {}))
+    rows = []
+    for name in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[name], new_flat[name]
+        if not before:
+            continue
+        change = (after - before) / before
+        lower_is_better = name.endswith(LOWER_IS_BETTER)
+        worse = change if lower_is_better else -change
+        rows.append((name, before, after, change, worse > threshold))
+    return rows
@@ -0,0 +1,75 @@
+"""Ingest path: MQTTBackend._on_message with synthetic messages, no broker"""
+
+import os
+import tempfile
+from collections import deque
+import paho.mqtt.client as mqtt
+from backend import MQTTBackend
+from database import MQTTDatabase
+from benchmarks.common import retained_memory, timed
+
+
+def make_messages(count, payload_size=64, topics=100):
+    """Create *count* MQTTMessage objects spread over *topics* topics"""
+    payload = b"x" * payload_size
+    topic_names = [f"bench/device{i}/value".encode() for i in range(topics)]
+    messages = []
+    for i in range(count):
+        message = mqtt.MQTTMessage(mid=i, topic=topic_names[i % topics])
+        message.payload = payload
+        messages.append(message)
+    return messages
+
+
+def _deliver(backend, messages):
+    """Feed *messages* through the receive callback"""
+    on_message = backend._on_message
+    for message in messages:
+        on_message(None, None, message)
+
+
+def run(count=100000, payload_size=64, topics=100, profile="balanced"):
+    """Return messages/s through _on_message and the time to drain the writer"""
+    with tempfile.TemporaryDirectory() as directory:
+        database = MQTTDatabase(
+            os.path.join(directory, "ingest.db"), queue_size=count + 1, profile=profile
+        )
+        # Same work per message as the frontend's callback
+        ui_queue = deque()
+        backend = MQTTBackend(
+            message_callback=lambda record: ui_queue.append(("message", record)),
+            database=database,
+        )
+        try:
+            messages = make_messages(count, payload_size, topics)
+            _, elapsed = timed(_deliver, backend, messages)
+            _, flush_elapsed = timed(database.flush)
+            stats = database.get_writer_stats()
+
+            # Memory per message while queued (peak) and after the writer
+            # and UI queues were drained (retained, e.g. leaks)
+            sample = make_messages(min(count, 20000), payload_size, topics)
+            ui_queue.clear()
+
+            def deliver_and_drain():
+                _deliver(backend, sample)
+                database.flush()
+                ui_queue.clear()
+
+            _, retained, peak = retained_memory(deliver_and_drain)
+        finally:
+            backend.close()
+
+    return {
+        "messages": count,
+        "on_message_per_sec": count / elapsed,
+        "on_message_us": elapsed / count * 1e6,
+        "flush_s": flush_elapsed,
+        "end_to_end_per_sec": count / (elapsed + flush_elapsed),
+        "written": stats["written"],
+        "dropped": stats["dropped"],
+        "avg_batch_size": stats["avg_batch_size"],
+        "avg_flush_ms": stats["avg_flush_ms"],
+        "peak_bytes_per_message": peak / len(sample),
+        "retained_bytes_per_message": retained / len(sample),
+    }
@@ -0,0 +1,76 @@
+"""Memory of retained messages: Message records in a full MessageRingBuffer"""
+
+import time
+from collections import namedtuple
+from payload_format import Payload
+from records import Direction, Message, topics
+from ringbuffer import MessageRingBuffer
+from benchmarks.common import retained_memory, timed
+
+# Message representation before records.py, for comparison: a named tuple
+# with a topic string per message, a timestamp in microseconds and the
+# Payload wrapper around the bytes
+_TupleRecord = namedtuple(
+    "_TupleRecord", ["id", "timestamp", "topic", "payload", "direction"]
+)
+
+
+def _fill_records(count, payload_size, topic_count):
+    """Fill a buffer of *count* records the way the backend creates them
+
+    The payload bytes and the topic name are new objects for every
+    message, as they are when paho hands a message over.
+    """
+    buffer = MessageRingBuffer(count)
+    append = buffer.append
+    intern = topics.intern
+    now = time.time_ns()
+    for i in range(count):
+        topic = f"bench/device{i % topic_count}/value"
+        append(
+            Message(
+                i,
+                now + i * 1000,
+                intern(topic),
+                b"x" * payload_size,
+                Direction.RECEIVED,
+            )
+        )
+    return buffer
+
+
+def _fill_tuples(count, payload_size, topic_count):
+    """Fill a buffer of *count* messages in the previous representation"""
+    buffer = MessageRingBuffer(count)
+    append = buffer.append
+    now = time.time_ns() // 1000
+    for i in range(count):
+        topic = f"bench/device{i % topic_count}/value"
+        append(
+            _TupleRecord(
+                i, now + i, topic, Payload(b"x" * payload_size), "received"
+            )
+        )
+    return buffer
+
+
+def run(count=1000000, payload_size=64, topics=1000):
+    """Return the bytes retained per message in a full buffer of *count*"""
+    records, retained, _ = retained_memory(
+        _fill_records, count, payload_size, topics
+    )
+    del records
+    tuples, tuple_retained, _ = retained_memory(
+        _fill_tuples, count, payload_size, topics
+    )
+    del tuples
+    _, elapsed = timed(_fill_records, count, payload_size, topics)
+    return {
+        "messages": count,
+        "payload_size": payload_size,
+        "topics": topics,
+        "record_bytes_per_message": retained / count,
+        "tuple_bytes_per_message": tuple_retained / count,
+        "record_overhead_bytes_per_message": retained / count - payload_size,
+        "fill_per_sec": count / elapsed,
+    }
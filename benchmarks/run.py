@@ -0,0 +1,130 @@
+"""Run the benchmark suites and write the results as JSON
+
+Examples:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --suite storage --sizes 1e4,1e5,1e6,1e7
+    python -m benchmarks.run --compare bench.json --output bench_new.json
+"""
+
+import argparse
+import json
+import sys
+from benchmarks import common
+
+SUITES = ("ingest", "storage", "ui", "memory")
+
+
+def _sizes(value):
+    """Parse a comma separated list like 1e4,1e5"""
+    return [int(float(size)) for size in value.split(",") if size]
+
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=SUITES,
+        help="suite to run (repeatable, default: all)",
+    )
+    parser.add_argument(
+        "--messages", type=int, default=100000, help="messages for ingest and ui"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=_sizes,
+        default=[10000, 100000],
+        help="database sizes in rows for storage, e.g. 1e4,1e5,1e6,1e7",
+    )
+    parser.add_argument(
+        "--retained",
+        type=lambda value: int(float(value)),
+        default=1000000,
+        help="messages in the buffer for memory, e.g. 1e6",
+    )
+    parser.add_argument("--payload-size", type=int, default=64, help="bytes")
+    parser.add_argument("--profile", default="balanced", help="storage profile")
+    parser.add_argument(
+        "--blob-payloads",
+        action="store_true",
+        help="store payloads deduplicated and compressed in storage",
+    )
+    parser.add_argument("--output", default="bench_results.json", help="JSON file")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change reported as regression (default: 0.1)",
+    )
+    return parser
+
+
+def main(argv=None):
+    """Run the selected suites, returns 1 if a regression was found"""
+    args = build_parser().parse_args(argv)
+    suites = args.suite or SUITES
+    results = {
+        "environment": common.environment(),
+        "config": {
+            "suites": list(suites),
+            "messages": args.messages,
+            "sizes": args.sizes,
+            "retained": args.retained,
+            "payload_size": args.payload_size,
+            "profile": args.profile,
+            "blob_payloads": args.blob_payloads,
+        },
+        "benchmarks": {},
+    }
+
+    for suite in suites:
+        print(f"Running {suite} ...", flush=True)
+        if suite == "ingest":
+            from benchmarks import ingest
+
+            result = ingest.run(
+                args.messages, args.payload_size, profile=args.profile
+            )
+        elif suite == "storage":
+            from benchmarks import storage
+
+            result = storage.run(
+                args.sizes,
+                args.payload_size,
+                profile=args.profile,
+                blob_payloads=args.blob_payloads,
+            )
+        elif suite == "memory":
+            from benchmarks import memory
+
+            result = memory.run(args.retained, args.payload_size)
+        else:
+            from benchmarks import ui
+
+            result = ui.run(args.messages, payload_size=args.payload_size)
+        results["benchmarks"][suite] = result
+        print(json.dumps(result, indent=2), flush=True)
+
+    print(f"Results written to {common.write_results(results, args.output)}")
+
+    if not args.compare:
+        return 0
+    with open(args.compare, encoding="utf-8") as f:
+        previous = json.load(f)
+    regressions = 0
+    for name, before, after, change, regressed in common.compare(
+        previous, results, args.threshold
+    ):
+        marker = "REGRESSION" if regressed else ""
+        print(f"{name:50} {before:14.3f} {after:14.3f} {change:+8.1%} {marker}")
+        regressions += regressed
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
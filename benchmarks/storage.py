@@ -0,0 +1,85 @@
+"""Storage path: save_message, get_recent_messages and export_to_json"""
+
+import os
+import tempfile
+import time
+from database import MQTTDatabase
+from benchmarks.common import timed
+
+# Number of get_recent_messages() calls averaged per size
+QUERY_REPEAT = 20
+
+
+def _fill(database, rows, payload, topics):
+    """Save *rows* messages with increasing timestamps
+
+    When the writer queue is full the batch is flushed and the message
+    retried, so the result is the sustained rate without drops.
+    """
+    save = database.save_message
+    start = time.time_ns() // 1000
+    for i in range(rows):
+        topic = f"bench/device{i % topics}/value"
+        while save(start + i, topic, payload, "received") is None:
+            database.flush()
+    database.flush()
+
+
+def run_size(
+    rows,
+    payload_size=64,
+    topics=100,
+    profile="balanced",
+    export=True,
+    blob_payloads=False,
+):
+    """Benchmark one database of *rows* messages"""
+    payload = "x" * payload_size
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "storage.db")
+        database = MQTTDatabase(path, profile=profile, blob_payloads=blob_payloads)
+        try:
+            _, fill_elapsed = timed(_fill, database, rows, payload, topics)
+
+            _, recent_elapsed = timed(
+                lambda: [database.get_recent_messages(100) for _ in range(QUERY_REPEAT)]
+            )
+            _, count_elapsed = timed(database.get_message_count)
+
+            result = {
+                "save_per_sec": rows / fill_elapsed,
+                "recent_100_ms": recent_elapsed / QUERY_REPEAT * 1000,
+                "count_ms": count_elapsed * 1000,
+            }
+            if export:
+                export_path = os.path.join(directory, "export.json")
+                _, export_elapsed = timed(database.export_to_json, export_path)
+                result["export_per_sec"] = rows / export_elapsed
+                result["export_file_bytes_per_row"] = (
+                    os.path.getsize(export_path) / rows
+                )
+        finally:
+            database.close()
+
+        size = os.path.getsize(path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                size += os.path.getsize(path + suffix)
+        result["db_file_bytes_per_row"] = size / rows
+    return result
+
+
+def run(
+    sizes=(10000, 100000),
+    payload_size=64,
+    topics=100,
+    profile="balanced",
+    blob_payloads=False,
+):
+    """Benchmark databases of every size in *sizes*"""
+    return {
+        f"rows_{rows}": run_size(
+            rows, payload_size, topics, profile, blob_payloads=blob_payloads
+        )
+        for rows in sizes
+    }
@@ -0,0 +1,149 @@
+"""UI path: MQTTFrontend._drain_ui_queue into the message log
+
+Uses a real Tk text widget when a display is available (e.g. under
+xvfb-run) and a stub widget with the same interface otherwise.
+"""
+
+import time
+from collections import deque
+from frontend import MQTTFrontend
+from metrics import registry as metrics
+from records import Direction, Message, topics
+from ringbuffer import MessageRingBuffer
+from benchmarks.common import retained_memory
+
+
+class _StubText:
+    """Minimal stand-in for the ScrolledText widget, keeps lines in a list"""
+
+    def __init__(self):
+        self.lines = []
+
+    def insert(self, index, text):
+        lines = text.split("\n")[:-1]
+        if index == "1.0":
+            self.lines[:0] = lines
+        else:
+            self.lines.extend(lines)
+
+    def delete(self, start, end=None):
+        if end is None or end == "end":
+            del self.lines[:]
+        else:
+            del self.lines[: int(end.split(".")[0]) - 1]
+
+    def see(self, index):
+        pass
+
+    def yview(self, *args):
+        return (0.0, 1.0)
+
+
+class _StubWidget:
+    """Accepts config() calls of labels and buttons"""
+
+    def config(self, **kwargs):
+        pass
+
+
+class _StubBackend:
+    """Backend without connection or database"""
+
+    def close(self):
+        pass
+
+
+class _StubRoot:
+    """Root window whose after() doesn't schedule anything"""
+
+    def after(self, delay, callback):
+        return None
+
+
+def _create_frontend():
+    """Create an MQTTFrontend with only the state needed by the log path
+
+    Returns (frontend, tk_root or None).
+    """
+    frontend = MQTTFrontend.__new__(MQTTFrontend)
+    root = None
+    try:
+        import tkinter as tk
+
+        root = tk.Tk()
+        root.withdraw()
+        frontend.messages = tk.Text(root)
+    except Exception:
+        frontend.messages = _StubText()
+
+    frontend.root = _StubRoot()
+    frontend.backend = _StubBackend()
+    frontend.ui_stats_label = _StubWidget()
+    frontend.autoscroll_enabled = True
+    frontend.ui_queue = deque()
+    frontend._ui_after_id = None
+    frontend._ui_stats_started = time.monotonic()
+    frontend._ui_stats_ticks = 0
+    frontend._ui_stats_lines = 0
+    frontend._ui_drain_timing = metrics.timing("ui_drain")
+    frontend.message_buffer = MessageRingBuffer(MQTTFrontend.MESSAGE_BUFFER_CAPACITY)
+    frontend._line_ids = deque()
+    frontend._history_exhausted = False
+    frontend._history_loading = False
+    frontend._refresh_subscription_list = lambda: None
+    return frontend, root
+
+
+def _records(count, payload_size, start_id=0):
+    """Create *count* message records"""
+    payload = b"x" * payload_size
+    now = time.time_ns()
+    return [
+        Message(
+            start_id + i,
+            now + i * 1000,
+            topics.intern(f"bench/device{i % 100}/value"),
+            payload,
+            Direction.RECEIVED,
+        )
+        for i in range(count)
+    ]
+
+
+def run(count=200000, per_tick=500, payload_size=64):
+    """Time draining *count* messages, *per_tick* messages per UI tick"""
+    frontend, root = _create_frontend()
+    try:
+        records = _records(count, payload_size)
+        tick_times = []
+        for offset in range(0, count, per_tick):
+            frontend.ui_queue.extend(
+                ("message", record) for record in records[offset : offset + per_tick]
+            )
+            start = time.perf_counter()
+            frontend._drain_ui_queue()
+            if root is not None:
+                root.update_idletasks()
+            tick_times.append(time.perf_counter() - start)
+
+        # Memory of the message buffer once it is full
+        frontend.message_buffer.clear()
+        capacity = frontend.message_buffer.capacity
+        _, retained, _ = retained_memory(
+            lambda: frontend.message_buffer.extend(_records(capacity, payload_size))
+        )
+    finally:
+        if root is not None:
+            root.destroy()
+
+    total = sum(tick_times)
+    tick_times.sort()
+    return {
+        "widget": "stub" if root is None else "tk",
+        "messages": count,
+        "per_tick": per_tick,
+        "lines_per_sec": count / total,
+        "tick_p50_ms": tick_times[len(tick_times) // 2] * 1000,
+        "tick_max_ms": tick_times[-1] * 1000,
+        "buffer_bytes_per_message": retained / capacity,
+    }
@@ -0,0 +1,218 @@
+import time
+import tkinter as tk
+from tkinter import ttk
+from timeseries import downsample
+
+
+class ChartViewer:
+    """Window with live line charts of the numeric fields of topics
+
+    Samples come from a TimeSeriesStore, which only extracts numbers for
+    the tracked topic filters. The canvas is redrawn at a fixed frame rate
+    and only if new samples arrived, every series is downsampled to about
+    one point per pixel column and drawn by reusing its line item, so a
+    1 kHz topic costs the UI the same as a slow one.
+    """
+
+    # Redraw interval (10 frames per second)
+    FRAME_MS = 100
+    # Interval of the series list refresh
+    LIST_REFRESH_MS = 1000
+    # Series shown at the same time
+    MAX_LINES = 6
+    COLORS = ("#1f77b4", "#d62728", "#2ca02c", "#ff7f0e", "#9467bd", "#8c564b")
+    # Selectable time spans in seconds
+    SPANS = ("10", "60", "300", "900", "3600")
+    # Space for the axis labels
+    MARGIN_LEFT = 70
+    MARGIN = 20
+
+    def __init__(self, root, store):
+        """Create the window for the TimeSeriesStore *store*"""
+        self.store = store
+        self._after_id = None
+        self._list_after_id = None
+        self._keys = []
+        self._lines = []
+        self._drawn = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Charts")
+        self.window.geometry("950x500")
+        self.window.columnconfigure(1, weight=1)
+        self.window.rowconfigure(1, weight=1)
+
+        self._create_controls()
+        self._create_series_list()
+        self._create_canvas()
+
+        self.window.bind("<Destroy>", self._on_destroy)
+        self._refresh_list()
+        self._draw()
+
+    def _create_controls(self):
+        """Create the filter entry, the time span selection and the status"""
+        control_frame = ttk.Frame(self.window)
+        control_frame.grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+        control_frame.columnconfigure(5, weight=1)
+
+        ttk.Label(control_frame, text="Track topics:").grid(
+            row=0, column=0, padx=5, pady=5
+        )
+        self.filter_entry = ttk.Entry(control_frame, width=30)
+        self.filter_entry.grid(row=0, column=1, padx=5, pady=5)
+        self.filter_entry.bind("<Return>", lambda e: self._track())
+        ttk.Button(control_frame, text="Track", command=self._track).grid(
+            row=0, column=2, padx=5, pady=5
+        )
+
+        ttk.Label(control_frame, text="Last seconds:").grid(
+            row=0, column=3, padx=5, pady=5
+        )
+        self.span_combo = ttk.Combobox(
+            control_frame, values=self.SPANS, width=6, state="readonly"
+        )
+        self.span_combo.set(self.SPANS[1])
+        self.span_combo.grid(row=0, column=4, padx=5, pady=5)
+        self.span_combo.bind("<<ComboboxSelected>>", lambda e: self._invalidate())
+
+        self.status_label = ttk.Label(control_frame, text="")
+        self.status_label.grid(row=0, column=5, padx=5, pady=5, sticky="e")
+
+    def _create_series_list(self):
+        """Create the list of series to select from"""
+        self.series_list = tk.Listbox(
+            self.window, selectmode="extended", exportselection=False, width=35
+        )
+        self.series_list.grid(row=1, column=0, padx=5, pady=5, sticky="ns")
+        self.series_list.bind("<<ListboxSelect>>", lambda e: self._invalidate())
+
+    def _create_canvas(self):
+        """Create the chart canvas with its reusable items"""
+        self.canvas = tk.Canvas(self.window, background="white")
+        self.canvas.grid(row=1, column=1, padx=5, pady=5, sticky="nsew")
+        self.canvas.bind("<Configure>", lambda e: self._invalidate())
+        self._frame_item = self.canvas.create_rectangle(0, 0, 0, 0, outline="#999")
+        self._max_item = self.canvas.create_text(0, 0, anchor="ne", text="")
+        self._min_item = self.canvas.create_text(0, 0, anchor="se", text="")
+        self._span_item = self.canvas.create_text(0, 0, anchor="nw", text="")
+        # One line and one legend entry per selectable series
+        for color in self.COLORS[: self.MAX_LINES]:
+            line = self.canvas.create_line(0, 0, 0, 0, fill=color, state="hidden")
+            legend = self.canvas.create_text(0, 0, anchor="ne", fill=color, text="")
+            self._lines.append((line, legend))
+
+    def _track(self):
+        """Start extracting numbers for the entered topic filter"""
+        topic_filter = self.filter_entry.get().strip()
+        if not topic_filter:
+            return
+        try:
+            self.store.track(topic_filter)
+        except ValueError as e:
+            self.status_label.config(text=str(e))
+            return
+        self.filter_entry.delete(0, tk.END)
+        self._refresh_list(False)
+
+    def _refresh_list(self, reschedule=True):
+        """Show new series in the list, keeping the selection"""
+        keys = self.store.keys()
+        if keys != self._keys:
+            selected = set(self._selected_keys())
+            self._keys = keys
+            self.series_list.delete(0, tk.END)
+            for index, (topic, field) in enumerate(keys):
+                self.series_list.insert(tk.END, f"{topic} {field}".rstrip())
+                if (topic, field) in selected:
+                    self.series_list.selection_set(index)
+            if not selected and keys:
+                self.series_list.selection_set(0)
+            self._invalidate()
+        filters = ", ".join(self.store.filters()) or "nothing"
+        self.status_label.config(text=f"Tracking {filters}, {len(keys)} series")
+        if reschedule:
+            self._list_after_id = self.window.after(
+                self.LIST_REFRESH_MS, self._refresh_list
+            )
+
+    def _selected_keys(self):
+        """(topic, field) keys of the selected series, at most MAX_LINES"""
+        indexes = self.series_list.curselection()[: self.MAX_LINES]
+        return [self._keys[i] for i in indexes if i < len(self._keys)]
+
+    def _invalidate(self):
+        """Redraw on the next frame even without new samples"""
+        self._drawn = None
+
+    def _draw(self):
+        """Redraw the selected series if anything changed, then reschedule"""
+        self._after_id = self.window.after(self.FRAME_MS, self._draw)
+        keys = self._selected_keys()
+        series = [(key, self.store.get(*key)) for key in keys]
+        series = [(key, s) for key, s in series if s is not None]
+        # Once a second the time axis moves on even without new samples
+        state = [int(time.time())] + [(key, s.total) for key, s in series]
+        if state == self._drawn:
+            return
+        self._drawn = state
+
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        left, top = self.MARGIN_LEFT, self.MARGIN
+        right, bottom = width - self.MARGIN, height - self.MARGIN
+        if right - left < 10 or bottom - top < 10:
+            return
+
+        span = float(self.span_combo.get())
+        end = time.time()
+        start = end - span
+        points = []
+        for _, s in series:
+            times, values = s.window(start)
+            points.append(downsample(times, values, right - left))
+
+        low = min((min(ys) for _, ys in points if ys), default=0.0)
+        high = max((max(ys) for _, ys in points if ys), default=1.0)
+        if high == low:
+            high, low = high + 1, low - 1
+        x_scale = (right - left) / span
+        y_scale = (bottom - top) / (high - low)
+
+        for index, (line, legend) in enumerate(self._lines):
+            if index >= len(points):
+                self.canvas.itemconfigure(line, state="hidden")
+                self.canvas.itemconfigure(legend, text="")
+                continue
+            (topic, field), _ = series[index]
+            xs, ys = points[index]
+            self.canvas.coords(legend, right - 5, top + 5 + index * 15)
+            self.canvas.itemconfigure(
+                legend, text=f"{topic} {field}".rstrip() + f"  ({len(xs)} points)"
+            )
+            if len(xs) < 2:
+                self.canvas.itemconfigure(line, state="hidden")
+                continue
+            coords = []
+            for x, y in zip(xs, ys):
+                coords.append(left + (x - start) * x_scale)
+                coords.append(bottom - (y - low) * y_scale)
+            self.canvas.coords(line, coords)
+            self.canvas.itemconfigure(line, state="normal")
+
+        self.canvas.coords(self._frame_item, left, top, right, bottom)
+        self.canvas.coords(self._max_item, left - 5, top)
+        self.canvas.itemconfigure(self._max_item, text=f"{high:.6g}")
+        self.canvas.coords(self._min_item, left - 5, bottom)
+        self.canvas.itemconfigure(self._min_item, text=f"{low:.6g}")
+        self.canvas.coords(self._span_item, left, bottom + 3)
+        self.canvas.itemconfigure(self._span_item, text=f"last {span:.0f} s")
+
+    def _on_destroy(self, event):
+        """Stop redrawing once the window is closed"""
+        if event.widget is not self.window:
+            return
+        for after_id in (self._after_id, self._list_after_id):
+            if after_id is not None:
+                self.window.after_cancel(after_id)
+        self._after_id = self._list_after_id = None
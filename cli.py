@@ -0,0 +1,559 @@
+"""Command line entry points that run without the Tkinter GUI
+
+Usage:
+    python -m cli record --broker localhost --port 1883 --topic "#"
+    python -m cli record --topic "sensors/#" --max-age 7d --max-size 2G
+    python -m cli replay --broker localhost --db mqtt_messages.db --speed 10
+    python -m cli bench --local-broker --publishers 4 --qos 1 --duration 10
+"""
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Reference point for the startup time reported by the commands
+_START = time.perf_counter()
+
+log = logging.getLogger("mqtt_explorer")
+
+
+def _parse_topic(value):
+    """Parse TOPIC or TOPIC@QOS"""
+    topic, _, qos = value.rpartition("@")
+    if topic and qos in ("0", "1", "2"):
+        return topic, int(qos)
+    return value, None
+
+
+def _install_signal_handlers(stop_event):
+    """Set *stop_event* on SIGINT and SIGTERM"""
+
+    def handle(signum, frame):
+        log.info("Received %s, shutting down", signal.Signals(signum).name)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, handle)
+
+
+def _parse_remap(value):
+    """Parse OLD=NEW into an (old_prefix, new_prefix) pair"""
+    old, sep, new = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected OLD=NEW, got {value!r}")
+    return old, new
+
+
+# Suffixes accepted by --max-age and --max-size
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_SIZE_UNITS = {"k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def _parse_duration(value):
+    """Parse seconds, optionally with an s, m, h or d suffix, e.g. 7d"""
+    unit = _DURATION_UNITS.get(value[-1:].lower())
+    try:
+        return float(value[:-1]) * unit if unit else float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value!r}")
+
+
+def _parse_size(value):
+    """Parse bytes, optionally with a K, M or G suffix, e.g. 500M"""
+    unit = _SIZE_UNITS.get(value[-1:].lower())
+    try:
+        return int(float(value[:-1]) * unit) if unit else int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}")
+
+
+def _parse_topic_limit(value):
+    """Parse FILTER=ROWS"""
+    topic_filter, sep, rows = value.rpartition("=")
+    if not sep or not topic_filter or not rows.isdigit():
+        raise argparse.ArgumentTypeError(f"expected FILTER=ROWS, got {value!r}")
+    return topic_filter, int(rows)
+
+
+def _open_database(args, **kwargs):
+    """Open the database of *args*, partitioned if --partition was given"""
+    if args.partition:
+        from partitions import PartitionedDatabase
+
+        return PartitionedDatabase(args.db, partition=args.partition, **kwargs)
+    from database import MQTTDatabase
+
+    return MQTTDatabase(args.db, **kwargs)
+
+
+def _wait_connected(backend, timeout, stop_event):
+    """Wait until the backend is connected, returns False on timeout"""
+    deadline = time.monotonic() + timeout
+    while not backend.is_connected():
+        if time.monotonic() >= deadline or stop_event.wait(0.05):
+            return False
+    return True
+
+
+def record(args):
+    """Record all messages of the given topics into the database"""
+    from backend import MQTTBackend
+
+    stop_event = threading.Event()
+    _install_signal_handlers(stop_event)
+
+    # Counted on the MQTT thread; int increments are atomic enough for stats
+    received = [0]
+
+    def on_message(record):
+        received[0] += 1
+
+    def on_status(status, message):
+        if status == "error":
+            log.error(message)
+        else:
+            log.info(message)
+
+    retention = {
+        "max_age": args.max_age,
+        "max_rows": args.max_rows,
+        "max_size": args.max_size,
+        "max_rows_per_topic": args.max_rows_per_topic,
+        "topic_limits": dict(args.topic_limit or []),
+    }
+    database = _open_database(
+        args,
+        batch_size=args.batch_size,
+        max_latency=args.max_latency,
+        queue_size=args.queue_size,
+        profile=args.profile,
+        retention=retention if any(retention.values()) else None,
+        retention_interval=args.retention_interval,
+        blob_payloads=args.blob_payloads,
+        compress_threshold=args.compress_threshold,
+    )
+    backend = MQTTBackend(
+        message_callback=on_message, status_callback=on_status, database=database
+    )
+
+    # Registered filters are subscribed by the backend on every (re)connect
+    for value in args.topic or ["#"]:
+        topic, qos = _parse_topic(value)
+        backend.get_subscriptions().add(topic, args.qos if qos is None else qos)
+
+    log.info(
+        "Started in %.0f ms, recording %s from %s:%d into %s",
+        (time.perf_counter() - _START) * 1000,
+        ", ".join(topic for topic, _ in backend.get_subscriptions().filters()),
+        args.broker,
+        args.port,
+        args.db,
+    )
+    if not backend.connect(args.broker, args.port):
+        backend.close()
+        return 1
+
+    server = None
+    if args.metrics_port is not None:
+        from metrics import MetricsServer
+
+        server = MetricsServer(args.metrics_port).start()
+        log.info("Metrics on http://%s:%d/metrics", server.host, server.port)
+
+    deadline = time.monotonic() + args.duration if args.duration else None
+    last_time = time.monotonic()
+    last_count = 0
+    try:
+        while not stop_event.is_set():
+            timeout = args.stats_interval
+            if deadline is not None:
+                timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+            if stop_event.wait(timeout):
+                break
+
+            now = time.monotonic()
+            count = received[0]
+            stats = database.get_writer_stats()
+            log.info(
+                "%.0f msg/s, %d received, %d written, queue %d/%d, "
+                "%d dropped, flush avg %.2f ms max %.2f ms",
+                (count - last_count) / (now - last_time),
+                count,
+                stats["written"],
+                stats["queue_depth"],
+                stats["queue_capacity"],
+                stats["dropped"],
+                stats["avg_flush_ms"],
+                stats["max_flush_ms"],
+            )
+            retention = database.get_retention_stats()
+            if retention and retention["runs"]:
+                log.info(
+                    "Retention: %d deleted, %.1f MB reclaimed in %d runs",
+                    retention["deleted"],
+                    retention["reclaimed_bytes"] / 1e6,
+                    retention["runs"],
+                )
+            last_time, last_count = now, count
+            if deadline is not None and now >= deadline:
+                break
+    finally:
+        if server is not None:
+            server.stop()
+        # Stops the network loop, then drains the writer queue
+        backend.close()
+        stats = database.get_writer_stats()
+        log.info(
+            "Stopped: %d received, %d written, %d dropped",
+            received[0],
+            stats["written"],
+            stats["dropped"],
+        )
+        if args.blob_payloads:
+            payloads = database.get_payload_stats()
+            if payloads["savings_ratio"] is not None:
+                log.info(
+                    "Payloads: %.1f MB stored as %.1f MB (%.1fx)",
+                    payloads["payload_bytes"] / 1e6,
+                    payloads["stored_bytes"] / 1e6,
+                    payloads["savings_ratio"],
+                )
+    return 0
+
+
+def replay(args):
+    """Republish recorded messages from the database or an export file"""
+    from backend import MQTTBackend
+    from replay import MessageReplayer, database_rows, export_file_rows
+
+    stop_event = threading.Event()
+    _install_signal_handlers(stop_event)
+
+    def on_status(status, message):
+        if status == "error":
+            log.error(message)
+        else:
+            log.info(message)
+
+    database = _open_database(args, profile=args.profile)
+    backend = MQTTBackend(status_callback=on_status, database=database)
+    if args.file:
+        rows = export_file_rows(args.file, args.direction)
+        source = args.file
+    else:
+        filters = {"direction": args.direction, "topic_prefix": args.topic_prefix}
+        rows = database_rows(database, filters)
+        source = args.db
+
+    replayer = MessageReplayer(
+        backend,
+        speed=None if args.max_speed else args.speed,
+        rate_limit=args.rate,
+        topic_map=args.remap,
+        qos=args.qos,
+        retain=args.retain,
+        record=args.record,
+    )
+
+    try:
+        if not backend.connect(args.broker, args.port):
+            return 1
+        if not _wait_connected(backend, args.connect_timeout, stop_event):
+            log.error("Not connected to %s:%d", args.broker, args.port)
+            return 1
+
+        log.info(
+            "Replaying %s to %s:%d at %s",
+            source,
+            args.broker,
+            args.port,
+            "maximum speed" if replayer.speed is None else f"x{replayer.speed:g}",
+        )
+        thread = replayer.replay_async(rows, stop_event=stop_event)
+        while thread.is_alive():
+            thread.join(args.stats_interval)
+            stats = replayer.get_stats()
+            log.info(
+                "%d published, %.0f msg/s, lag %.1f ms (avg %.1f ms, max %.1f ms)",
+                stats["published"],
+                stats["rate"],
+                stats["lag_ms"],
+                stats["avg_lag_ms"],
+                stats["max_lag_ms"],
+            )
+
+        stats = replayer.get_stats()
+        if stats["error"]:
+            log.error("Replay failed: %s", stats["error"])
+            return 1
+        log.info(
+            "Finished: %d published in %.2f s, %.0f msg/s",
+            stats["published"],
+            stats["elapsed_s"],
+            stats["rate"],
+        )
+        return 0
+    finally:
+        backend.close()
+
+
+def bench(args):
+    """Run the publish benchmark and write the results as JSON"""
+    from loadgen import LoadGenerator, write_results
+
+    broker = None
+    host, port = args.broker, args.port
+    if args.local_broker:
+        from local_broker import LocalBroker
+
+        broker = LocalBroker()
+        host, port = broker.start()
+        log.info("Started local broker on %s:%d", host, port)
+
+    generator = LoadGenerator(
+        host,
+        port,
+        publishers=args.publishers,
+        payload_size=args.payload_size,
+        qos=args.qos,
+        rate=args.rate,
+        topic_template=args.topic,
+        topics=args.topics,
+        max_inflight=args.max_inflight,
+    )
+    stop_event = threading.Event()
+    _install_signal_handlers(stop_event)
+    outcome = {}
+
+    def run():
+        try:
+            outcome["results"] = generator.run(args.duration, args.count)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, name="mqtt-bench", daemon=True)
+    try:
+        thread.start()
+        last_time = time.monotonic()
+        last_count = 0
+        while thread.is_alive():
+            thread.join(args.stats_interval)
+            if stop_event.is_set():
+                generator.stop()
+            now = time.monotonic()
+            progress = generator.get_progress()
+            log.info(
+                "%d published, %d acked, %.0f msg/s",
+                progress["published"],
+                progress["acked"],
+                (progress["published"] - last_count) / (now - last_time),
+            )
+            last_time, last_count = now, progress["published"]
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    if "error" in outcome:
+        log.error("Benchmark failed: %s", outcome["error"])
+        return 1
+    results = outcome["results"]
+    latency = results["latency_ms"]
+    log.info(
+        "%d published (%.0f msg/s), %d acked, %d unacked; latency ms "
+        "p50 %.3f p95 %.3f p99 %.3f max %.3f",
+        results["published"],
+        results["publish_rate"],
+        results["acked"],
+        results["unacked"],
+        latency.get("p50", 0.0),
+        latency.get("p95", 0.0),
+        latency.get("p99", 0.0),
+        latency.get("max", 0.0),
+    )
+    output = args.output or (
+        f"./Storage/bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    log.info("Results written to %s", write_results(results, output))
+    return 0
+
+
+def build_parser():
+    """Create the argument parser with all subcommands"""
+    parser = argparse.ArgumentParser(
+        prog="python -m cli", description="MQTT Explorer without GUI"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="enable debug logging"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="record messages into the database")
+    rec.add_argument("--broker", default="localhost", help="broker host name")
+    rec.add_argument("--port", type=int, default=1883, help="broker port")
+    rec.add_argument(
+        "--topic",
+        action="append",
+        help="topic filter to record, optionally as TOPIC@QOS (repeatable, "
+        "default: #)",
+    )
+    rec.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    rec.add_argument("--db", default="mqtt_messages.db", help="database file")
+    rec.add_argument(
+        "--partition",
+        choices=("hour", "day"),
+        help="store messages in one file per hour or day next to --db",
+    )
+    rec.add_argument(
+        "--profile",
+        default="balanced",
+        help="storage profile: safe, balanced or fast",
+    )
+    rec.add_argument("--batch-size", type=int, default=500)
+    rec.add_argument("--max-latency", type=float, default=0.05, help="seconds")
+    rec.add_argument("--queue-size", type=int, default=100000)
+    rec.add_argument(
+        "--stats-interval", type=float, default=10.0, help="seconds between logs"
+    )
+    rec.add_argument(
+        "--duration", type=float, default=None, help="stop after this many seconds"
+    )
+    rec.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus text metrics on this localhost port",
+    )
+    rec.add_argument(
+        "--max-age",
+        type=_parse_duration,
+        help="delete messages older than this, e.g. 3600, 90m, 12h or 7d",
+    )
+    rec.add_argument("--max-rows", type=int, help="keep at most this many messages")
+    rec.add_argument(
+        "--max-size",
+        type=_parse_size,
+        help="keep the used database size below this, e.g. 500M or 2G",
+    )
+    rec.add_argument(
+        "--max-rows-per-topic", type=int, help="keep at most this many per topic"
+    )
+    rec.add_argument(
+        "--topic-limit",
+        action="append",
+        type=_parse_topic_limit,
+        help="row limit for topics matching a filter, as FILTER=ROWS (repeatable)",
+    )
+    rec.add_argument(
+        "--retention-interval",
+        type=float,
+        default=60.0,
+        help="seconds between retention checks",
+    )
+    rec.add_argument(
+        "--blob-payloads",
+        action="store_true",
+        help="store payloads deduplicated and compressed",
+    )
+    rec.add_argument(
+        "--compress-threshold",
+        type=int,
+        default=64,
+        help="compress BLOB payloads of at least this many bytes",
+    )
+    rec.set_defaults(func=record)
+
+    rep = commands.add_parser("replay", help="republish recorded messages")
+    rep.add_argument("--broker", default="localhost", help="broker host name")
+    rep.add_argument("--port", type=int, default=1883, help="broker port")
+    rep.add_argument("--db", default="mqtt_messages.db", help="database file")
+    rep.add_argument(
+        "--partition",
+        choices=("hour", "day"),
+        help="read a database recorded with --partition",
+    )
+    rep.add_argument(
+        "--file", help="replay an export file (json, ndjson, csv, .gz, .xz)"
+    )
+    rep.add_argument("--profile", default="balanced", help="storage profile")
+    rep.add_argument(
+        "--topic-prefix", help="only replay topics starting with this prefix"
+    )
+    rep.add_argument(
+        "--direction",
+        default="received",
+        help="only replay messages of this direction (default: received)",
+    )
+    speed = rep.add_mutually_exclusive_group()
+    speed.add_argument(
+        "--speed", type=float, default=1.0, help="multiplier of the original timing"
+    )
+    speed.add_argument(
+        "--max-speed", action="store_true", help="ignore timing, send at once"
+    )
+    rep.add_argument("--rate", type=float, help="maximum messages per second")
+    rep.add_argument(
+        "--remap",
+        type=_parse_remap,
+        action="append",
+        help="replace a topic prefix, as OLD=NEW (repeatable)",
+    )
+    rep.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    rep.add_argument("--retain", action="store_true")
+    rep.add_argument(
+        "--record", action="store_true", help="save replayed messages as sent"
+    )
+    rep.add_argument("--connect-timeout", type=float, default=10.0, help="seconds")
+    rep.add_argument(
+        "--stats-interval", type=float, default=5.0, help="seconds between logs"
+    )
+    rep.set_defaults(func=replay)
+
+    ben = commands.add_parser("bench", help="measure publish throughput and latency")
+    ben.add_argument("--broker", default="localhost", help="broker host name")
+    ben.add_argument("--port", type=int, default=1883, help="broker port")
+    ben.add_argument(
+        "--local-broker",
+        action="store_true",
+        help="run against an in-process broker instead of --broker",
+    )
+    ben.add_argument("--publishers", type=int, default=1, help="connections")
+    ben.add_argument("--payload-size", type=int, default=64, help="bytes")
+    ben.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    ben.add_argument(
+        "--rate", type=float, help="total messages per second (default: unlimited)"
+    )
+    ben.add_argument(
+        "--topic",
+        default="bench/{publisher}/{topic}",
+        help="topic template with {publisher}, {seq} and {topic}",
+    )
+    ben.add_argument(
+        "--topics", type=int, default=1, help="distinct values of {topic}"
+    )
+    ben.add_argument("--max-inflight", type=int, default=100)
+    ben.add_argument("--duration", type=float, default=10.0, help="seconds")
+    ben.add_argument("--count", type=int, help="messages per publisher")
+    ben.add_argument("--output", help="results file (default: ./Storage/)")
+    ben.add_argument(
+        "--stats-interval", type=float, default=5.0, help="seconds between logs"
+    )
+    ben.set_defaults(func=bench)
+    return parser
+
+
+def main(argv=None):
+    """Run the command line interface"""
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,125 +1,1458 @@
+import itertools
+import queue
+import re
 import sqlite3
 import threading
-import json
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from analytics import MessageAnalytics
+from last_values import LastValue
+from metrics import registry as metrics
+from payload_format import to_text
+from payloads import (
+    MESSAGE_PAYLOAD,
+    MESSAGE_SIZE,
+    PayloadCodec,
+    create_payload_tables,
+    payload_expression,
+    payload_stats,
+    savings_ratio,
+)
+from records import Direction, Message
+from retention import RetentionManager
+from rollups import (
+    NUMBER_MAX_BYTES,
+    ROLLUPS,
+    RollupBatch,
+    create_rollup_tables,
+    parse_number,
+    rollup_table,
+)
+from writer import MessageWriter
+
+
+# Version stored in PRAGMA user_version
+#   0/1: messages(timestamp TEXT, topic TEXT, message TEXT, direction TEXT)
+#   2:   integer primary key, epoch microsecond timestamps, interned topics
+#   3:   optional deduplicated BLOB payloads (messages.payload_id)
+#   4:   per-minute and per-hour rollup tables
+SCHEMA_VERSION = 4
+
+# Select list shared by all message queries
+MESSAGE_COLUMNS = f"m.id, m.ts, t.name, {MESSAGE_PAYLOAD}, m.direction"
+MESSAGE_TABLES = "messages m JOIN topics t ON t.id = m.topic_id"
+
+
+# Storage profiles, selected by name or given as a dict of overrides.
+# journal_mode, page_size and auto_vacuum only take effect when the database
+# is created. With INCREMENTAL auto_vacuum, space freed by retention is
+# returned to the file system.
+STORAGE_PROFILES = {
+    # Every commit is durable, even on power loss
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -16000,
+        "page_size": 4096,
+        "auto_vacuum": "INCREMENTAL",
+    },
+    # Durable across application crashes, may lose the last commits on power loss
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "page_size": 4096,
+        "auto_vacuum": "INCREMENTAL",
+    },
+    # No fsync at all, for recording sessions that can be repeated
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "mmap_size": 1024 * 1024 * 1024,
+        "cache_size": -256000,
+        "page_size": 8192,
+        "auto_vacuum": "INCREMENTAL",
+    },
+}
+DEFAULT_STORAGE_PROFILE = "balanced"
+
+
+def resolve_storage_profile(profile=None):
+    """Return the settings of a profile name or a dict of overrides"""
+    if profile is None:
+        profile = DEFAULT_STORAGE_PROFILE
+    if isinstance(profile, str):
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f"Unknown storage profile: {profile}")
+        return dict(STORAGE_PROFILES[profile])
+    settings = dict(STORAGE_PROFILES[profile.get("base", DEFAULT_STORAGE_PROFILE)])
+    settings.update({k: v for k, v in profile.items() if k != "base"})
+    return settings
+
+
+class ReadConnectionPool:
+    """Pool of read-only connections, so queries never wait for the writer"""
+
+    # Seconds a query waits for a pooled connection before opening its own
+    WAIT_TIMEOUT = 0.5
+
+    def __init__(self, db_name, size, settings, codec=None):
+        """Open *size* read-only connections to *db_name*
+
+        *codec* is the PayloadCodec whose SQL function the queries use.
+        """
+        self.uri = f"file:{os.path.abspath(db_name)}?mode=ro"
+        self.settings = settings
+        self.codec = codec
+        self.connections = queue.Queue()
+        self.all_connections = []
+        for _ in range(max(1, size)):
+            conn = self._open()
+            self.all_connections.append(conn)
+            self.connections.put(conn)
+
+    def _open(self):
+        """Open one read-only connection"""
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        if self.codec is not None:
+            self.codec.register(conn)
+        conn.execute(f"PRAGMA mmap_size = {int(self.settings['mmap_size'])}")
+        conn.execute(f"PRAGMA cache_size = {int(self.settings['cache_size'])}")
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block
+
+        If every pooled connection stays busy for WAIT_TIMEOUT seconds, a
+        temporary connection is opened instead of waiting any longer.
+        """
+        try:
+            conn = self.connections.get(timeout=self.WAIT_TIMEOUT)
+        except queue.Empty:
+            conn = None
+        if conn is None:
+            metrics.inc("read_pool_overflows")
+            with self.dedicated() as conn:
+                yield conn
+            return
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    @contextmanager
+    def dedicated(self):
+        """Connection of its own for long reads such as streams, closed after"""
+        conn = self._open()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """Close all connections of the pool"""
+        for conn in self.all_connections:
+            conn.close()
+        self.all_connections = []
+
+
+def to_epoch_us(value):
+    """Convert epoch microseconds, a datetime or an ISO string to epoch microseconds"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp()) * 1000000 + value.microsecond
+
+
+def format_timestamp(ts_us, fmt="%Y-%m-%d %H:%M:%S"):
+    """Format epoch microseconds as local time"""
+    seconds, micros = divmod(ts_us, 1000000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=micros).strftime(fmt)
+
+
+def search_result(row):
+    """Turn a row of the search query into a (Message, snippet) pair"""
+    return Message.from_row(row[:5]), row[5]
 
 
 class MQTTDatabase:
-    def __init__(self, db_name="mqtt_messages.db"):
-        """Initialize SQLite database"""
+    # Legacy rows copied per transaction while migrating an old database
+    MIGRATION_CHUNK = 5000
+
+    def __init__(
+        self,
+        db_name="mqtt_messages.db",
+        batch_size=500,
+        max_latency=0.05,
+        queue_size=10000,
+        profile=None,
+        read_pool_size=2,
+        full_text_search=True,
+        retention=None,
+        retention_interval=60.0,
+        blob_payloads=False,
+        compress_threshold=64,
+        compression_dictionaries=True,
+    ):
+        """Initialize SQLite database and the batched message writer
+
+        *profile* is a name from STORAGE_PROFILES or a dict of overrides.
+        *full_text_search* maintains an FTS5 index for search(), if the
+        SQLite library supports it.
+        *retention* is a RetentionPolicy or a dict of its limits, enforced
+        by a background job every *retention_interval* seconds.
+        With *blob_payloads* new payloads are stored deduplicated as BLOBs,
+        compressed from *compress_threshold* bytes on, optionally with
+        per-topic *compression_dictionaries* (see payloads.py). Readers
+        get the same text either way.
+        The writer connection is guarded by db_lock; queries use a pool of
+        read-only connections and don't take the lock.
+        """
         self.db_name = db_name
+        self.settings = resolve_storage_profile(profile)
         self.db_lock = threading.Lock()
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.blob_payloads = blob_payloads
+        self.payload_codec = PayloadCodec(
+            self._file_path(db_name), compress_threshold, compression_dictionaries
+        )
+        self.payload_codec.register(self.conn)
+        self._closed = False
+        # Changed by everything but appending rows, see _data_version()
+        self._generation = 0
+        self.analytics = MessageAnalytics(self)
+        self._read_pool = None
+        self.retention = None
+        self._apply_settings()
+        self._topic_ids = {}
+        self._migration_stop = threading.Event()
+        self._migration_thread = None
+        self.fts_enabled = full_text_search
         self._init_database()
+        # Analytics use the rollups once they cover all stored rows
+        self.rollups_ready = not self._rollup_backfill_pending()
+
+        # In-memory databases can't be shared, queries use the writer there
+        if db_name != ":memory:" and not db_name.startswith("file:"):
+            self._read_pool = ReadConnectionPool(
+                db_name, read_pool_size, self.settings, self.payload_codec
+            )
+
+        # Message ids are handed out when a message is queued, so callers
+        # know the id before the background writer has stored it. Ids are
+        # queued in order under _save_lock, so the writer commits them in
+        # order and readers (see analytics.py) never see a lower id later.
+        self._next_id = itertools.count(self._max_message_id() + 1)
+        self._save_lock = threading.Lock()
+        self.writer = MessageWriter(self, batch_size, max_latency, queue_size)
+
+        # Old databases are converted and indexed in the background
+        if self._upgrade_pending():
+            self._migration_thread = threading.Thread(
+                target=self._upgrade_in_background,
+                name="mqtt-db-migration",
+                daemon=True,
+            )
+            self._migration_thread.start()
+
+        if retention is not None:
+            self.set_retention(retention, retention_interval)
+
+    @staticmethod
+    def _file_path(db_name):
+        """Absolute path of a database file, None for in-memory databases"""
+        if db_name == ":memory:" or db_name.startswith("file:"):
+            return None
+        return os.path.abspath(db_name)
+
+    def _apply_settings(self, conn=None):
+        """Apply the storage profile to the writer (or another) connection"""
+        c = (conn or self.conn).cursor()
+        # Page size and auto_vacuum can only be changed before the first
+        # table exists
+        c.execute("SELECT COUNT(*) FROM sqlite_master")
+        if c.fetchone()[0] == 0:
+            c.execute(f"PRAGMA page_size = {int(self.settings['page_size'])}")
+            c.execute(f"PRAGMA auto_vacuum = {self.settings['auto_vacuum']}")
+        c.execute(f"PRAGMA journal_mode = {self.settings['journal_mode']}")
+        c.execute(f"PRAGMA synchronous = {self.settings['synchronous']}")
+        c.execute(f"PRAGMA mmap_size = {int(self.settings['mmap_size'])}")
+        c.execute(f"PRAGMA cache_size = {int(self.settings['cache_size'])}")
+
+    @contextmanager
+    def _reader(self, timing="db_query"):
+        """Connection for queries: from the read pool, or the locked writer
+
+        The time the connection is held is recorded under *timing*.
+        """
+        with metrics.time(timing):
+            if self._read_pool is None:
+                with self.db_lock:
+                    yield self.conn
+            else:
+                with self._read_pool.connection() as conn:
+                    yield conn
+
+    def get_storage_info(self):
+        """Get the storage settings in effect on the writer connection"""
+        with self.db_lock:
+            c = self.conn.cursor()
+            info = {}
+            for pragma in (
+                "journal_mode",
+                "synchronous",
+                "mmap_size",
+                "cache_size",
+                "page_size",
+                "auto_vacuum",
+            ):
+                c.execute(f"PRAGMA {pragma}")
+                row = c.fetchone()
+                info[pragma] = row[0] if row else None
+            info["read_connections"] = (
+                len(self._read_pool.all_connections) if self._read_pool else 0
+            )
+            return info
 
     def _init_database(self):
-        """Create the messages table if it doesn't exist"""
+        """Create or upgrade the schema"""
         c = self.conn.cursor()
+        version = c.execute("PRAGMA user_version").fetchone()[0]
 
         # Check if the table exists and has the old structure
         c.execute("PRAGMA table_info(messages)")
         columns = [column[1] for column in c.fetchall()]
 
-        if not columns:
-            # Table doesn't exist, create new table with direction field
+        if columns and "ts" not in columns:
+            # Old text based table: keep it aside, rows are moved over in chunks
+            if "direction" not in columns:
+                c.execute(
+                    "ALTER TABLE messages ADD COLUMN direction TEXT DEFAULT 'received'"
+                )
+            c.execute("ALTER TABLE messages RENAME TO messages_legacy")
+
+        self._create_message_tables(c)
+        c.execute("SELECT 1 FROM counters WHERE name = 'messages'")
+        if c.fetchone() is None:
+            count = c.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            if self._has_legacy_table():
+                count += c.execute("SELECT COUNT(*) FROM messages_legacy").fetchone()[0]
+            c.execute("INSERT INTO counters VALUES ('messages', ?)", (count,))
+
+        if self.fts_enabled:
+            self.fts_enabled = self._init_search_index(c)
+            if version == 2:
+                self._upgrade_search_index(c)
+        self._init_last_values(c)
+
+        c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+
+        c.execute("SELECT name, id FROM topics")
+        self._topic_ids = dict(c.fetchall())
+
+    def _create_message_tables(self, c):
+        """Create the topics, messages and counters tables with their indexes"""
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS topics
+                    (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)"""
+        )
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS messages
+                    (id INTEGER PRIMARY KEY,
+                     ts INTEGER NOT NULL,
+                     topic_id INTEGER NOT NULL REFERENCES topics(id),
+                     message TEXT,
+                     direction TEXT NOT NULL DEFAULT 'received')"""
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_topic_ts ON messages(topic_id, ts)"
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages(ts)")
+
+        # Version 3: payloads may be stored in the payloads table
+        c.execute("PRAGMA table_info(messages)")
+        if "payload_id" not in [column[1] for column in c.fetchall()]:
+            c.execute("ALTER TABLE messages ADD COLUMN payload_id INTEGER")
+        create_payload_tables(c)
+
+        # Row counter maintained by every insert and delete, so the total
+        # doesn't need a COUNT(*) scan
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS counters
+                    (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"""
+        )
+
+        # Version 4: rollups, maintained by the writer and retention
+        if create_rollup_tables(c):
+            # Rows stored before are added by the background thread
+            c.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+            end = c.fetchone()[0]
             c.execute(
-                """CREATE TABLE messages
-                        (timestamp TEXT, topic TEXT, message TEXT, direction TEXT)"""
+                "SELECT 1 FROM sqlite_master"
+                " WHERE type = 'table' AND name = 'messages_legacy'"
             )
-        elif "direction" not in columns:
-            # Table exists but doesn't have direction field, add it
+            if c.fetchone() is not None:
+                c.execute("SELECT COALESCE(MAX(rowid), 0) FROM messages_legacy")
+                end = max(end, c.fetchone()[0])
+            if end:
+                c.execute(
+                    "INSERT OR REPLACE INTO counters VALUES ('rollup_backfill_end', ?)",
+                    (end,),
+                )
+                c.execute(
+                    "INSERT OR REPLACE INTO counters VALUES ('rollup_backfill_next', 1)"
+                )
+
+    def _init_search_index(self, c):
+        """Create the FTS5 index over payloads and topics
+
+        Returns False if the SQLite library doesn't support FTS5.
+        """
+        c.execute(
+            "SELECT 1 FROM sqlite_master"
+            " WHERE type = 'table' AND name = 'messages_fts'"
+        )
+        if c.fetchone() is not None:
+            return True
+
+        self._create_search_view(c)
+        try:
             c.execute(
-                "ALTER TABLE messages ADD COLUMN direction TEXT DEFAULT 'received'"
+                """CREATE VIRTUAL TABLE messages_fts USING fts5
+                        (message, topic, content='messages_search_content',
+                         content_rowid='id', prefix='2 3')"""
             )
+        except sqlite3.OperationalError:
+            # SQLite was built without FTS5, search() falls back to LIKE
+            c.execute("DROP VIEW IF EXISTS messages_search_content")
+            return False
+        self._create_search_triggers(c)
 
-        self.conn.commit()
+        # Rows stored before the index existed are indexed in the background.
+        # Everything inserted from now on is indexed by the triggers.
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+        c.execute(
+            "INSERT OR REPLACE INTO counters VALUES ('fts_backfill_end', ?)",
+            (c.fetchone()[0],),
+        )
+        c.execute("INSERT OR REPLACE INTO counters VALUES ('fts_backfill_next', 1)")
+        return True
+
+    def _init_last_values(self, c):
+        """Create the snapshot table of the last received value per topic"""
+        c.execute(
+            "SELECT 1 FROM sqlite_master"
+            " WHERE type = 'table' AND name = 'last_values'"
+        )
+        if c.fetchone() is not None:
+            return
+        c.execute(
+            """CREATE TABLE last_values
+                    (topic_id INTEGER PRIMARY KEY REFERENCES topics(id),
+                     message_id INTEGER,
+                     ts INTEGER NOT NULL,
+                     message TEXT)"""
+        )
+        # Topics of existing databases are filled in by the background thread
+        c.execute(
+            "INSERT OR REPLACE INTO counters VALUES ('last_values_backfill_next', 1)"
+        )
+
+    def _create_search_view(self, c):
+        """The index reads snippets from this view instead of storing a copy"""
+        c.execute(
+            f"""CREATE VIEW IF NOT EXISTS messages_search_content AS
+                    SELECT m.id AS id, {MESSAGE_PAYLOAD} AS message, t.name AS topic
+                    FROM messages m JOIN topics t ON t.id = m.topic_id"""
+        )
+
+    def _create_search_triggers(self, c):
+        """Keep the FTS5 index in sync with inserts and deletes"""
+        c.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS messages_fts_insert
+                    AFTER INSERT ON messages BEGIN
+                        INSERT INTO messages_fts (rowid, message, topic)
+                        VALUES (new.id, {payload_expression("new")},
+                                (SELECT name FROM topics WHERE id = new.topic_id));
+                    END"""
+        )
+        # Runs before messages_payload_delete, the payload still exists
+        c.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS messages_fts_delete
+                    AFTER DELETE ON messages BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, message, topic)
+                        VALUES ('delete', old.id, {payload_expression("old")},
+                                (SELECT name FROM topics WHERE id = old.topic_id));
+                    END"""
+        )
+
+    def _upgrade_search_index(self, c):
+        """Recreate the view and triggers of a version 2 schema for BLOB payloads"""
+        c.execute("DROP TRIGGER IF EXISTS messages_fts_insert")
+        c.execute("DROP TRIGGER IF EXISTS messages_fts_delete")
+        c.execute("DROP VIEW IF EXISTS messages_search_content")
+        self._create_search_view(c)
+        self._create_search_triggers(c)
+
+    def _search_backfill_pending(self):
+        """Check whether existing rows still have to be added to the index"""
+        if not self.fts_enabled:
+            return False
+        c = self.conn.execute(
+            "SELECT (SELECT value FROM counters WHERE name = 'fts_backfill_next')"
+            " <= (SELECT value FROM counters WHERE name = 'fts_backfill_end')"
+        )
+        return bool(c.fetchone()[0])
+
+    def _backfill_search_index(self):
+        """Index rows that existed before the FTS5 table, in chunks"""
+        while not self._migration_stop.is_set():
+            with self.db_lock:
+                with self.conn:
+                    c = self.conn.cursor()
+                    c.execute(
+                        "SELECT value FROM counters WHERE name = 'fts_backfill_next'"
+                    )
+                    start = c.fetchone()[0]
+                    c.execute(
+                        "SELECT value FROM counters WHERE name = 'fts_backfill_end'"
+                    )
+                    end = min(c.fetchone()[0], start + self.MIGRATION_CHUNK - 1)
+                    if start > end:
+                        return
+                    c.execute(
+                        "INSERT INTO messages_fts (rowid, message, topic)"
+                        " SELECT id, message, topic FROM messages_search_content"
+                        " WHERE id BETWEEN ? AND ?",
+                        (start, end),
+                    )
+                    c.execute(
+                        "UPDATE counters SET value = ?"
+                        " WHERE name = 'fts_backfill_next'",
+                        (end + 1,),
+                    )
+            # Give the writer a chance to take the lock between chunks
+            time.sleep(0.01)
+
+    def _last_values_backfill_pending(self):
+        """Check whether last values of existing topics still have to be stored"""
+        c = self.conn.execute(
+            "SELECT 1 FROM counters WHERE name = 'last_values_backfill_next'"
+        )
+        return c.fetchone() is not None
+
+    def _backfill_last_values(self):
+        """Store the newest received message of every existing topic, in chunks
+
+        Values saved by save_last_values() in the meantime are newer and
+        are kept.
+        """
+        while not self._migration_stop.is_set():
+            with self.db_lock:
+                with self.conn:
+                    c = self.conn.cursor()
+                    c.execute(
+                        "SELECT value FROM counters"
+                        " WHERE name = 'last_values_backfill_next'"
+                    )
+                    start = c.fetchone()[0]
+                    c.execute(
+                        "SELECT MAX(id) FROM (SELECT id FROM topics WHERE id >= ?"
+                        " ORDER BY id LIMIT ?)",
+                        (start, self.MIGRATION_CHUNK),
+                    )
+                    end = c.fetchone()[0]
+                    if end is None:
+                        c.execute(
+                            "DELETE FROM counters"
+                            " WHERE name = 'last_values_backfill_next'"
+                        )
+                        return
+                    # One index lookup per topic, see idx_messages_topic_ts
+                    c.execute(
+                        f"""INSERT OR IGNORE INTO last_values
+                                (topic_id, message_id, ts, message)
+                           SELECT m.topic_id, m.id, m.ts, {MESSAGE_PAYLOAD}
+                           FROM topics t JOIN messages m ON m.id = (
+                               SELECT id FROM messages
+                               WHERE topic_id = t.id AND direction = 'received'
+                               ORDER BY ts DESC, id DESC LIMIT 1)
+                           WHERE t.id BETWEEN ? AND ?""",
+                        (start, end),
+                    )
+                    c.execute(
+                        "UPDATE counters SET value = ?"
+                        " WHERE name = 'last_values_backfill_next'",
+                        (end + 1,),
+                    )
+            # Give the writer a chance to take the lock between chunks
+            time.sleep(0.01)
+
+    def _rollup_backfill_pending(self):
+        """Check whether existing rows still have to be added to the rollups"""
+        c = self.conn.execute(
+            "SELECT 1 FROM counters WHERE name = 'rollup_backfill_next'"
+        )
+        return c.fetchone() is not None
+
+    def _backfill_rollups(self):
+        """Add rows that existed before the rollup tables, in chunks"""
+        while not self._migration_stop.is_set():
+            with self.db_lock:
+                with self.conn:
+                    done = not self._backfill_rollup_chunk(self.conn.cursor())
+            if done:
+                self.rollups_ready = True
+                return
+            # Give the writer a chance to take the lock between chunks
+            time.sleep(0.01)
+
+    def _backfill_rollup_chunk(self, c):
+        """Add the next chunk of old rows to the rollups, False when done
+
+        The caller holds db_lock and commits.
+        """
+        c.execute(
+            "SELECT (SELECT value FROM counters WHERE name = 'rollup_backfill_next'),"
+            " (SELECT value FROM counters WHERE name = 'rollup_backfill_end')"
+        )
+        start, end = c.fetchone()
+        if start is None or start > end:
+            c.execute("DELETE FROM counters WHERE name LIKE 'rollup_backfill_%'")
+            return False
+        end = min(end, start + self.MIGRATION_CHUNK - 1)
+        # Only short payloads are decoded to look for numbers
+        c.execute(
+            f"""SELECT m.topic_id, m.ts, {MESSAGE_SIZE},
+                       CASE WHEN {MESSAGE_SIZE} <= ? THEN {MESSAGE_PAYLOAD} END
+                FROM messages m WHERE m.id BETWEEN ? AND ?""",
+            (NUMBER_MAX_BYTES, start, end),
+        )
+        batch = RollupBatch()
+        for topic_id, ts, size, text in c.fetchall():
+            batch.add(topic_id, ts, size, parse_number(text))
+        batch.write(c)
+        c.execute(
+            "UPDATE counters SET value = ? WHERE name = 'rollup_backfill_next'",
+            (end + 1,),
+        )
+        return True
+
+    def _upgrade_pending(self):
+        """Check whether _upgrade_in_background() has anything to do"""
+        return (
+            self._has_legacy_table()
+            or self._search_backfill_pending()
+            or self._last_values_backfill_pending()
+            or self._rollup_backfill_pending()
+        )
+
+    def _upgrade_in_background(self):
+        """Finish indexing existing rows, then migrate rows of an old schema
+
+        The backfill has to finish first: migrated rows are indexed by the
+        triggers and must not be indexed a second time. Rollups and last
+        values are collected once all rows are in the new schema.
+        """
+        if self._search_backfill_pending():
+            self._backfill_search_index()
+        if self._has_legacy_table():
+            self._migrate_legacy_rows()
+        if self._rollup_backfill_pending():
+            self._backfill_rollups()
+        if self._last_values_backfill_pending():
+            self._backfill_last_values()
+
+    def _has_legacy_table(self):
+        """Check whether rows of an old schema still wait for migration"""
+        c = self.conn.execute(
+            "SELECT 1 FROM sqlite_master"
+            " WHERE type = 'table' AND name = 'messages_legacy'"
+        )
+        return c.fetchone() is not None
+
+    def _max_message_id(self):
+        """Get the highest message id in use, including unmigrated rows"""
+        max_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+        max_id = max_id.fetchone()[0]
+        if self._has_legacy_table():
+            c = self.conn.execute("SELECT MAX(rowid) FROM messages_legacy")
+            max_id = max(max_id, c.fetchone()[0] or 0)
+        return max_id
+
+    def _migrate_legacy_rows(self):
+        """Move rows of the old text table into the new schema in chunks"""
+        while not self._migration_stop.is_set():
+            with self.db_lock:
+                with self.conn:
+                    c = self.conn.cursor()
+                    c.execute(
+                        "SELECT MAX(rowid) FROM (SELECT rowid FROM messages_legacy"
+                        " ORDER BY rowid LIMIT ?)",
+                        (self.MIGRATION_CHUNK,),
+                    )
+                    last = c.fetchone()[0]
+                    if last is None:
+                        c.execute("DROP TABLE messages_legacy")
+                        return
+                    c.execute(
+                        "INSERT OR IGNORE INTO topics (name) SELECT DISTINCT"
+                        " COALESCE(topic, '') FROM messages_legacy WHERE rowid <= ?",
+                        (last,),
+                    )
+                    # Old timestamps are local time strings with second resolution
+                    c.execute(
+                        """INSERT OR IGNORE INTO messages
+                                (id, ts, topic_id, message, direction)
+                           SELECT l.rowid,
+                                  COALESCE(CAST(strftime('%s', l.timestamp, 'utc')
+                                                AS INTEGER), 0) * 1000000,
+                                  t.id, l.message, COALESCE(l.direction, 'received')
+                           FROM messages_legacy l
+                           JOIN topics t ON t.name = COALESCE(l.topic, '')
+                           WHERE l.rowid <= ?""",
+                        (last,),
+                    )
+                    c.execute("DELETE FROM messages_legacy WHERE rowid <= ?", (last,))
+                    c.execute("SELECT name, id FROM topics")
+                    self._topic_ids = dict(c.fetchall())
+                # The migrated rows have old ids
+                self._generation += 1
+            # Give the writer a chance to take the lock between chunks
+            time.sleep(0.01)
+
+    def is_migrating(self):
+        """Check whether an old database is still being converted or indexed"""
+        return self._migration_thread is not None and self._migration_thread.is_alive()
 
     def save_message(self, timestamp, topic, message, direction="received"):
-        """Save message to database"""
+        """Queue message for the background writer
+
+        *timestamp* is in epoch microseconds or a datetime, *message* text
+        or bytes. Returns the id the message will be stored under, or None
+        if it was dropped
+        """
+        record = Message.create(
+            topic, message, to_epoch_us(timestamp) * 1000, Direction.parse(direction)
+        )
+        return self.save(record)
+
+    def save(self, record):
+        """Queue a Message record for the background writer
+
+        Sets the id the message will be stored under and returns it, or
+        None if it was dropped. The record itself is queued, no row is
+        built until the writer inserts it.
+        """
+        # Messages are saved from the MQTT, UI, replay and probe threads
+        with self._save_lock:
+            record.id = next(self._next_id)
+            queued = self.writer.enqueue(record)
+        if queued:
+            return record.id
+        record.id = None
+        return None
+
+    def save_messages(self, records):
+        """Insert several Message records with their ids at once"""
         with self.db_lock:
-            c = self.conn.cursor()
+            self._insert_messages(
+                self.conn, records, self._topic_ids, self.payload_codec
+            )
+
+    def _insert_messages(self, conn, records, topic_ids, codec):
+        """Insert Message records in one transaction
+
+        Payloads are decoded here, on the writer thread; binary payloads
+        are always stored as BLOBs. *topic_ids* and *codec* belong to the
+        database of *conn*. The rollups are updated in the same
+        transaction. The caller holds db_lock.
+        """
+        new_topics = []
+        try:
+            with conn:
+                c = conn.cursor()
+                rows = []
+                rollups = RollupBatch()
+                for record in records:
+                    ts = record.ts_ns // 1000
+                    topic_id = self._get_topic_id(
+                        c, record.topic, new_topics, topic_ids
+                    )
+                    message = record.payload
+                    rollups.add(topic_id, ts, len(message), parse_number(message))
+                    payload_id = None
+                    binary = isinstance(message, (bytes, bytearray))
+                    if binary and not self.blob_payloads:
+                        try:
+                            message = message.decode("utf-8")
+                            binary = False
+                        except UnicodeDecodeError:
+                            pass
+                    if self.blob_payloads or binary:
+                        payload_id = codec.store(c, topic_id, message)
+                        message = None
+                    rows.append(
+                        (
+                            record.id,
+                            ts,
+                            topic_id,
+                            message,
+                            payload_id,
+                            str(record.direction),
+                        )
+                    )
+                codec.flush(c)
+                c.executemany(
+                    "INSERT INTO messages"
+                    " (id, ts, topic_id, message, payload_id, direction)"
+                    " VALUES (?,?,?,?,?,?)",
+                    rows,
+                )
+                rollups.write(c)
+                c.execute(
+                    "UPDATE counters SET value = value + ? WHERE name = 'messages'",
+                    (len(rows),),
+                )
+        except Exception:
+            # Topics and payloads inserted by the rolled back transaction
+            # don't exist
+            for topic in new_topics:
+                topic_ids.pop(topic, None)
+            codec.rollback()
+            raise
+
+    def _get_topic_id(self, cursor, topic, new_topics, topic_ids=None):
+        """Get the id of an interned topic, inserting it if necessary
+
+        *topic_ids* is the name to id cache of the cursor's database,
+        by default the one of the main database.
+        """
+        if topic_ids is None:
+            topic_ids = self._topic_ids
+        topic_id = topic_ids.get(topic)
+        if topic_id is None:
+            cursor.execute("SELECT id FROM topics WHERE name = ?", (topic,))
+            row = cursor.fetchone()
+            if row:
+                topic_id = row[0]
+            else:
+                cursor.execute("INSERT INTO topics (name) VALUES (?)", (topic,))
+                topic_id = cursor.lastrowid
+                new_topics.append(topic)
+            topic_ids[topic] = topic_id
+        return topic_id
+
+    def save_last_values(self, values):
+        """Store LastValue tuples in the last_values snapshot table"""
+        with self.db_lock:
+            new_topics = []
+            try:
+                with self.conn:
+                    c = self.conn.cursor()
+                    records = [
+                        (
+                            self._get_topic_id(c, value.topic, new_topics),
+                            value.message_id,
+                            to_epoch_us(value.timestamp),
+                            to_text(value.payload),
+                        )
+                        for value in values
+                    ]
+                    c.executemany(
+                        "INSERT OR REPLACE INTO last_values"
+                        " (topic_id, message_id, ts, message) VALUES (?,?,?,?)",
+                        records,
+                    )
+            except Exception:
+                for topic in new_topics:
+                    self._topic_ids.pop(topic, None)
+                raise
+
+    def load_last_values(self, limit=None):
+        """Get the stored last values as LastValue tuples, newest first"""
+        with self._reader() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT t.name, l.ts, l.message, l.message_id"
+                " FROM last_values l JOIN topics t ON t.id = l.topic_id"
+                " ORDER BY l.ts DESC LIMIT ?",
+                (-1 if limit is None else limit,),
+            )
+            return [LastValue(*row) for row in c.fetchall()]
+
+    def get_last_value(self, topic):
+        """Get the stored last value of *topic* as a LastValue, or None"""
+        with self._reader() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT t.name, l.ts, l.message, l.message_id"
+                " FROM topics t JOIN last_values l ON l.topic_id = t.id"
+                " WHERE t.name = ?",
+                (topic,),
+            )
+            row = c.fetchone()
+            return LastValue(*row) if row else None
+
+    def flush(self, timeout=None):
+        """Wait until all queued messages have been written"""
+        return self.writer.flush(timeout)
+
+    def get_writer_stats(self):
+        """Get queue depth, dropped count and flush timings of the writer"""
+        return self.writer.get_stats()
+
+    def set_retention(self, policy, interval=60.0):
+        """Enforce *policy* in the background, None stops the retention job"""
+        if self.retention is not None:
+            self.retention.stop()
+            self.retention = None
+        if policy is not None:
+            self.retention = RetentionManager(self, policy, interval).start()
+
+    def get_retention_stats(self):
+        """Get the totals and last report of the retention job, or None"""
+        return self.retention.get_stats() if self.retention is not None else None
+
+    def delete_oldest(self, limit, before_ts=None, topic=None):
+        """Delete up to *limit* of the oldest messages, returns the number deleted
+
+        Optionally only messages older than *before_ts* (epoch microseconds)
+        or of one topic. Rows are found via the ts or (topic_id, ts) index,
+        so the lock is held for one small transaction. BLOB payloads no
+        longer referenced are deleted with them.
+        """
+        with self.db_lock:
+            return self._delete_oldest(
+                self.conn, self.payload_codec, limit, before_ts, topic
+            )
+
+    def _delete_oldest(self, conn, codec, limit, before_ts=None, topic=None):
+        """delete_oldest() on *conn*, the caller holds db_lock"""
+        conditions = []
+        params = []
+        if topic is not None:
+            conditions.append("topic_id = (SELECT id FROM topics WHERE name = ?)")
+            params.append(topic)
+        if before_ts is not None:
+            conditions.append("ts < ?")
+            params.append(before_ts)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with metrics.time("retention_batch"):
+            with conn:
+                c = conn.cursor()
+                # Only short payloads are decoded to look for numbers
+                c.execute(
+                    f"""SELECT m.id, m.payload_id, m.topic_id, m.ts, {MESSAGE_SIZE},
+                               CASE WHEN {MESSAGE_SIZE} <= ? THEN {MESSAGE_PAYLOAD} END
+                        FROM messages m{where} ORDER BY ts LIMIT ?""",
+                    [NUMBER_MAX_BYTES] + params + [limit],
+                )
+                rows = c.fetchall()
+                self._remove_from_rollups(c, rows)
+                c.executemany(
+                    "DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows]
+                )
+                deleted = len(rows)
+                codec.collect_garbage(c, {row[1] for row in rows if row[1] is not None})
+                if deleted:
+                    self._generation += 1
+                c.execute(
+                    "UPDATE counters SET value = MAX(value - ?, 0)"
+                    " WHERE name = 'messages'",
+                    (deleted,),
+                )
+        return deleted
+
+    def _remove_from_rollups(self, c, rows):
+        """Subtract (id, payload_id, topic_id, ts, size, text) rows from the rollups
+
+        Rows the backfill hasn't reached yet aren't in the rollups.
+        """
+        c.execute(
+            "SELECT (SELECT value FROM counters WHERE name = 'rollup_backfill_next'),"
+            " (SELECT value FROM counters WHERE name = 'rollup_backfill_end')"
+        )
+        pending_start, pending_end = c.fetchone()
+        batch = RollupBatch()
+        for message_id, _, topic_id, ts, size, text in rows:
+            if pending_start is not None and pending_start <= message_id <= pending_end:
+                continue
+            batch.add(topic_id, ts, size, parse_number(text), count=-1)
+        batch.write(c)
+
+    def drop_partitions(self, max_rows=None, before_ts=None):
+        """Drop whole partitions of old messages, returns the number of rows
+
+        Only partitions whose rows would all be deleted are dropped: at most
+        *max_rows* rows, or only rows older than *before_ts*. The single file
+        database has no partitions, see PartitionedDatabase.
+        """
+        return 0
+
+    def get_topic_row_counts(self, min_count=0):
+        """Get (topic, count) of topics with more than *min_count* rows"""
+        with self._reader() as conn:
+            c = conn.cursor()
             c.execute(
-                "INSERT INTO messages VALUES (?,?,?,?)",
-                (timestamp, topic, message, direction),
+                "SELECT t.name, n FROM topics t JOIN"
+                " (SELECT topic_id, COUNT(*) AS n FROM messages"
+                "  GROUP BY topic_id HAVING n > ?) m ON m.topic_id = t.id",
+                (min_count,),
             )
+            return c.fetchall()
+
+    def _data_version(self):
+        """Return (generation, newest message id) for the analytics cache
+
+        The generation changes when rows are deleted or inserted with old
+        ids, otherwise new rows have ids above the newest id.
+        """
+        generation = self._generation
+        with self._reader() as conn:
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+            return generation, max_id.fetchone()[0]
+
+    def _aggregate_rows(self, queries, filters=None, id_range=None):
+        """Run aggregate *queries* per database file, see MessageAnalytics
+
+        Every query is (sql, params) with {tables} and {where} placeholders;
+        *id_range* (after, up to) limits the rows by message id. Returns a
+        list with the results of every query for each file.
+        """
+        queries = self._aggregate_queries(queries, filters, id_range)
+        with self._reader("db_analytics") as conn:
+            return [[conn.execute(*query).fetchall() for query in queries]]
+
+    def _aggregate_queries(self, queries, filters, id_range):
+        """(sql, params) of the aggregate *queries* with the filters filled in"""
+        where, params = self._build_filters(filters)
+        if id_range is not None:
+            after_id, max_id = id_range
+            clauses = ["m.id <= ?"]
+            params.append(max_id)
+            if after_id is not None:
+                clauses.append("m.id > ?")
+                params.append(after_id)
+            where += (" AND " if where else " WHERE ") + " AND ".join(clauses)
+        return [
+            (sql.format(tables=MESSAGE_TABLES, where=where), query_params + params)
+            for sql, query_params in queries
+        ]
+
+    def _aggregate_rollups(self, queries, resolution, filters=None):
+        """Run aggregate *queries* on a rollup table, see _aggregate_rows()
+
+        {tables} is the rollup table "r" joined with the topics "t".
+        """
+        queries = self._rollup_queries(queries, resolution, filters)
+        with self._reader("db_analytics") as conn:
+            return [[conn.execute(*query).fetchall() for query in queries]]
+
+    def _rollup_queries(self, queries, resolution, filters):
+        """(sql, params) of queries on the rollups with the filters filled in
+
+        Time filters select the buckets that lie completely inside the
+        range, so partial buckets at the edges are left out. The rollups
+        don't keep the direction of messages.
+        """
+        filters = filters or {}
+        if filters.get("direction"):
+            raise ValueError("Rollups don't distinguish the message direction")
+        length = ROLLUPS[resolution]
+        clauses = []
+        params = []
+        if filters.get("topic"):
+            clauses.append("t.name = ?")
+            params.append(filters["topic"])
+        if filters.get("topic_prefix"):
+            clauses.append("substr(t.name, 1, ?) = ?")
+            params.extend([len(filters["topic_prefix"]), filters["topic_prefix"]])
+        if filters.get("start") is not None:
+            start = to_epoch_us(filters["start"])
+            clauses.append("r.bucket >= ?")
+            # Rounded up to the next bucket start
+            params.append(start + (-start) % length)
+        if filters.get("end") is not None:
+            # The end is inclusive, like m.ts <= end on the raw rows
+            clauses.append("r.bucket + ? <= ?")
+            params.extend([length - 1, to_epoch_us(filters["end"])])
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        tables = f"{rollup_table(resolution)} r JOIN topics t ON t.id = r.topic_id"
+        return [
+            (sql.format(tables=tables, where=where), query_params + params)
+            for sql, query_params in queries
+        ]
+
+    def get_rollups(self, resolution="minute", filters=None):
+        """Get the per-minute or per-hour aggregates of the stored messages
+
+        Returns dicts of topic, bucket (start in epoch µs), count, bytes and
+        num_count, min, max and mean of the payloads that are plain numbers,
+        ordered by bucket and topic. *filters* are those of
+        get_messages_page() except the direction; only buckets completely
+        inside the time range are returned.
+        """
+        return self.analytics.rollups(resolution, filters)
+
+    def get_topic_stats(self, filters=None):
+        """Get count, bytes, first_ts and last_ts per topic, busiest first
+
+        The analytics queries are aggregated in SQL and cached, see
+        analytics.py. *filters* are those of get_messages_page().
+        """
+        return self.analytics.topic_stats(filters)
+
+    def get_top_topics(self, limit=10, by="count", filters=None):
+        """Get the *limit* topics with the most messages or bytes"""
+        return self.analytics.top_topics(limit, by, filters)
+
+    def get_message_histogram(self, bucket_seconds=60, filters=None, per_topic=False):
+        """Get message counts per time bucket (and topic), see MessageAnalytics"""
+        return self.analytics.histogram(bucket_seconds, filters, per_topic)
+
+    def get_gap_distribution(self, filters=None):
+        """Get the distribution of the time between messages of the same topic"""
+        return self.analytics.gap_distribution(filters)
+
+    def get_space_info(self):
+        """Get page counts and the used and total size of the database in bytes"""
+        with self._reader() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        return {
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": free_pages,
+            "auto_vacuum": auto_vacuum,
+            "file_bytes": page_count * page_size,
+            "used_bytes": (page_count - free_pages) * page_size,
+        }
+
+    def get_payload_stats(self):
+        """Get the BLOB payload counts, bytes and savings ratio
+
+        *payload_bytes* is the size of the payloads of all messages referring
+        to a BLOB, *stored_bytes* what they take up after deduplication and
+        compression; *savings_ratio* is their quotient.
+        """
+        with self._reader() as conn:
+            return savings_ratio(payload_stats(conn))
+
+    def compact_search_index(self, pages):
+        """Merge up to *pages* pages of the FTS5 index, False once done
+
+        Deleted rows stay in the index as tombstones, which take up space
+        until the index segments holding them are merged.
+        """
+        if not self.fts_enabled:
+            return False
+        with self.db_lock:
+            return self._merge_search_index(self.conn, pages)
+
+    def _merge_search_index(self, conn, pages):
+        """Run one FTS5 merge step on *conn*, returns whether it did any work"""
+        before = conn.total_changes
+        conn.execute(
+            "INSERT INTO messages_fts (messages_fts, rank) VALUES ('merge', ?)",
+            # Negative: merge even if there are only a few segments
+            (-int(pages),),
+        )
+        conn.commit()
+        # A step without work changes fewer than two rows
+        return conn.total_changes - before >= 2
+
+    def incremental_vacuum(self, pages):
+        """Return up to *pages* free pages to the file system
+
+        Returns the number of pages removed, 0 without INCREMENTAL auto_vacuum.
+        """
+        with self.db_lock:
+            c = self.conn.cursor()
+            # 2 = INCREMENTAL
+            if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            before = c.execute("PRAGMA page_count").fetchone()[0]
+            c.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
             self.conn.commit()
+            return before - c.execute("PRAGMA page_count").fetchone()[0]
 
     def clear_database(self):
         """Clear the messages database"""
         with self.db_lock:
             c = self.conn.cursor()
+            if self.fts_enabled:
+                # Emptying the index at once is much faster than the triggers
+                c.execute("DROP TRIGGER messages_fts_delete")
+                c.execute(
+                    "INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')"
+                )
+                c.execute(
+                    "UPDATE counters SET value = 0 WHERE name = 'fts_backfill_end'"
+                )
+            c.execute("DROP TRIGGER messages_payload_delete")
             c.execute("DELETE FROM messages")
+            self.payload_codec.clear(c)
+            create_payload_tables(c)
+            if self.fts_enabled:
+                self._create_search_triggers(c)
+            if self._has_legacy_table():
+                c.execute("DELETE FROM messages_legacy")
+            c.execute("DELETE FROM last_values")
+            c.execute("DELETE FROM counters WHERE name = 'last_values_backfill_next'")
+            for resolution in ROLLUPS:
+                c.execute(f"DELETE FROM {rollup_table(resolution)}")
+            c.execute("DELETE FROM counters WHERE name LIKE 'rollup_backfill_%'")
+            c.execute("UPDATE counters SET value = 0 WHERE name = 'messages'")
             self.conn.commit()
+            self._generation += 1
 
     def get_all_messages(self, order_desc=True):
-        """Get all messages from database"""
-        with self.db_lock:
-            c = self.conn.cursor()
+        """Get all messages from database as (ts, topic, message, direction)"""
+        with self._reader() as conn:
+            c = conn.cursor()
             order = "DESC" if order_desc else "ASC"
-            c.execute(f"SELECT * FROM messages ORDER BY timestamp {order}")
+            c.execute(
+                f"SELECT m.ts, t.name, {MESSAGE_PAYLOAD}, m.direction"
+                f" FROM {MESSAGE_TABLES} ORDER BY m.ts {order}, m.id {order}"
+            )
             return c.fetchall()
 
     def get_recent_messages(self, limit=10):
-        """Get recent messages from database"""
-        with self.db_lock:
-            c = self.conn.cursor()
+        """Get the *limit* newest messages as Message records, newest first"""
+        with self._reader() as conn:
+            c = conn.cursor()
+            # Walks the ts index backwards, no sort needed
             c.execute(
-                "SELECT * FROM messages ORDER BY timestamp DESC LIMIT ?", (limit,)
+                f"SELECT {MESSAGE_COLUMNS}"
+                f" FROM {MESSAGE_TABLES} ORDER BY m.ts DESC, m.id DESC LIMIT ?",
+                (limit,),
+            )
+            return [Message.from_row(row) for row in c.fetchall()]
+
+    def get_message_count(self, filters=None):
+        """Get the number of stored messages
+
+        The unfiltered total comes from the maintained counter, filtered
+        totals need a COUNT(*) query.
+        """
+        with self._reader() as conn:
+            c = conn.cursor()
+            if not filters:
+                c.execute("SELECT value FROM counters WHERE name = 'messages'")
+            else:
+                where, params = self._build_filters(filters)
+                c.execute(f"SELECT COUNT(*) FROM {MESSAGE_TABLES}{where}", params)
+            row = c.fetchone()
+            return row[0] if row else 0
+
+    def get_messages_page(
+        self, after_key=None, limit=200, filters=None, order_desc=True
+    ):
+        """Get one page of messages using keyset pagination
+
+        Returns Message records ordered by id. *after_key* is the id of
+        the last record of the previous page. *filters* is a dict with
+        optional "topic", "topic_prefix", "direction", "start" and "end"
+        entries; timestamps are epoch microseconds.
+        """
+        return [
+            Message.from_row(row)
+            for row in self._message_rows(after_key, limit, filters, order_desc)
+        ]
+
+    def _message_rows(self, after_key, limit, filters, order_desc):
+        """get_messages_page() as (id, ts, topic, message, direction) rows"""
+        where, params = self._build_filters(filters)
+        if after_key is not None:
+            where += " AND " if where else " WHERE "
+            where += "m.id < ?" if order_desc else "m.id > ?"
+            params.append(after_key)
+        order = "DESC" if order_desc else "ASC"
+
+        with self._reader() as conn:
+            c = conn.cursor()
+            c.execute(
+                f"SELECT {MESSAGE_COLUMNS} FROM {MESSAGE_TABLES}"
+                f"{where} ORDER BY m.id {order} LIMIT ?",
+                params + [limit],
             )
             return c.fetchall()
 
-    def export_to_json(self, filepath=None):
-        """Export database contents to a JSON file"""
-        try:
-            rows = self.get_all_messages(order_desc=False)
-
-            # Create export data
-            export_data = []
-            for row in rows:
-                if len(row) == 4:
-                    # New format with direction
-                    export_data.append(
-                        {
-                            "timestamp": row[0],
-                            "topic": row[1],
-                            "message": row[2],
-                            "direction": row[3],
-                        }
-                    )
-                else:
-                    # Old format without direction (backward compatibility)
-                    export_data.append(
-                        {
-                            "timestamp": row[0],
-                            "topic": row[1],
-                            "message": row[2],
-                            "direction": "received",
-                        }
-                    )
+    def iter_messages(
+        self, after_key=None, limit=None, filters=None, order_desc=True, page_size=1000
+    ):
+        """Iterate over messages page by page without loading them all
+
+        A read connection is only held while a single page is fetched.
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            count = page_size if remaining is None else min(page_size, remaining)
+            rows = self.get_messages_page(after_key, count, filters, order_desc)
+            if not rows:
+                return
+            yield from rows
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < count:
+                return
+            after_key = rows[-1].id
+
+    def search(self, query, topic_filter=None, time_range=None, limit=100):
+        """Full-text search over stored payloads and topics
+
+        Returns (Message, snippet) pairs, best matches first. Every word of
+        *query* has to occur, the last one may be a prefix. *topic_filter*
+        restricts the search to topics starting with it, *time_range* is a
+        (start, end) tuple of epoch microseconds where either side may be
+        None.
+        """
+        search_query = self._search_query(query, topic_filter, time_range, limit)
+        if search_query is None:
+            return []
+        with self._reader() as conn:
+            c = conn.cursor()
+            c.execute(*search_query)
+            return [search_result(row) for row in c.fetchall()]
+
+    def _search_query(self, query, topic_filter, time_range, limit):
+        """Build the SQL and parameters of search(), or None for an empty query
 
-            # Generate filename if not provided
-            if not filepath:
-                filename = (
-                    f"mqtt_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        The rows have an extra last column to sort by, ascending.
+        """
+        words = query.split()
+        if not words:
+            return None
+
+        filters = {"topic_prefix": topic_filter}
+        if time_range:
+            filters["start"], filters["end"] = time_range
+        where, params = self._build_filters(filters)
+
+        if not self.fts_enabled:
+            # Slow path without FTS5: substring scan, newest first
+            for word in words:
+                pattern = "%" + re.sub(r"([\\%_])", r"\\\1", word) + "%"
+                where += " AND " if where else " WHERE "
+                where += (
+                    f"({MESSAGE_PAYLOAD} LIKE ? ESCAPE '\\'"
+                    " OR t.name LIKE ? ESCAPE '\\')"
                 )
-                filepath = os.path.join("./Storage/", filename)
+                params.extend([pattern, pattern])
+            return (
+                f"SELECT {MESSAGE_COLUMNS}, {MESSAGE_PAYLOAD}, -m.id"
+                f" FROM {MESSAGE_TABLES}"
+                f"{where} ORDER BY m.id DESC LIMIT ?",
+                params + [limit],
+            )
+
+        # Quote every word so user input can't produce FTS5 syntax errors
+        terms = ['"' + word.replace('"', '""') + '"' for word in words]
+        terms[-1] += "*"
+        where += (" AND " if where else " WHERE ") + "messages_fts MATCH ?"
+        params.append(" ".join(terms))
+        return (
+            f"SELECT {MESSAGE_COLUMNS},"
+            " snippet(messages_fts, 0, '[', ']', '...', 16), rank"
+            " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+            f" JOIN topics t ON t.id = m.topic_id{where}"
+            " ORDER BY rank LIMIT ?",
+            params + [limit],
+        )
+
+    def stream_messages(self, filters=None, chunk_size=5000):
+        """Yield lists of up to *chunk_size* messages, oldest first
+
+        Uses a single cursor on a read connection of its own, so the export
+        sees one consistent snapshot while the writer keeps going and the
+        pooled connections stay free for other queries. Without a read
+        pool, keyset pages are used so db_lock is only held briefly.
+        """
+        if self._read_pool is None:
+            after_key = None
+            while True:
+                rows = self._message_rows(after_key, chunk_size, filters, False)
+                if not rows:
+                    return
+                yield rows
+                after_key = rows[-1][0]
 
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        where, params = self._build_filters(filters)
+        with metrics.time("db_stream"), self._read_pool.dedicated() as conn:
+            c = conn.cursor()
+            c.execute(
+                f"SELECT {MESSAGE_COLUMNS} FROM {MESSAGE_TABLES}{where} ORDER BY m.id",
+                params,
+            )
+            while True:
+                rows = c.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+
+    def _build_filters(self, filters):
+        """Build a WHERE clause and its parameters from a filter dict"""
+        clauses = []
+        params = []
+        if filters:
+            if filters.get("topic"):
+                clauses.append("t.name = ?")
+                params.append(filters["topic"])
+            if filters.get("topic_prefix"):
+                clauses.append("substr(t.name, 1, ?) = ?")
+                params.extend([len(filters["topic_prefix"]), filters["topic_prefix"]])
+            if filters.get("direction"):
+                clauses.append("m.direction = ?")
+                params.append(filters["direction"])
+            if filters.get("start") is not None:
+                clauses.append("m.ts >= ?")
+                params.append(to_epoch_us(filters["start"]))
+            if filters.get("end") is not None:
+                clauses.append("m.ts <= ?")
+                params.append(to_epoch_us(filters["end"]))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, params
 
-            with open(filepath, "w") as f:
-                json.dump(export_data, f, indent=2)
+    def get_messages_before(self, before_id=None, limit=200):
+        """Get up to *limit* messages older than *before_id*, newest first
 
-            return filepath
+        Returns Message records. Without *before_id* the newest messages
+        are returned.
+        """
+        return self.get_messages_page(before_id, limit)
+
+    def export_to_json(self, filepath=None):
+        """Export database contents to a JSON file"""
+        from exporter import MessageExporter
 
-        except Exception as e:
-            raise Exception(f"Failed to export database: {e}")
+        return MessageExporter(self).export(filepath, fmt="json")
 
     def close(self):
-        """Close database connection"""
-        if hasattr(self, "conn"):
-            self.conn.close()
+        """Drain pending writes and close database connection"""
+        if getattr(self, "_closed", True):
+            return
+        self._closed = True
+        if self.retention is not None:
+            self.retention.stop()
+        if hasattr(self, "writer"):
+            self.writer.close()
+        if self._migration_thread is not None:
+            self._migration_stop.set()
+            self._migration_thread.join()
+        if self._read_pool is not None:
+            self._read_pool.close()
+        self.conn.close()
 
     def __del__(self):
         """Cleanup on exit"""
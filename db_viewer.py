@@ -0,0 +1,328 @@
+import tkinter as tk
+from tkinter import ttk
+from database import format_timestamp
+from exporter import COMPRESSIONS, EXPORT_FORMATS
+
+
+class DatabaseViewer:
+    """Database contents window that only materializes the visible rows
+
+    Rows are fetched from the database in keyset-paginated pages. The
+    Treeview holds one item per visible line and the items are reused
+    while scrolling; a small cache of rows around the visible window
+    serves as prefetch margin.
+    """
+
+    PAGE_SIZE = 200  # Rows fetched per database query
+    PREFETCH = 50  # Rows kept above and below the visible window
+    CACHE_LIMIT = 1000  # Maximum number of cached rows
+    ROW_HEIGHT = 20  # Fallback row height in pixels
+
+    def __init__(self, root, database, export_callback=None, log_callback=None):
+        """Create the window and load the first page"""
+        self.database = database
+        self.export_callback = export_callback
+        self.log_callback = log_callback
+
+        self.filters = None
+        self.total = 0
+        self.id_range = None  # (oldest id, newest id) of the filtered rows
+        self.first = 0  # Index of the first visible row
+        self.visible = 1  # Number of rows that fit into the Treeview
+        self.cache_start = 0  # Index of self.cache[0]
+        self.cache = []
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Database Contents")
+        self.window.geometry("800x600")
+
+        # Configure grid weights for resizing
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(0, weight=1)
+
+        self._create_controls()
+        self._create_tree()
+
+        # Load initial data
+        self.refresh()
+
+    def _create_controls(self):
+        """Create refresh, export and filter controls"""
+        control_frame = ttk.Frame(self.window)
+        control_frame.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+        control_frame.columnconfigure(6, weight=1)
+
+        refresh_btn = ttk.Button(control_frame, text="Refresh", command=self.refresh)
+        refresh_btn.grid(row=0, column=0, padx=5, pady=5)
+
+        export_btn = ttk.Button(
+            control_frame, text="Export to File", command=self._export
+        )
+        export_btn.grid(row=0, column=1, padx=5, pady=5)
+
+        # Export format and compression
+        self.format_box = ttk.Combobox(
+            control_frame, values=EXPORT_FORMATS, width=7, state="readonly"
+        )
+        self.format_box.set("json")
+        self.format_box.grid(row=0, column=2, padx=5, pady=5)
+
+        self.compression_box = ttk.Combobox(
+            control_frame,
+            values=["none"] + [name for name in COMPRESSIONS if name],
+            width=6,
+            state="readonly",
+        )
+        self.compression_box.set("none")
+        self.compression_box.grid(row=0, column=3, padx=5, pady=5)
+
+        self.count_label = ttk.Label(control_frame, text="")
+        self.count_label.grid(row=0, column=4, padx=20, pady=5)
+
+        ttk.Label(control_frame, text="Topic filter:").grid(
+            row=0, column=5, padx=5, pady=5
+        )
+        self.filter_entry = ttk.Entry(control_frame, width=30)
+        self.filter_entry.grid(row=0, column=6, padx=5, pady=5, sticky="ew")
+        self.filter_entry.bind("<Return>", lambda e: self._apply_filter())
+
+        filter_btn = ttk.Button(
+            control_frame, text="Apply", command=self._apply_filter
+        )
+        filter_btn.grid(row=0, column=7, padx=5, pady=5)
+
+    def _create_tree(self):
+        """Create the Treeview and its scrollbars"""
+        self.tree = ttk.Treeview(
+            self.window,
+            columns=("Timestamp", "Direction", "Topic", "Message"),
+            show="headings",
+            selectmode="browse",
+        )
+        self.tree.heading("Timestamp", text="Timestamp")
+        self.tree.heading("Direction", text="Direction")
+        self.tree.heading("Topic", text="Topic")
+        self.tree.heading("Message", text="Message")
+
+        # Configure column widths
+        self.tree.column("Timestamp", width=140)
+        self.tree.column("Direction", width=80)
+        self.tree.column("Topic", width=200)
+        self.tree.column("Message", width=350)
+
+        self.tree.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+
+        # The vertical scrollbar maps onto the whole table, not the items
+        self.v_scrollbar = ttk.Scrollbar(
+            self.window, orient="vertical", command=self._on_scrollbar
+        )
+        self.v_scrollbar.grid(row=0, column=1, sticky="ns")
+
+        h_scrollbar = ttk.Scrollbar(
+            self.window, orient="horizontal", command=self.tree.xview
+        )
+        h_scrollbar.grid(row=2, column=0, sticky="ew")
+        self.tree.configure(xscroll=h_scrollbar.set)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_to(self.first - 3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_to(self.first + 3))
+        self.tree.bind("<Prior>", lambda e: self._scroll_to(self.first - self.visible))
+        self.tree.bind("<Next>", lambda e: self._scroll_to(self.first + self.visible))
+        self.tree.bind("<Home>", lambda e: self._scroll_to(0))
+        self.tree.bind("<End>", lambda e: self._scroll_to(self.total))
+        self.tree.bind("<Up>", self._on_key_up)
+        self.tree.bind("<Down>", self._on_key_down)
+
+    def refresh(self):
+        """Reload the total and the visible rows from the database"""
+        try:
+            self.total = self.database.get_message_count(self.filters)
+            self.id_range = self._get_id_range()
+        except Exception as e:
+            self._log(f"Error refreshing database view: {e}")
+            return
+
+        self.cache = []
+        self.cache_start = 0
+        self.count_label.config(text=f"Total messages: {self.total}")
+        self._scroll_to(self.first)
+
+    def _apply_filter(self):
+        """Restrict the view to topics starting with the filter text"""
+        prefix = self.filter_entry.get().strip()
+        self.filters = {"topic_prefix": prefix} if prefix else None
+        self.first = 0
+        self.refresh()
+
+    def _export(self):
+        """Export the rows matching the current filter via the frontend"""
+        if self.export_callback:
+            compression = self.compression_box.get()
+            self.export_callback(
+                self.format_box.get(),
+                None if compression == "none" else compression,
+                self.filters,
+            )
+
+    def _log(self, message):
+        """Report a message to the main log"""
+        if self.log_callback:
+            self.log_callback(message)
+
+    def _scroll_to(self, first):
+        """Show the window of rows starting at index *first*"""
+        self.first = max(0, min(first, self.total - self.visible))
+        end = min(self.first + self.visible, self.total)
+
+        try:
+            self._ensure_rows(self.first, end)
+        except Exception as e:
+            self._log(f"Error refreshing database view: {e}")
+            return
+
+        rows = self.cache[self.first - self.cache_start : end - self.cache_start]
+        self._show_rows(rows)
+
+        if self.total:
+            self.v_scrollbar.set(self.first / self.total, end / self.total)
+        else:
+            self.v_scrollbar.set(0.0, 1.0)
+        return "break"
+
+    def _show_rows(self, records):
+        """Reuse the Treeview items to display Message *records*"""
+        items = self.tree.get_children()
+        for index, record in enumerate(records):
+            values = (
+                format_timestamp(record.timestamp),
+                str(record.direction),
+                record.topic,
+                record.text,
+            )
+            if index < len(items):
+                self.tree.item(items[index], values=values)
+            else:
+                self.tree.insert("", "end", values=values)
+        if len(items) > len(records):
+            self.tree.delete(*items[len(records) :])
+
+    def _get_id_range(self):
+        """Return (oldest id, newest id) of the filtered rows, or None"""
+        newest = self.database.get_messages_page(limit=1, filters=self.filters)
+        oldest = self.database.get_messages_page(
+            limit=1, filters=self.filters, order_desc=False
+        )
+        if not newest or not oldest:
+            return None
+        return oldest[0].id, newest[0].id
+
+    def _fetch_at(self, start, end):
+        """Fetch the rows from index *start* on with a keyset query
+
+        Rows are ordered newest first. The id at *start* is estimated from
+        the id range, so the position is approximate where ids have gaps;
+        the last rows are read from the oldest end. Returns (rows, index of
+        the first row).
+        """
+        limit = max(self.PAGE_SIZE, end - start)
+        if end >= self.total:
+            rows = self.database.get_messages_page(
+                limit=limit, filters=self.filters, order_desc=False
+            )
+            rows.reverse()
+            return rows, max(0, self.total - len(rows))
+        before_id = None
+        if start > 0 and self.id_range is not None:
+            oldest, newest = self.id_range
+            key = newest - (newest - oldest) * start // max(1, self.total - 1)
+            # Rows with m.id <= key
+            before_id = key + 1
+        rows = self.database.get_messages_page(before_id, limit, self.filters)
+        return rows, start
+
+    def _ensure_rows(self, start, end):
+        """Make sure rows [start, end) are cached, plus the prefetch margin"""
+        if start >= end:
+            return
+        cache_end = self.cache_start + len(self.cache)
+        want_start = max(0, start - self.PREFETCH)
+        want_end = min(self.total, end + self.PREFETCH)
+
+        if not self.cache or want_end < self.cache_start or want_start > cache_end:
+            # Jump far away from the cached rows: one keyset query at the
+            # estimated id of the position
+            self.cache, self.cache_start = self._fetch_at(want_start, want_end)
+            return
+
+        # Extend forward with a keyset query after the last cached row
+        while self.cache_start + len(self.cache) < want_end:
+            rows = self.database.get_messages_page(
+                self.cache[-1].id, self.PAGE_SIZE, self.filters
+            )
+            if not rows:
+                break
+            self.cache.extend(rows)
+
+        # Extend backward with a keyset query before the first cached row
+        while self.cache_start > want_start:
+            rows = self.database.get_messages_page(
+                self.cache[0].id, self.PAGE_SIZE, self.filters, order_desc=False
+            )
+            if not rows:
+                self.cache_start = 0
+                break
+            rows.reverse()
+            self.cache[:0] = rows
+            self.cache_start = max(0, self.cache_start - len(rows))
+
+        # Drop cached rows far away from the visible window
+        if len(self.cache) > self.CACHE_LIMIT:
+            drop = max(0, want_start - self.cache_start)
+            del self.cache[:drop]
+            self.cache_start += drop
+            del self.cache[want_end - self.cache_start + self.PAGE_SIZE :]
+
+    def _on_resize(self, event):
+        """Recalculate how many rows fit into the Treeview"""
+        row_height = ttk.Style().lookup("Treeview", "rowheight")
+        try:
+            row_height = int(row_height)
+        except (TypeError, ValueError):
+            row_height = self.ROW_HEIGHT
+        # Leave room for the heading row
+        visible = max(1, event.height // row_height - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self._scroll_to(self.first)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        """Translate scrollbar commands into row indexes"""
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * self.total))
+        elif action == "scroll":
+            step = self.visible if unit == "pages" else 1
+            self._scroll_to(self.first + int(amount) * step)
+
+    def _on_mousewheel(self, event):
+        """Scroll three rows per wheel step"""
+        return self._scroll_to(self.first - 3 * int(event.delta / 120))
+
+    def _on_key_up(self, event):
+        """Move the selection up, scrolling when at the first visible row"""
+        items = self.tree.get_children()
+        selection = self.tree.selection()
+        if items and (not selection or selection[0] == items[0]):
+            self._scroll_to(self.first - 1)
+            self.tree.selection_set(items[0])
+            return "break"
+
+    def _on_key_down(self, event):
+        """Move the selection down, scrolling when at the last visible row"""
+        items = self.tree.get_children()
+        selection = self.tree.selection()
+        if items and (not selection or selection[0] == items[-1]):
+            self._scroll_to(self.first + 1)
+            self.tree.selection_set(self.tree.get_children()[-1])
+            return "break"
@@ -0,0 +1,177 @@
+import csv
+import gzip
+import json
+import lzma
+import os
+import threading
+from datetime import datetime
+from database import format_timestamp
+
+EXPORT_FORMATS = ("json", "ndjson", "csv")
+
+# Compression name -> (open function, file extension)
+COMPRESSIONS = {
+    None: (open, ""),
+    "gzip": (gzip.open, ".gz"),
+    "lzma": (lzma.open, ".xz"),
+}
+
+
+class MessageExporter:
+    """Streams messages from the database into JSON, NDJSON or CSV files"""
+
+    def __init__(self, database, chunk_size=5000):
+        """Initialize exporter for *database*"""
+        self.database = database
+        self.chunk_size = chunk_size
+
+    def export(
+        self,
+        filepath=None,
+        fmt="json",
+        compression=None,
+        filters=None,
+        progress_callback=None,
+        cancel_event=None,
+    ):
+        """Write all matching messages to *filepath* and return the path
+
+        Rows are read and written chunk by chunk, so memory use does not
+        depend on the size of the database. *filters* takes the same keys
+        as MQTTDatabase.get_messages_page. *progress_callback* is called
+        as progress_callback(written, total) after every chunk. Setting
+        *cancel_event* stops the export and removes the partial file.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        open_file, extension = COMPRESSIONS[compression]
+
+        # Generate filename if not provided
+        if not filepath:
+            filename = (
+                f"mqtt_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                f".{fmt}{extension}"
+            )
+            filepath = os.path.join("./Storage/", filename)
+
+        # Ensure directory exists
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+
+        try:
+            total = self.database.get_message_count(filters)
+            written = 0
+            with open_file(filepath, "wt", encoding="utf-8", newline="") as f:
+                writer = self._create_writer(fmt, f)
+                writer.begin()
+                for rows in self.database.stream_messages(filters, self.chunk_size):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise InterruptedError("Export cancelled")
+                    writer.write_rows(rows)
+                    written += len(rows)
+                    if progress_callback:
+                        progress_callback(written, max(total, written))
+                writer.end()
+            return filepath
+
+        except Exception as e:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            raise Exception(f"Failed to export database: {e}")
+
+    def export_async(self, done_callback=None, **kwargs):
+        """Run export() on a background thread
+
+        *done_callback* is called from that thread as done_callback(filepath,
+        error) once the export has finished. Returns the started thread.
+        """
+
+        def run():
+            try:
+                filepath = self.export(**kwargs)
+            except Exception as e:
+                if done_callback:
+                    done_callback(None, e)
+                return
+            if done_callback:
+                done_callback(filepath, None)
+
+        thread = threading.Thread(target=run, name="mqtt-export", daemon=True)
+        thread.start()
+        return thread
+
+    def _create_writer(self, fmt, f):
+        """Create the row writer for *fmt*"""
+        if fmt == "csv":
+            return _CsvWriter(f)
+        if fmt == "ndjson":
+            return _NdjsonWriter(f)
+        return _JsonArrayWriter(f)
+
+
+def _row_to_dict(row):
+    """Convert a message row into the exported record"""
+    message_id, ts, topic, message, direction = row
+    return {
+        "timestamp": format_timestamp(ts, "%Y-%m-%d %H:%M:%S.%f"),
+        "topic": topic,
+        "message": message,
+        "direction": direction,
+    }
+
+
+class _JsonArrayWriter:
+    """Writes a JSON array with one record per line"""
+
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+
+    def begin(self):
+        self.f.write("[")
+
+    def write_rows(self, rows):
+        parts = []
+        for row in rows:
+            parts.append("\n  " if self.first else ",\n  ")
+            parts.append(json.dumps(_row_to_dict(row)))
+            self.first = False
+        self.f.write("".join(parts))
+
+    def end(self):
+        self.f.write("\n]\n" if not self.first else "]\n")
+
+
+class _NdjsonWriter:
+    """Writes newline-delimited JSON"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def begin(self):
+        pass
+
+    def write_rows(self, rows):
+        self.f.write("".join(json.dumps(_row_to_dict(row)) + "\n" for row in rows))
+
+    def end(self):
+        pass
+
+
+class _CsvWriter:
+    """Writes CSV with a header row"""
+
+    FIELDS = ["timestamp", "topic", "message", "direction"]
+
+    def __init__(self, f):
+        self.writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+
+    def begin(self):
+        self.writer.writeheader()
+
+    def write_rows(self, rows):
+        self.writer.writerows(_row_to_dict(row) for row in rows)
+
+    def end(self):
+        pass
@@ -1,12 +1,40 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 import os
+import threading
+import time
+from collections import deque
 from datetime import datetime
 from backend import MQTTBackend
+from chart_viewer import ChartViewer
+from database import format_timestamp
+from db_viewer import DatabaseViewer
+from exporter import MessageExporter
+from metrics import registry as metrics
+from metrics_viewer import MetricsViewer
+from probe_viewer import ProbeViewer
+from records import Direction
+from ringbuffer import MessageRingBuffer
+from state_viewer import StateViewer
+from statistics_viewer import StatisticsViewer
 from functools import partial
 
 
 class MQTTFrontend:
+    # Interval of the UI drain tick and maximum lines inserted per tick
+    UI_TICK_MS = 50
+    UI_MAX_LINES_PER_TICK = 5000
+
+    # Message log limits: records kept in memory, lines kept in the widget,
+    # lines removed at once when trimming and rows paged in from the database
+    MESSAGE_BUFFER_CAPACITY = 10000
+    LOG_MAX_LINES = 2000
+    LOG_TRIM_CHUNK = 200
+    HISTORY_PAGE_SIZE = 200
+
+    # Maximum number of results shown by the search frame
+    SEARCH_LIMIT = 500
+
     def __init__(self, root):
         """Initialize MQTT Explorer GUI"""
         self.root = root
@@ -28,7 +56,25 @@ class MQTTFrontend:
 
         # UI state
         self.autoscroll_enabled = True
-        self.subscribed_switch = False
+        self._subscription_filters = []
+
+        # Events from the MQTT network thread, drained by the Tk main loop.
+        # deque.append/popleft are atomic, so no additional lock is needed.
+        self.ui_queue = deque()
+        self._ui_after_id = None
+        self._ui_stats_started = time.monotonic()
+        self._ui_stats_ticks = 0
+        self._ui_stats_lines = 0
+        self._ui_drain_timing = metrics.timing("ui_drain")
+        metrics.gauge("ui_queue_depth", lambda frontend: len(frontend.ui_queue), self)
+
+        # Recent messages are the source of truth for the log widget.
+        # _line_ids holds the message id (or None) of every widget line.
+        self.message_buffer = MessageRingBuffer(self.MESSAGE_BUFFER_CAPACITY)
+        self._line_ids = deque()
+        self._history_exhausted = False
+        self._history_loading = False
+        self._search_seq = 0
 
         # Create UI components
         self._create_connection_frame()
@@ -37,6 +83,9 @@ class MQTTFrontend:
         self._create_messages_frame()
         self._create_search_frame()  # <-- Add this line
 
+        # Start delivering queued messages to the UI
+        self._ui_after_id = self.root.after(self.UI_TICK_MS, self._drain_ui_queue)
+
     def _create_connection_frame(self):
         """Create connection settings frame"""
         self.conn_frame = ttk.LabelFrame(
@@ -92,6 +141,14 @@ class MQTTFrontend:
         self.topic.set("#")
         self.topic.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
 
+        # Quality of service for new subscriptions
+        ttk.Label(self.sub_frame, text="QoS:").grid(row=0, column=2, padx=5, pady=5)
+        self.qos = ttk.Combobox(
+            self.sub_frame, values=("0", "1", "2"), width=3, state="readonly"
+        )
+        self.qos.set("0")
+        self.qos.grid(row=0, column=3, padx=5, pady=5)
+
         # Subscribe button
         self.subscribe_btn = ttk.Button(
             self.sub_frame, text="Subscribe", command=self._subscribe
@@ -105,6 +162,14 @@ class MQTTFrontend:
         self.unsubscribe_btn.grid(row=1, column=2, columnspan=2, pady=5, sticky="ew")
         self._bind_enter([self.topic], self._subscribe)
 
+        # Active subscriptions, resubscribed automatically after reconnects
+        self.subscription_list = tk.Listbox(
+            self.sub_frame, height=3, selectmode=tk.EXTENDED
+        )
+        self.subscription_list.grid(
+            row=2, column=0, columnspan=4, padx=5, pady=5, sticky="ew"
+        )
+
     def _create_publish_frame(self):
         """Create publish frame"""
         self.pub_frame = ttk.LabelFrame(self.root, text="Publish", padding="5")
@@ -124,6 +189,11 @@ class MQTTFrontend:
             self.pub_frame, text="Publish", command=self._publish
         )
         self.publish_btn.grid(row=2, column=0, columnspan=2, pady=5, sticky="ew")
+
+        self.probe_btn = ttk.Button(
+            self.pub_frame, text="Latency Probe", command=self._show_probe_window
+        )
+        self.probe_btn.grid(row=3, column=0, columnspan=2, pady=5, sticky="ew")
         self._bind_enter([self.pub_topic, self.pub_message], self._publish)
         self.pub_topic.bind("<Return>", lambda e: self._focus(self.pub_message))
         self.pub_message.bind("<Return>", lambda e: self._publish())
@@ -138,7 +208,7 @@ class MQTTFrontend:
         # Button frame for message controls
         self.msg_btn_frame = ttk.Frame(self.msg_frame)
         self.msg_btn_frame.grid(row=1, column=0, padx=5, pady=5, sticky="ew")
-        for i in range(5):
+        for i in range(9):
             self.msg_btn_frame.columnconfigure(i, weight=1)
 
         self.clear_msg_btn = ttk.Button(
@@ -170,6 +240,30 @@ class MQTTFrontend:
         )
         self.toggle_scroll_btn.grid(row=0, column=4, padx=5, pady=5, sticky="ew")
 
+        self.metrics_btn = ttk.Button(
+            self.msg_btn_frame, text="Metrics", command=self._show_metrics_window
+        )
+        self.metrics_btn.grid(row=0, column=5, padx=5, pady=5, sticky="ew")
+
+        self.state_btn = ttk.Button(
+            self.msg_btn_frame, text="Current State", command=self._show_state_window
+        )
+        self.state_btn.grid(row=0, column=6, padx=5, pady=5, sticky="ew")
+
+        self.charts_btn = ttk.Button(
+            self.msg_btn_frame, text="Charts", command=self._show_charts_window
+        )
+        self.charts_btn.grid(row=0, column=7, padx=5, pady=5, sticky="ew")
+
+        self.statistics_btn = ttk.Button(
+            self.msg_btn_frame, text="Statistics", command=self._show_statistics_window
+        )
+        self.statistics_btn.grid(row=0, column=8, padx=5, pady=5, sticky="ew")
+
+        # UI delivery statistics
+        self.ui_stats_label = ttk.Label(self.msg_btn_frame, text="")
+        self.ui_stats_label.grid(row=1, column=0, columnspan=9, padx=5, sticky="w")
+
         self.messages = scrolledtext.ScrolledText(self.msg_frame, height=10, width=100)
         self.messages.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
 
@@ -178,7 +272,10 @@ class MQTTFrontend:
         self.messages.bind("<Button-4>", self.check_scroll_position)
         self.messages.bind("<Button-5>", self.check_scroll_position)
         self.messages.bind("<KeyRelease>", self.check_scroll_position)
-        self.messages.bind("<Motion>", self.check_scroll_position)
+        self.messages.vbar.bind("<B1-Motion>", self.check_scroll_position, add="+")
+        self.messages.vbar.bind(
+            "<ButtonRelease-1>", self.check_scroll_position, add="+"
+        )
 
     def _create_search_frame(self):
         """Create search frame for topics and messages"""
@@ -201,6 +298,13 @@ class MQTTFrontend:
         )
         self.clear_search_btn.grid(row=0, column=3, padx=5, pady=5)
 
+        ttk.Label(self.search_frame, text="Topic prefix:").grid(
+            row=1, column=0, padx=5, pady=5
+        )
+        self.search_topic_entry = ttk.Entry(self.search_frame, width=30)
+        self.search_topic_entry.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        self.search_topic_entry.bind("<Return>", lambda e: self._search_messages())
+
     def _connect(self):
         """Handle connect button click"""
         broker = self.broker.get()
@@ -238,47 +342,78 @@ class MQTTFrontend:
         """Handle disconnect button click"""
         if self.backend.disconnect():
             self._log_message("Disconnected from broker")
-            # Reset subscription state when disconnecting
-            self.subscribed_switch = False
-            self.backend.clear_current_topic()
         else:
             self._log_message("Error: Not connected to broker")
 
     def _subscribe(self):
-        """Handle subscribe button click"""
-        topic = self.topic.get()
-
-        # Unsubscribe from previous topic if already subscribed
-        if self.subscribed_switch:
-            current_topic = self.backend.get_current_topic()
-            if current_topic:
-                self.backend.unsubscribe(current_topic)
-                self._log_message(f"Unsubscribed from previous topic: {current_topic}")
-
-        # Store and subscribe to new topic
-        if self.backend.store_topic_to_file(topic):
+        """Handle subscribe button click
+
+        Several filters can be given separated by commas; they are sent in
+        one SUBSCRIBE packet and added to the existing subscriptions.
+        """
+        topics = [t.strip() for t in self.topic.get().split(",") if t.strip()]
+        if not topics:
+            return
+        qos = int(self.qos.get())
+
+        # Store and subscribe to new topics
+        stored = False
+        for topic in topics:
+            stored = self.backend.store_topic_to_file(topic) or stored
+        if stored:
             self._refresh_topic_comboboxes()
-        if self.backend.subscribe(topic):
-            self._log_message(f"Subscribed to {topic}")
-            self.subscribed_switch = True
+        if self.backend.subscribe_many([(topic, qos) for topic in topics]):
+            self._log_message(f"Subscribed to {', '.join(topics)} (QoS {qos})")
         else:
-            self._log_message(f"Failed to subscribe to {topic}")
-            self.subscribed_switch = False
+            self._log_message(f"Failed to subscribe to {', '.join(topics)}")
+        self._refresh_subscription_list()
 
     def _unsubscribe(self):
-        """Handle unsubscribe button click"""
-        # Get the current topic from the backend if available
-        current_topic = self.backend.get_current_topic()
-
-        # If no current topic, use the topic from the UI
-        topic_to_unsubscribe = current_topic if current_topic else self.topic.get()
+        """Handle unsubscribe button click
+
+        Unsubscribes the filters selected in the list, or the filters in the
+        topic field if nothing is selected.
+        """
+        selection = self.subscription_list.curselection()
+        if selection:
+            topics = [self._subscription_filters[i] for i in selection]
+        else:
+            topics = [t.strip() for t in self.topic.get().split(",") if t.strip()]
+        if not topics:
+            return
 
-        if self.backend.unsubscribe(topic_to_unsubscribe):
-            self._log_message(f"Unsubscribed from {topic_to_unsubscribe}")
-            # Reset the subscribed state
-            self.subscribed_switch = False
+        if self.backend.unsubscribe_many(topics):
+            self._log_message(f"Unsubscribed from {', '.join(topics)}")
         else:
-            self._log_message(f"Failed to unsubscribe from {topic_to_unsubscribe}")
+            self._log_message(f"Failed to unsubscribe from {', '.join(topics)}")
+        self._refresh_subscription_list()
+
+    def _refresh_subscription_list(self):
+        """Show the active subscriptions with their message counters"""
+        subscriptions = self.backend.get_subscriptions()
+        filters = sorted(topic for topic, _ in subscriptions.filters())
+        entries = []
+        for topic in filters:
+            subscription = subscriptions.get(topic)
+            if subscription is not None:
+                entries.append(
+                    f"{topic}  (QoS {subscription.qos}, "
+                    f"{subscription.message_count} messages)"
+                )
+
+        # Keep the selection while the counters refresh
+        selected = {
+            self._subscription_filters[i]
+            for i in self.subscription_list.curselection()
+            if i < len(self._subscription_filters)
+        }
+        self._subscription_filters = filters
+        self.subscription_list.delete(0, tk.END)
+        if entries:
+            self.subscription_list.insert(tk.END, *entries)
+        for index, topic in enumerate(filters):
+            if topic in selected:
+                self.subscription_list.selection_set(index)
 
     def _publish(self):
         """Handle publish button click"""
@@ -293,133 +428,102 @@ class MQTTFrontend:
                 "Die Antwort auf die ultimative Frage des Lebens, des Universums und allem ist: 42",
             )
 
-        if self.backend.publish(topic, message):
-            self._log_message(f"Published to {topic}: {message}")
+        # The record saved by the backend, so the log line has its id
+        sent = self.backend.publish(topic, message)
+        if sent:
+            self.message_buffer.append(sent)
+            self._append_lines([(self._format_record(sent), sent.id)])
 
     def _clear_messages(self):
         """Clear messages display"""
-        self.messages.delete("1.0", tk.END)
+        self.message_buffer.clear()
+        self._reset_log()
 
     def _clear_database(self):
         """Clear the messages database"""
         try:
             self.backend.get_database().clear_database()
+            self.backend.get_last_values().clear()
             self._log_message("Database cleared")
         except Exception as e:
             self._log_message(f"Error clearing database: {e}")
 
     def _show_database_window(self):
         """Show the database contents in a new window"""
-        db_window = tk.Toplevel(self.root)
-        db_window.title("Database Contents")
-        db_window.geometry("800x600")
-
-        # Configure grid weights for resizing
-        db_window.columnconfigure(0, weight=1)
-        db_window.rowconfigure(0, weight=1)
-
-        # Create frame for controls
-        control_frame = ttk.Frame(db_window)
-        control_frame.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
-
-        # Add refresh button
-        refresh_btn = ttk.Button(
-            control_frame,
-            text="Refresh",
-            command=lambda: self._refresh_database_view(tree, count_label),
+        DatabaseViewer(
+            self.root,
+            self.backend.get_database(),
+            export_callback=self._export_database,
+            log_callback=self._log_message,
         )
-        refresh_btn.grid(row=0, column=0, padx=5, pady=5)
 
-        # Add export button
-        export_btn = ttk.Button(
-            control_frame, text="Export to File", command=self._export_database
-        )
-        export_btn.grid(row=0, column=1, padx=5, pady=5)
-
-        # Add count label
-        count_label = ttk.Label(control_frame, text="")
-        count_label.grid(row=0, column=2, padx=20, pady=5)
-        tree = ttk.Treeview(
-            db_window,
-            columns=("Timestamp", "Direction", "Topic", "Message"),
-            show="headings",
+    def _show_metrics_window(self):
+        """Show the instrumentation counters and timings in a new window"""
+        MetricsViewer(self.root, metrics, log_callback=self._log_message)
+
+    def _show_state_window(self):
+        """Show the last received value of every topic in a new window"""
+        StateViewer(self.root, self.backend.get_last_values())
+
+    def _show_charts_window(self):
+        """Show live charts of the numeric payloads in a new window"""
+        ChartViewer(self.root, self.backend.get_timeseries())
+
+    def _show_statistics_window(self):
+        """Show topic statistics and message rates of the database in a new window"""
+        StatisticsViewer(self.root, self.backend.get_database())
+
+    def _show_probe_window(self):
+        """Show the latency probe statistics in a new window"""
+        ProbeViewer(
+            self.root,
+            self.backend.get_probe_monitor(),
+            log_callback=self._log_message,
         )
-        tree.heading("Timestamp", text="Timestamp")
-        tree.heading("Direction", text="Direction")
-        tree.heading("Topic", text="Topic")
-        tree.heading("Message", text="Message")
-
-        # Configure column widths
-        tree.column("Timestamp", width=100)
-        tree.column("Direction", width=80)
-        tree.column("Topic", width=200)
-        tree.column("Message", width=350)
-
-        tree.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
-
-        # Add scrollbars
-        v_scrollbar = ttk.Scrollbar(db_window, orient="vertical", command=tree.yview)
-        v_scrollbar.grid(row=0, column=1, sticky="ns")
-        tree.configure(yscroll=v_scrollbar.set)
-
-        h_scrollbar = ttk.Scrollbar(db_window, orient="horizontal", command=tree.xview)
-        h_scrollbar.grid(row=2, column=0, sticky="ew")
-        tree.configure(xscroll=h_scrollbar.set)
-
-        # Load initial data
-        self._refresh_database_view(tree, count_label)
-
-    def _refresh_database_view(self, tree, count_label=None):
-        """Refresh the database view with current data"""
-        # Clear existing items
-        for item in tree.get_children():
-            tree.delete(item)  # Insert data into the treeview
-        try:
-            rows = self.backend.get_database().get_all_messages()
-            for row in rows:
-                # Reorder columns: (timestamp, topic, message, direction) -> (timestamp, direction, topic, message)
-                if len(row) == 4:
-                    timestamp, topic, message, direction = row
-                    reordered_row = (timestamp, direction, topic, message)
-                    tree.insert("", "end", values=reordered_row)
-                else:
-                    # Handle case where direction column might not exist (backward compatibility)
-                    tree.insert("", "end", values=row)
-
-            # Update count if label provided
-            if count_label:
-                count_label.config(text=f"Total messages: {len(rows)}")
-        except Exception as e:
-            self._log_message(f"Error refreshing database view: {e}")
 
-    def _export_database(self):
-        """Export database contents to a JSON file"""
-        try:
-            filepath = self.backend.get_database().export_to_json()
-            filename = os.path.basename(filepath)
-            self._log_message(f"Database exported to {filename}")
-        except Exception as e:
-            self._log_message(f"Failed to export database: {e}")
+    def _export_database(self, fmt="json", compression=None, filters=None):
+        """Export database contents to a file on a background thread"""
+        exporter = MessageExporter(self.backend.get_database())
+        progress = {"percent": -1}
+
+        def on_progress(written, total):
+            # Runs on the export thread, report every 10 percent
+            percent = written * 100 // total if total else 100
+            if percent // 10 > progress["percent"] // 10:
+                progress["percent"] = percent
+                self.ui_queue.append(
+                    ("log", f"Exporting: {written}/{total} messages ({percent}%)")
+                )
+
+        def on_done(filepath, error):
+            if error:
+                self.ui_queue.append(("log", str(error)))
+            else:
+                filename = os.path.basename(filepath)
+                self.ui_queue.append(("log", f"Database exported to {filename}"))
+
+        self._log_message(f"Exporting database as {fmt}...")
+        exporter.export_async(
+            done_callback=on_done,
+            fmt=fmt,
+            compression=compression,
+            filters=filters,
+            progress_callback=on_progress,
+        )
 
     def _show_database_in_ui(self):
         """Show recent database entries in the main UI"""
         try:
-            rows = self.backend.get_database().get_recent_messages(10)
+            records = self.backend.get_database().get_recent_messages(10)
 
             self._log_message("\n--- Recent Database Entries ---\n", False)
-            for row in rows:
-                if len(row) == 4:
-                    # New format with direction
-                    timestamp, topic, message, direction = row
-                    self._log_message(
-                        f"[{timestamp}] {direction } {topic}: {message}",
-                        False,
-                        True,
-                    )
-                else:
-                    # Old format without direction (backward compatibility)
-                    timestamp, topic, message = row
-                    self._log_message(f"[{timestamp}] {topic}: {message}", False, True)
+            for record in records:
+                self._log_message(
+                    f"[{format_timestamp(record.timestamp)}] {record.direction}"
+                    f" {record.topic}: {record.text}",
+                    False,
+                    True,
+                )
             self._log_message("--- End Database Entries ---\n", False)
 
         except Exception as e:
@@ -440,6 +544,10 @@ class MQTTFrontend:
         # Get current position
         top, bottom = self.messages.yview()
 
+        # Page in older messages from the database when scrolled to the top
+        if top <= 0.0 and bottom < 1.0 and not self._history_exhausted:
+            self._load_older_messages()
+
         # If near the bottom (5%), enable autoscroll
         if bottom >= 0.99:
             if not self.autoscroll_enabled:
@@ -463,30 +571,191 @@ class MQTTFrontend:
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             else:
                 current_time = datetime.now().strftime("%H:%M:%S")
-            self.messages.insert("end", f"[{current_time}] {message}\n")
+            self._append_lines([(f"[{current_time}] {message}", None)])
         else:
-            self.messages.insert("end", f"{message}\n")
+            self._append_lines([(message, None)])
+
+    def _append_lines(self, entries):
+        """Append (text, message_id) entries with a single insert"""
+        for text, message_id in entries:
+            self._line_ids.extend([message_id] * (text.count("\n") + 1))
+        self.messages.insert("end", "\n".join(text for text, _ in entries) + "\n")
+        self._trim_log()
         if self.autoscroll_enabled:
             self.messages.see("end")
 
-    def _on_message_received(self, topic, message, timestamp):
-        """Callback for when a message is received"""
-        self._log_message(f"{topic}: {message}")
+    def _trim_log(self):
+        """Remove the oldest widget lines in bulk once the limit is exceeded"""
+        excess = len(self._line_ids) - self.LOG_MAX_LINES
+        if excess < self.LOG_TRIM_CHUNK:
+            return
+        # Don't move the text under a user who is reading older lines,
+        # unless the widget has grown to twice its limit
+        if not self.autoscroll_enabled and excess < self.LOG_MAX_LINES:
+            return
+
+        self.messages.delete("1.0", f"{excess + 1}.0")
+        for _ in range(excess):
+            self._line_ids.popleft()
+        self._history_exhausted = False
+
+    def _reset_log(self):
+        """Remove every line from the message widget"""
+        self.messages.delete("1.0", tk.END)
+        self._line_ids.clear()
+        self._history_exhausted = False
+
+    def _render_buffer(self):
+        """Rebuild the message widget from the message buffer"""
+        self._reset_log()
+        records = self.message_buffer.latest(self.LOG_MAX_LINES)
+        if records:
+            self._append_lines(
+                [(self._format_record(record), record.id) for record in records]
+            )
+
+    def _format_record(self, record):
+        """Format a live message record as a log line"""
+        time_str = format_timestamp(record.timestamp, "%H:%M:%S")
+        if record.direction is Direction.SENT:
+            return f"[{time_str}] Published to {record.topic}: {record.preview()}"
+        return f"[{time_str}] {record.topic}: {record.preview()}"
+
+    def _load_older_messages(self):
+        """Fetch the page of stored messages preceding the oldest line
+
+        The query runs on a background thread, the page is inserted by
+        _show_older_messages() once the UI queue delivers it.
+        """
+        if self._history_loading:
+            return
+        self._history_loading = True
+        before_id = next((i for i in self._line_ids if i is not None), None)
+        threading.Thread(
+            target=self._fetch_older_messages,
+            args=(before_id,),
+            name="mqtt-history",
+            daemon=True,
+        ).start()
+
+    def _fetch_older_messages(self, before_id):
+        """Query a page of older messages (runs on a background thread)"""
+        try:
+            records = self.backend.get_database().get_messages_before(
+                before_id, self.HISTORY_PAGE_SIZE
+            )
+        except Exception as e:
+            self.ui_queue.append(("history", before_id, None, str(e)))
+            return
+        self.ui_queue.append(("history", before_id, records, None))
+
+    def _show_older_messages(self, before_id, records, error):
+        """Insert a fetched page of older messages at the top of the log"""
+        self._history_loading = False
+        # The log was reset or trimmed while the page was loading
+        oldest_id = next((i for i in self._line_ids if i is not None), None)
+        if self._history_exhausted or oldest_id != before_id:
+            return
+        if error is not None:
+            self._history_exhausted = True
+            self._log_message(f"Failed to load older messages: {error}")
+            return
+
+        if len(records) < self.HISTORY_PAGE_SIZE:
+            self._history_exhausted = True
+        if not records:
+            return
+
+        lines = []
+        line_ids = []
+        for record in reversed(records):
+            text = (
+                f"[{format_timestamp(record.timestamp)}] {record.direction}"
+                f" {record.topic}: {record.preview()}"
+            )
+            lines.append(text)
+            line_ids.extend([record.id] * (text.count("\n") + 1))
+
+        self.messages.insert("1.0", "\n".join(lines) + "\n")
+        self._line_ids.extendleft(reversed(line_ids))
+        # Keep the previously first line at the top of the view
+        self.messages.yview(f"{len(line_ids) + 1}.0")
+
+    def _on_message_received(self, record):
+        """Callback for when a message is received (runs on the MQTT thread)"""
+        self.ui_queue.append(("message", record))
 
     def _on_status_changed(self, status, message):
-        """Callback for when connection status changes"""
+        """Callback for when connection status changes (may run on MQTT thread)"""
+        self.ui_queue.append(("status", status, message))
+
+    def _apply_status(self, status, message):
+        """Update the status label, returns the log line for the status"""
         if status == "connected":
             self.status_label.config(text="Status: Connected", foreground="green")
-            self._log_message(message)
         elif status == "disconnected":
             self.status_label.config(text="Status: Disconnected", foreground="red")
-            self._log_message(message)
-            # Reset subscription state when disconnected
-            self.subscribed_switch = False
-            self.backend.clear_current_topic()
         elif status == "error":
             self.status_label.config(text="Status: Error", foreground="red")
-            self._log_message(message)
+        return f"[{datetime.now().strftime('%H:%M:%S')}] {message}"
+
+    def _drain_ui_queue(self):
+        """Insert all pending lines with a single insert and scroll once"""
+        start = time.perf_counter_ns()
+        lines = []
+        records = []
+        queue = self.ui_queue
+        for _ in range(min(len(queue), self.UI_MAX_LINES_PER_TICK)):
+            item = queue.popleft()
+            if item[0] == "status":
+                lines.append((self._apply_status(item[1], item[2]), None))
+            elif item[0] == "search":
+                # Search results replace the log, show earlier lines first
+                if lines:
+                    self._append_lines(lines)
+                    lines = []
+                self._show_search_results(*item[1:])
+            elif item[0] == "history":
+                self._show_older_messages(*item[1:])
+            elif item[0] == "log":
+                current_time = datetime.now().strftime("%H:%M:%S")
+                lines.append((f"[{current_time}] {item[1]}", None))
+            else:
+                record = item[1]
+                records.append(record)
+                lines.append((self._format_record(record), record.id))
+
+        if records:
+            self.message_buffer.extend(records)
+        if lines:
+            self._append_lines(lines)
+            metrics.inc("ui_lines", len(lines))
+        self._ui_drain_timing.record(time.perf_counter_ns() - start)
+
+        self._update_ui_stats(len(lines))
+        self._ui_after_id = self.root.after(self.UI_TICK_MS, self._drain_ui_queue)
+
+    def _update_ui_stats(self, line_count):
+        """Track ticks and lines per tick, refresh the label once per second"""
+        self._ui_stats_ticks += 1
+        self._ui_stats_lines += line_count
+        elapsed = time.monotonic() - self._ui_stats_started
+        if elapsed < 1.0:
+            return
+
+        ticks_per_sec = self._ui_stats_ticks / elapsed
+        lines_per_tick = self._ui_stats_lines / self._ui_stats_ticks
+        lines_per_sec = self._ui_stats_lines / elapsed
+        self.ui_stats_label.config(
+            text=(
+                f"UI: {ticks_per_sec:.1f} ticks/s, {lines_per_tick:.1f} lines/tick, "
+                f"{lines_per_sec:.0f} lines/s, backlog {len(self.ui_queue)}"
+            )
+        )
+        self._ui_stats_started = time.monotonic()
+        self._ui_stats_ticks = 0
+        self._ui_stats_lines = 0
+        self._refresh_subscription_list()
 
     def _bind_enter(self, widgets, callback):
         """Bind the Return key on every widget in *widgets* to *callback*."""
@@ -515,6 +784,13 @@ class MQTTFrontend:
 
     def close(self):
         """Close the application"""
+        metrics.unregister(self)
+        if getattr(self, "_ui_after_id", None) is not None:
+            try:
+                self.root.after_cancel(self._ui_after_id)
+            except tk.TclError:
+                pass
+            self._ui_after_id = None
         self.backend.close()
 
     def __del__(self):
@@ -522,28 +798,62 @@ class MQTTFrontend:
         self.close()
 
     def _search_messages(self):
-        """Search for topics or messages in the displayed messages"""
-        query = self.search_entry.get().strip().lower()
+        """Search stored topics and messages on a background thread"""
+        query = self.search_entry.get().strip()
         if not query:
             return
+        topic_filter = self.search_topic_entry.get().strip() or None
+
+        # Only the results of the latest search are shown
+        self._search_seq += 1
+        threading.Thread(
+            target=self._run_search,
+            args=(self._search_seq, query, topic_filter),
+            name="mqtt-search",
+            daemon=True,
+        ).start()
+
+    def _run_search(self, seq, query, topic_filter):
+        """Query the full-text index (runs on a background thread)"""
+        start = time.perf_counter()
+        try:
+            rows = self.backend.get_database().search(
+                query, topic_filter=topic_filter, limit=self.SEARCH_LIMIT
+            )
+        except Exception as e:
+            self.ui_queue.append(("log", f"Search failed: {e}"))
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.ui_queue.append(("search", seq, query, rows, elapsed_ms))
 
-        # Get all text from the messages widget
-        all_text = self.messages.get("1.0", tk.END)
-        lines = all_text.splitlines()
-
-        # Filter lines that contain the query
-        results = [line for line in lines if query in line.lower()]
+    def _show_search_results(self, seq, query, rows, elapsed_ms):
+        """Replace the message log with search results"""
+        if seq != self._search_seq:
+            return
 
-        # Show results in the messages widget
-        self.messages.delete("1.0", tk.END)
-        if results:
-            for line in results:
-                self.messages.insert(tk.END, line + "\n")
-            self._log_message(f"Search results for '{query}': {len(results)} found", show_time=False)
+        self._reset_log()
+        # Results are not contiguous, so don't page history in above them
+        self._history_exhausted = True
+        if rows:
+            self._append_lines(
+                [
+                    (
+                        f"[{format_timestamp(record.timestamp)}]"
+                        f" {record.direction} {record.topic}: {snippet}",
+                        None,
+                    )
+                    for record, snippet in rows
+                ]
+            )
+            self._log_message(
+                f"Search results for '{query}': {len(rows)} found"
+                f" in {elapsed_ms:.1f} ms",
+                show_time=False,
+            )
         else:
             self._log_message(f"No results found for '{query}'", show_time=False)
 
     def _clear_search(self):
-        """Clear search and show all messages again (if you want to reload from DB, adapt here)"""
-        self.messages.delete("1.0", tk.END)
-        self._log_message("Search cleared. Only new messages will be shown.", show_time=False)
+        """Clear search and show the buffered messages again"""
+        self._render_buffer()
+        self._log_message("Search cleared.", show_time=False)
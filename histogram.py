@@ -0,0 +1,124 @@
+import threading
+
+
+class LatencyHistogram:
+    """Log-linear histogram of integer values, in the style of HdrHistogram
+
+    Values below 2**precision_bits are counted exactly. Above that every
+    power of two is split into 2**(precision_bits - 1) buckets, so the
+    relative error of a percentile stays below 2**-(precision_bits - 1)
+    (0.8% by default) while the memory use grows only logarithmically
+    with the largest value.
+    """
+
+    def __init__(self, precision_bits=8):
+        """Create an empty histogram"""
+        self.precision_bits = precision_bits
+        self._exact = 1 << precision_bits
+        self._half = self._exact >> 1
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Remove all recorded values"""
+        with self.lock:
+            self.counts = []
+            self.count = 0
+            self.total = 0
+            self.min = None
+            self.max = None
+
+    def _index(self, value):
+        """Bucket index of *value*"""
+        if value < self._exact:
+            return value
+        # Buckets of the range [2**(p+shift-1), 2**(p+shift)) follow the
+        # exact range, each range has _half buckets
+        shift = value.bit_length() - self.precision_bits
+        return shift * self._half + (value >> shift)
+
+    def _value(self, index):
+        """Highest value counted in bucket *index*"""
+        if index < self._exact:
+            return index
+        shift, offset = divmod(index - self._exact, self._half)
+        shift += 1
+        return ((self._half + offset + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        """Add *value* (a non-negative integer, e.g. nanoseconds)"""
+        # _index() inlined, this is called on hot paths
+        if value < self._exact:
+            value = int(value) if value > 0 else 0
+            index = value
+        else:
+            value = int(value)
+            shift = value.bit_length() - self.precision_bits
+            index = shift * self._half + (value >> shift)
+        with self.lock:
+            counts = self.counts
+            if index >= len(counts):
+                counts.extend([0] * (index + 1 - len(counts)))
+            counts[index] += count
+            self.count += count
+            self.total += value * count
+            if self.max is None:
+                self.min = self.max = value
+            elif value > self.max:
+                self.max = value
+            elif value < self.min:
+                self.min = value
+
+    def merge(self, other):
+        """Add all values of *other* to this histogram"""
+        with other.lock:
+            counts = list(other.counts)
+            count, total = other.count, other.total
+            low, high = other.min, other.max
+        if other.precision_bits != self.precision_bits:
+            raise ValueError("Histograms have different precision")
+        with self.lock:
+            if len(counts) > len(self.counts):
+                self.counts.extend([0] * (len(counts) - len(self.counts)))
+            for index, n in enumerate(counts):
+                self.counts[index] += n
+            self.count += count
+            self.total += total
+            if low is not None and (self.min is None or low < self.min):
+                self.min = low
+            if high is not None and (self.max is None or high > self.max):
+                self.max = high
+
+    def percentile(self, percent):
+        """Return the value below which *percent* % of the values fall"""
+        with self.lock:
+            if not self.count:
+                return None
+            rank = max(1, -(-self.count * percent // 100))
+            seen = 0
+            for index, n in enumerate(self.counts):
+                seen += n
+                if seen >= rank:
+                    return min(self._value(index), self.max)
+            return self.max
+
+    def mean(self):
+        """Return the average value, or None when empty"""
+        with self.lock:
+            return self.total / self.count if self.count else None
+
+    def summary(self, scale=1, percentiles=(50, 95, 99, 99.9)):
+        """Return count, min, mean, percentiles and max, divided by *scale*"""
+        result = {"count": self.count}
+        if not self.count:
+            return result
+
+        def scaled(value):
+            return value / scale
+
+        result["min"] = scaled(self.min)
+        result["mean"] = scaled(self.mean())
+        for percent in percentiles:
+            result[f"p{percent:g}"] = scaled(self.percentile(percent))
+        result["max"] = scaled(self.max)
+        return result
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+LastValue = namedtuple("LastValue", ["topic", "timestamp", "payload", "message_id"])
+
+
+class LastValueCache:
+    """Latest received value of every topic, with optional LRU eviction
+
+    update() and get() are O(1). With a *store* (an MQTTDatabase) the cache
+    is loaded on start() and changed entries are written to the store's
+    last_values table every *snapshot_interval* seconds and on close(),
+    so the state survives a restart. Topics evicted from memory are looked
+    up in the store.
+    """
+
+    def __init__(self, capacity=None, store=None, snapshot_interval=5.0):
+        """Create an empty cache holding at most *capacity* topics"""
+        self.capacity = capacity
+        self.store = store
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.Lock()
+        self.values = OrderedDict()
+        self.evictions = 0
+        self._dirty = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Load the persisted values and start the snapshot thread"""
+        if self.store is None:
+            return
+        with self.lock:
+            # Newest first from the store, the most recent topics have to
+            # end up at the recently used end of the LRU order
+            for value in reversed(self.store.load_last_values(self.capacity)):
+                if value.topic not in self.values:
+                    self.values[value.topic] = value
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="mqtt-last-values", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        """Write changed values until close()"""
+        while not self._stop_event.wait(self.snapshot_interval):
+            self.snapshot()
+
+    def snapshot(self):
+        """Write the values changed since the last snapshot to the store"""
+        if self.store is None:
+            return 0
+        with self.lock:
+            dirty, self._dirty = self._dirty, {}
+        if dirty:
+            try:
+                self.store.save_last_values(dirty.values())
+            except Exception:
+                # Keep them for the next attempt unless newer values arrived
+                with self.lock:
+                    for topic, value in dirty.items():
+                        self._dirty.setdefault(topic, value)
+                raise
+        return len(dirty)
+
+    def close(self):
+        """Stop the snapshot thread and write the remaining changes"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.store is not None:
+            try:
+                self.snapshot()
+            except Exception:
+                pass
+
+    def update(self, topic, payload, timestamp, message_id=None):
+        """Store *payload* as the current value of *topic*"""
+        value = LastValue(topic, timestamp, payload, message_id)
+        with self.lock:
+            values = self.values
+            if topic in values:
+                values.move_to_end(topic)
+            values[topic] = value
+            if self.capacity is not None and len(values) > self.capacity:
+                values.popitem(last=False)
+                self.evictions += 1
+            if self.store is not None:
+                self._dirty[topic] = value
+
+    def get(self, topic):
+        """Return the LastValue of *topic*, or None if it was never received"""
+        value = self.values.get(topic)
+        if value is None and self.store is not None:
+            value = self.store.get_last_value(topic)
+        return value
+
+    def items(self, prefix="", limit=None):
+        """Return the cached values of topics starting with *prefix*, sorted"""
+        with self.lock:
+            values = [v for t, v in self.values.items() if t.startswith(prefix)]
+        values.sort()
+        return values[:limit] if limit is not None else values
+
+    def clear(self):
+        """Forget all values"""
+        with self.lock:
+            self.values.clear()
+            self._dirty = {}
+
+    def __len__(self):
+        return len(self.values)
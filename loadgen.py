@@ -0,0 +1,266 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import paho.mqtt.client as mqtt
+from histogram import LatencyHistogram
+
+
+class _Publisher:
+    """One benchmark connection with its own publish thread and counters"""
+
+    def __init__(self, index, generator):
+        self.index = index
+        self.generator = generator
+        self.histogram = LatencyHistogram()
+        self.lock = threading.Lock()
+        self.published = 0
+        self.acked = 0
+        self.errors = 0
+        self.pending = {}  # mid -> perf_counter_ns at publish
+        self.early = {}  # mid -> perf_counter_ns of acks seen before publish returned
+        self.window = threading.Semaphore(generator.max_pending)
+        self.connected = threading.Event()
+
+        client_id = f'bench-{datetime.now().strftime("%H%M%S")}-{os.getpid()}-{index}'
+        self.client = mqtt.Client(client_id=client_id, clean_session=True)
+        self.client.on_connect = self._on_connect
+        self.client.on_publish = self._on_publish
+        if generator.qos:
+            self.client.max_inflight_messages_set(generator.max_inflight)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connected.set()
+
+    def _on_publish(self, client, userdata, mid):
+        """Record the publish-to-ack latency (socket write for QoS 0)"""
+        now = time.perf_counter_ns()
+        with self.lock:
+            sent = self.pending.pop(mid, None)
+            if sent is None:
+                self.early[mid] = now
+                return
+            self.acked += 1
+        self.histogram.record(now - sent)
+        self.window.release()
+
+    def run(self, stop_event, count):
+        """Publish until *count* messages were sent or *stop_event* is set"""
+        generator = self.generator
+        template = generator.topic_template
+        topics = generator.topics
+        payload = generator.payload
+        qos = generator.qos
+        interval = 1.0 / generator.publisher_rate if generator.publisher_rate else 0
+        start = time.perf_counter()
+        seq = 0
+        while not stop_event.is_set() and (count is None or seq < count):
+            if interval:
+                delay = start + seq * interval - time.perf_counter()
+                if delay > 0 and stop_event.wait(delay):
+                    break
+            # Bound the messages waiting for an ack
+            while not self.window.acquire(timeout=0.1):
+                if stop_event.is_set():
+                    return
+
+            topic = template.format(publisher=self.index, seq=seq, topic=seq % topics)
+            sent = time.perf_counter_ns()
+            info = self.client.publish(topic, payload, qos=qos)
+            seq += 1
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                with self.lock:
+                    self.errors += 1
+                self.window.release()
+                continue
+
+            with self.lock:
+                self.published += 1
+                acked = self.early.pop(info.mid, None)
+                if acked is None:
+                    self.pending[info.mid] = sent
+                else:
+                    self.acked += 1
+            if acked is not None:
+                self.histogram.record(acked - sent)
+                self.window.release()
+
+    def unacked(self):
+        """Number of published messages without an ack"""
+        with self.lock:
+            return len(self.pending)
+
+    def get_stats(self):
+        """Return the counters and latency summary of this publisher"""
+        with self.lock:
+            stats = {
+                "publisher": self.index,
+                "published": self.published,
+                "acked": self.acked,
+                "errors": self.errors,
+            }
+        stats["latency_ms"] = self.histogram.summary(1e6)
+        return stats
+
+
+class LoadGenerator:
+    """Publish benchmark with several connections
+
+    Every publisher has its own connection and thread. Topics are built
+    from *topic_template* with the fields {publisher}, {seq} and {topic}
+    (seq modulo *topics*). *rate* is the total messages per second over
+    all publishers, None publishes as fast as the acks allow. Latency is
+    measured from client.publish() to PUBACK (QoS 1), PUBCOMP (QoS 2) or
+    the socket write (QoS 0).
+    """
+
+    def __init__(
+        self,
+        broker="localhost",
+        port=1883,
+        publishers=1,
+        payload_size=64,
+        qos=0,
+        rate=None,
+        topic_template="bench/{publisher}/{topic}",
+        topics=1,
+        max_inflight=100,
+        max_pending=1000,
+    ):
+        """Configure the benchmark, nothing is connected yet"""
+        self.broker = broker
+        self.port = port
+        self.publisher_count = publishers
+        self.payload_size = payload_size
+        self.payload = os.urandom(payload_size)
+        self.qos = qos
+        self.rate = rate
+        self.publisher_rate = rate / publishers if rate else None
+        self.topic_template = topic_template
+        self.topics = max(1, topics)
+        self.max_inflight = max_inflight
+        self.max_pending = max_pending
+        self.publishers = []
+        self.stop_event = threading.Event()
+        self.started_at = None
+        self.started = None
+        self.finished = None
+
+    def run(self, duration=None, count=None, connect_timeout=10.0, ack_timeout=5.0):
+        """Run the benchmark and return the results dict
+
+        Stops after *duration* seconds, after *count* messages per publisher,
+        or when stop() is called. Afterwards up to *ack_timeout* seconds
+        are spent waiting for outstanding acks.
+        """
+        self.stop_event.clear()
+        self.publishers = [_Publisher(i, self) for i in range(self.publisher_count)]
+        try:
+            for publisher in self.publishers:
+                publisher.client.connect(self.broker, self.port)
+                publisher.client.loop_start()
+            deadline = time.monotonic() + connect_timeout
+            for publisher in self.publishers:
+                if not publisher.connected.wait(max(0.0, deadline - time.monotonic())):
+                    raise ConnectionError(
+                        f"Publisher {publisher.index} did not connect to "
+                        f"{self.broker}:{self.port}"
+                    )
+
+            threads = [
+                threading.Thread(
+                    target=publisher.run,
+                    args=(self.stop_event, count),
+                    name=f"mqtt-bench-{publisher.index}",
+                    daemon=True,
+                )
+                for publisher in self.publishers
+            ]
+            self.started_at = datetime.now()
+            self.started = time.perf_counter()
+            self.finished = None
+            for thread in threads:
+                thread.start()
+            if duration is not None:
+                deadline = time.monotonic() + duration
+                for thread in threads:
+                    thread.join(max(0.0, deadline - time.monotonic()))
+                self.stop_event.set()
+            for thread in threads:
+                thread.join()
+            publish_end = time.perf_counter()
+
+            # Give the broker time to acknowledge the last messages
+            deadline = time.monotonic() + ack_timeout
+            while time.monotonic() < deadline and any(
+                publisher.unacked() for publisher in self.publishers
+            ):
+                time.sleep(0.01)
+            self.finished = time.perf_counter()
+            return self._results(publish_end)
+        finally:
+            for publisher in self.publishers:
+                publisher.client.loop_stop()
+                publisher.client.disconnect()
+
+    def stop(self):
+        """Stop publishing"""
+        self.stop_event.set()
+
+    def _results(self, publish_end):
+        """Combine the publisher statistics into the results dict"""
+        histogram = LatencyHistogram()
+        per_publisher = []
+        for publisher in self.publishers:
+            histogram.merge(publisher.histogram)
+            per_publisher.append(publisher.get_stats())
+
+        published = sum(p["published"] for p in per_publisher)
+        acked = sum(p["acked"] for p in per_publisher)
+        publish_time = publish_end - self.started
+        total_time = self.finished - self.started
+        return {
+            "started": self.started_at.isoformat(timespec="seconds"),
+            "config": {
+                "broker": self.broker,
+                "port": self.port,
+                "publishers": self.publisher_count,
+                "payload_size": self.payload_size,
+                "qos": self.qos,
+                "rate": self.rate,
+                "topic_template": self.topic_template,
+                "topics": self.topics,
+                "max_inflight": self.max_inflight,
+            },
+            "elapsed_s": total_time,
+            "published": published,
+            "acked": acked,
+            "errors": sum(p["errors"] for p in per_publisher),
+            "unacked": published - acked,
+            "publish_rate": published / publish_time if publish_time > 0 else 0.0,
+            "ack_rate": acked / total_time if total_time > 0 else 0.0,
+            "throughput_bytes_s": (
+                acked * self.payload_size / total_time if total_time > 0 else 0.0
+            ),
+            "latency_ms": histogram.summary(1e6),
+            "publishers": per_publisher,
+        }
+
+    def get_progress(self):
+        """Return published and acked messages so far"""
+        published = acked = 0
+        for publisher in self.publishers:
+            with publisher.lock:
+                published += publisher.published
+                acked += publisher.acked
+        return {"published": published, "acked": acked}
+
+
+def write_results(results, filepath):
+    """Write benchmark results as JSON"""
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return filepath
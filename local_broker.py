@@ -0,0 +1,250 @@
+import socket
+import struct
+import threading
+from subscriptions import SubscriptionManager
+
+# MQTT 3.1.1 control packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def _encode_length(length):
+    """Encode the remaining length as MQTT variable byte integer"""
+    data = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        data.append(digit | 0x80 if length else digit)
+        if not length:
+            return bytes(data)
+
+
+def _packet(packet_type, flags, body=b""):
+    """Build a control packet"""
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+def _read_string(data, offset):
+    """Read a length-prefixed UTF-8 string, returns (string, next offset)"""
+    (length,) = struct.unpack_from("!H", data, offset)
+    offset += 2
+    return data[offset : offset + length].decode("utf-8"), offset + length
+
+
+class _Session:
+    """One client connection of the LocalBroker"""
+
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.subscriptions = SubscriptionManager()
+        self.client_id = None
+
+    def send(self, data):
+        """Write a packet, ignoring clients that went away"""
+        try:
+            with self.send_lock:
+                self.sock.sendall(data)
+        except OSError:
+            pass
+
+    def _recv_exact(self, size):
+        """Read exactly *size* bytes, None at end of stream"""
+        chunks = []
+        while size:
+            chunk = self.sock.recv(size)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _read_packet(self):
+        """Read one packet, returns (type, flags, body) or None"""
+        header = self._recv_exact(1)
+        if header is None:
+            return None
+        length = 0
+        multiplier = 1
+        while True:
+            digit = self._recv_exact(1)
+            if digit is None:
+                return None
+            length += (digit[0] & 0x7F) * multiplier
+            if not digit[0] & 0x80:
+                break
+            multiplier *= 128
+        body = self._recv_exact(length) if length else b""
+        if body is None:
+            return None
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def run(self):
+        """Handle packets until the client disconnects"""
+        try:
+            while True:
+                packet = self._read_packet()
+                if packet is None:
+                    break
+                packet_type, flags, body = packet
+                if packet_type == DISCONNECT:
+                    break
+                self._handle(packet_type, flags, body)
+        except (OSError, ValueError, struct.error):
+            pass
+        finally:
+            self.broker._remove_session(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _handle(self, packet_type, flags, body):
+        """Dispatch one packet"""
+        if packet_type == CONNECT:
+            _, offset = _read_string(body, 0)
+            # Protocol level, connect flags and keep alive
+            offset += 4
+            self.client_id, _ = _read_string(body, offset)
+            self.send(_packet(CONNACK, 0, b"\x00\x00"))
+
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _read_string(body, 0)
+            if qos:
+                packet_id = body[offset : offset + 2]
+                offset += 2
+            payload = body[offset:]
+            if qos == 1:
+                self.send(_packet(PUBACK, 0, packet_id))
+            elif qos == 2:
+                self.send(_packet(PUBREC, 0, packet_id))
+            self.broker.route(topic, payload)
+
+        elif packet_type == PUBREL:
+            self.send(_packet(PUBCOMP, 0, body[:2]))
+
+        elif packet_type == SUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            granted = bytearray()
+            while offset < len(body):
+                topic_filter, offset = _read_string(body, offset)
+                offset += 1
+                try:
+                    self.subscriptions.add(topic_filter, 0)
+                    # Messages are always delivered with QoS 0
+                    granted.append(0)
+                except ValueError:
+                    granted.append(0x80)
+            self.send(_packet(SUBACK, 0, packet_id + bytes(granted)))
+
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = _read_string(body, offset)
+                self.subscriptions.remove(topic_filter)
+            self.send(_packet(UNSUBACK, 0, body[:2]))
+
+        elif packet_type == PINGREQ:
+            self.send(_packet(PINGRESP, 0))
+
+
+class LocalBroker:
+    """Minimal in-process MQTT 3.1.1 broker for benchmarks and tests
+
+    Acknowledges QoS 0, 1 and 2 publishes and routes them to matching
+    subscribers with QoS 0. There are no retained messages, persistent
+    sessions, wills or authentication. Every client connection is handled
+    by its own thread.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        """Create a broker, port 0 picks a free port on start()"""
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.sessions = []
+        self.received = 0
+        self.delivered = 0
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Start listening, returns the (host, port) in use"""
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        self._thread = threading.Thread(
+            target=self._accept, name="mqtt-local-broker", daemon=True
+        )
+        self._thread.start()
+        return self.host, self.port
+
+    def _accept(self):
+        """Accept client connections until stop()"""
+        while True:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(self, sock)
+            with self.lock:
+                self.sessions.append(session)
+            threading.Thread(
+                target=session.run, name="mqtt-local-session", daemon=True
+            ).start()
+
+    def _remove_session(self, session):
+        """Forget a disconnected session"""
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+
+    def route(self, topic, payload):
+        """Deliver a message to every session with a matching filter"""
+        with self.lock:
+            self.received += 1
+            sessions = list(self.sessions)
+        data = None
+        for session in sessions:
+            if session.subscriptions.match(topic):
+                if data is None:
+                    topic_bytes = topic.encode("utf-8")
+                    body = struct.pack("!H", len(topic_bytes)) + topic_bytes + payload
+                    data = _packet(PUBLISH, 0, body)
+                session.send(data)
+                with self.lock:
+                    self.delivered += 1
+
+    def stop(self):
+        """Close the listening socket and all client connections"""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
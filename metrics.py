@@ -0,0 +1,242 @@
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from histogram import LatencyHistogram
+
+# Prefix of all names in the Prometheus text format
+PROMETHEUS_PREFIX = "mqtt_explorer_"
+
+
+class Metrics:
+    """Registry of counters, timing histograms and gauges
+
+    Counters and timings are created on first use. Hot paths should keep
+    the histogram returned by timing() and call record() with nanoseconds
+    directly, instead of looking it up by name for every message. Counts
+    kept by the instrumented object itself can be registered with
+    counter(), so the hot path only increments an attribute. Such
+    registrations hold their owner weakly and are removed with
+    unregister(), so the registry never keeps an instance alive.
+    """
+
+    def __init__(self):
+        """Create an empty registry"""
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+        self.gauges = {}
+        self.counter_functions = {}
+        self.started = time.monotonic()
+
+    def inc(self, name, value=1):
+        """Increase the counter *name* by *value*"""
+        # dict.get and item assignment are atomic enough for statistics
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def timing(self, name):
+        """Return the LatencyHistogram of *name*, values are nanoseconds"""
+        histogram = self.timings.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.timings.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def observe(self, name, elapsed_ns):
+        """Record a duration in nanoseconds"""
+        self.timing(name).record(elapsed_ns)
+
+    @contextmanager
+    def time(self, name):
+        """Record the duration of the with block under *name*"""
+        histogram = self.timing(name)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            histogram.record(time.perf_counter_ns() - start)
+
+    def counter(self, name, function, owner=None):
+        """Register *function*, its return value is reported as counter *name*
+
+        With *owner*, *function* is called as function(owner) and the owner
+        is only referenced weakly. The values of all live owners of a name
+        are added up; without an owner the registration replaces them.
+        """
+        self._register(self.counter_functions, name, function, owner)
+
+    def gauge(self, name, function, owner=None):
+        """Register *function*, its return value is reported as gauge *name*
+
+        *owner* works as for counter().
+        """
+        self._register(self.gauges, name, function, owner)
+
+    def _register(self, registrations, name, function, owner):
+        """Add a (function, owner reference) entry under *name*"""
+        with self.lock:
+            if owner is None:
+                registrations[name] = [(function, None)]
+            else:
+                entry = (function, weakref.ref(owner))
+                registrations.setdefault(name, []).append(entry)
+
+    def unregister(self, owner):
+        """Remove the counters and gauges registered with *owner*"""
+        with self.lock:
+            for registrations in (self.counter_functions, self.gauges):
+                _prune(registrations, owner)
+
+    def snapshot(self):
+        """Return counters, gauges and timing summaries in milliseconds"""
+        with self.lock:
+            counters = dict(self.counters)
+            timings = dict(self.timings)
+            # Owners that were garbage-collected are dropped here
+            _prune(self.gauges)
+            _prune(self.counter_functions)
+            gauges = {name: list(e) for name, e in self.gauges.items()}
+            counter_functions = {
+                name: list(e) for name, e in self.counter_functions.items()
+            }
+        for name, entries in counter_functions.items():
+            value = _evaluate(entries)
+            if value is not None:
+                counters[name] = counters.get(name, 0) + value
+        values = {name: _evaluate(entries) for name, entries in gauges.items()}
+        return {
+            "uptime_s": time.monotonic() - self.started,
+            "counters": counters,
+            "gauges": values,
+            "timings_ms": {
+                name: histogram.summary(1e6)
+                for name, histogram in sorted(timings.items())
+            },
+        }
+
+    def prometheus_text(self):
+        """Return the snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = _prometheus_name(name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = _prometheus_name(name)
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        for name, summary in snapshot["timings_ms"].items():
+            metric = _prometheus_name(name) + "_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for key, quantile in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+                if key in summary:
+                    value = summary[key] / 1000
+                    lines.append(f'{metric}{{quantile="{quantile}"}} {value:.9f}')
+            total = summary.get("mean", 0.0) * summary["count"] / 1000
+            lines.append(f"{metric}_sum {total:.9f}")
+            lines.append(f"{metric}_count {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Reset counters and timings, registered functions are kept"""
+        with self.lock:
+            self.counters.clear()
+            for histogram in self.timings.values():
+                histogram.reset()
+            self.started = time.monotonic()
+
+
+def _prune(registrations, owner=None):
+    """Drop entries of dead owners, and of *owner*, from *registrations*"""
+    for name, entries in list(registrations.items()):
+        live = []
+        for function, ref in entries:
+            target = None if ref is None else ref()
+            if ref is None or (target is not None and target is not owner):
+                live.append((function, ref))
+        if live:
+            registrations[name] = live
+        else:
+            del registrations[name]
+
+
+def _evaluate(entries):
+    """Sum of the values of (function, owner reference) entries
+
+    Entries whose function fails are skipped; None if no value is left.
+    """
+    total = None
+    for function, ref in entries:
+        try:
+            if ref is None:
+                value = function()
+            else:
+                owner = ref()
+                if owner is None:
+                    continue
+                value = function(owner)
+        except Exception:
+            continue
+        total = value if total is None else total + value
+    return total
+
+
+def _prometheus_name(name):
+    """Turn a metric name into a valid Prometheus metric name"""
+    return PROMETHEUS_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+# Registry shared by backend, database, writer and frontend
+registry = Metrics()
+
+
+def get_metrics():
+    """Return a snapshot of the shared registry"""
+    return registry.snapshot()
+
+
+class MetricsServer:
+    """Serves the Prometheus text format on http://host:port/metrics"""
+
+    def __init__(self, port=9464, host="127.0.0.1", metrics=None):
+        """Create the server, it only listens on localhost by default"""
+        self.metrics = metrics if metrics is not None else registry
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="mqtt-metrics", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
@@ -0,0 +1,165 @@
+import time
+import tkinter as tk
+from tkinter import ttk
+from metrics import MetricsServer
+
+
+class MetricsViewer:
+    """Window with the live counters, gauges and timings of a Metrics registry"""
+
+    REFRESH_MS = 1000
+
+    COLUMNS = (
+        ("Metric", 200),
+        ("Value", 90),
+        ("Rate/s", 80),
+        ("p50 ms", 80),
+        ("p95 ms", 80),
+        ("p99 ms", 80),
+        ("Max ms", 80),
+    )
+
+    # Prometheus endpoint shared by all windows, it outlives the window
+    server = None
+
+    def __init__(self, root, metrics, log_callback=None):
+        """Create the window for the registry *metrics*"""
+        self.metrics = metrics
+        self.log_callback = log_callback
+        self._after_id = None
+        self._last_counters = {}
+        self._last_time = time.monotonic()
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Metrics")
+        self.window.geometry("720x450")
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=1)
+
+        self._create_controls()
+        self._create_tree()
+
+        self.window.bind("<Destroy>", self._on_destroy)
+        self._refresh()
+
+    def _create_controls(self):
+        """Create the reset and Prometheus endpoint controls"""
+        control_frame = ttk.Frame(self.window)
+        control_frame.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        control_frame.columnconfigure(4, weight=1)
+
+        reset_btn = ttk.Button(control_frame, text="Reset", command=self._reset)
+        reset_btn.grid(row=0, column=0, padx=5, pady=5)
+
+        ttk.Label(control_frame, text="Prometheus port:").grid(
+            row=0, column=1, padx=5, pady=5
+        )
+        self.port_entry = ttk.Entry(control_frame, width=7)
+        self.port_entry.insert(0, "9464")
+        self.port_entry.grid(row=0, column=2, padx=5, pady=5)
+
+        self.server_btn = ttk.Button(
+            control_frame, text="Start endpoint", command=self._toggle_server
+        )
+        self.server_btn.grid(row=0, column=3, padx=5, pady=5)
+
+        self.server_label = ttk.Label(control_frame, text="")
+        self.server_label.grid(row=0, column=4, padx=5, pady=5, sticky="w")
+        self._update_server_controls()
+
+    def _create_tree(self):
+        """Create the metrics table"""
+        names = [name for name, _ in self.COLUMNS]
+        self.tree = ttk.Treeview(self.window, columns=names, show="headings")
+        for name, width in self.COLUMNS:
+            self.tree.heading(name, text=name)
+            self.tree.column(name, width=width, anchor="w" if name == "Metric" else "e")
+        self.tree.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+
+        scrollbar = ttk.Scrollbar(
+            self.window, orient="vertical", command=self.tree.yview
+        )
+        scrollbar.grid(row=1, column=1, sticky="ns")
+        self.tree.configure(yscroll=scrollbar.set)
+
+    def _toggle_server(self):
+        """Start or stop the Prometheus text endpoint on localhost"""
+        if MetricsViewer.server is not None:
+            MetricsViewer.server.stop()
+            MetricsViewer.server = None
+        else:
+            try:
+                port = int(self.port_entry.get())
+                MetricsViewer.server = MetricsServer(port, metrics=self.metrics).start()
+            except (ValueError, OSError) as e:
+                self._log(f"Error starting metrics endpoint: {e}")
+                return
+            self._log(
+                f"Metrics endpoint on http://127.0.0.1:{MetricsViewer.server.port}"
+                "/metrics"
+            )
+        self._update_server_controls()
+
+    def _update_server_controls(self):
+        """Show whether the endpoint is running"""
+        server = MetricsViewer.server
+        if server is None:
+            self.server_btn.config(text="Start endpoint")
+            self.server_label.config(text="")
+        else:
+            self.server_btn.config(text="Stop endpoint")
+            self.server_label.config(
+                text=f"http://{server.host}:{server.port}/metrics"
+            )
+
+    def _reset(self):
+        """Reset counters and timings"""
+        self.metrics.reset()
+        self._last_counters = {}
+        self._refresh(reschedule=False)
+
+    def _log(self, message):
+        """Report a message to the main log"""
+        if self.log_callback:
+            self.log_callback(message)
+
+    def _refresh(self, reschedule=True):
+        """Show the current snapshot, reusing the Treeview items"""
+        snapshot = self.metrics.snapshot()
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-6)
+
+        rows = []
+        for name, value in sorted(snapshot["counters"].items()):
+            rate = (value - self._last_counters.get(name, value)) / elapsed
+            rows.append((name, value, f"{rate:.1f}", "", "", "", ""))
+        for name, value in sorted(snapshot["gauges"].items()):
+            rows.append((name, "-" if value is None else value, "", "", "", "", ""))
+        for name, summary in snapshot["timings_ms"].items():
+            rows.append(
+                (name, summary["count"], "")
+                + tuple(
+                    f"{summary[key]:.3f}" if key in summary else "-"
+                    for key in ("p50", "p95", "p99", "max")
+                )
+            )
+        self._last_counters = snapshot["counters"]
+        self._last_time = now
+
+        items = self.tree.get_children()
+        for index, values in enumerate(rows):
+            if index < len(items):
+                self.tree.item(items[index], values=values)
+            else:
+                self.tree.insert("", "end", values=values)
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows) :])
+
+        if reschedule:
+            self._after_id = self.window.after(self.REFRESH_MS, self._refresh)
+
+    def _on_destroy(self, event):
+        """Stop refreshing once the window is closed"""
+        if event.widget is self.window and self._after_id is not None:
+            self.window.after_cancel(self._after_id)
+            self._after_id = None
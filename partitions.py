@@ -0,0 +1,828 @@
+import calendar
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from database import (
+    MESSAGE_COLUMNS,
+    MESSAGE_TABLES,
+    SCHEMA_VERSION,
+    MQTTDatabase,
+    search_result,
+    to_epoch_us,
+)
+from metrics import registry as metrics
+from payloads import (
+    MESSAGE_PAYLOAD,
+    MESSAGE_SIZE,
+    PayloadCodec,
+    payload_stats,
+    savings_ratio,
+)
+from records import Message
+
+# Partition lengths in microseconds, partitions start at full UTC hours/days
+PARTITION_PERIODS = {"hour": 3600 * 1000000, "day": 86400 * 1000000}
+_NAME_FORMATS = {"hour": "%Y%m%d%H", "day": "%Y%m%d"}
+# messages_YYYYMMDD.db for days, messages_YYYYMMDDHH.db for hours
+_FILE_PATTERN = re.compile(r"^messages_(\d{8}|\d{10})\.db$")
+
+
+class Partition:
+    """One file with the messages of the time range [start, end)"""
+
+    __slots__ = (
+        "start",
+        "end",
+        "path",
+        "rows",
+        "min_id",
+        "max_id",
+        "conn",
+        "topic_ids",
+        "needs_vacuum",
+        "needs_merge",
+        "codec",
+    )
+
+    def __init__(self, start, end, path):
+        """Describe the partition stored in *path*, epoch microseconds"""
+        self.start = start
+        self.end = end
+        self.path = path
+        self.rows = 0
+        # Bounds of the message ids, they may be loose after deletes
+        self.min_id = None
+        self.max_id = None
+        # Writer connection while the partition is open for writing
+        self.conn = None
+        self.topic_ids = {}
+        self.needs_vacuum = False
+        # Deleted rows may still be tombstones in the FTS5 index
+        self.needs_merge = False
+        # PayloadCodec of the file, created on first use
+        self.codec = None
+
+    def to_dict(self):
+        """Return the partition's file, time range and row count"""
+        return {
+            "path": self.path,
+            "start": self.start,
+            "end": self.end,
+            "rows": self.rows,
+            "min_id": self.min_id,
+            "max_id": self.max_id,
+        }
+
+
+def partition_file_name(start, partition="day"):
+    """File name of the *partition* ("hour" or "day") starting at *start*"""
+    when = time.gmtime(start // 1000000)
+    return f"messages_{time.strftime(_NAME_FORMATS[partition], when)}.db"
+
+
+def parse_partition_file_name(name):
+    """Return (start, end) of a partition file name, or None"""
+    match = _FILE_PATTERN.match(name)
+    if match is None:
+        return None
+    key = match.group(1)
+    partition = "hour" if len(key) == 10 else "day"
+    start = calendar.timegm(time.strptime(key, _NAME_FORMATS[partition])) * 1000000
+    return start, start + PARTITION_PERIODS[partition]
+
+
+class PartitionedDatabase(MQTTDatabase):
+    """MQTTDatabase that stores messages in one SQLite file per hour or day
+
+    The main database file keeps the last values and counters, messages
+    go to files in *partition_dir* (by default "<db name>_partitions").
+    Every partition has the full message schema, including its own topics
+    table and FTS5 index, so the queries of MQTTDatabase run unchanged on
+    each file and the results are merged. Queries with a time range only
+    open the partitions overlapping it, and retention drops old partitions
+    by unlinking their files. Messages already stored in the main file of
+    a single file database are moved into partitions in the background.
+    """
+
+    def __init__(
+        self,
+        db_name="mqtt_messages.db",
+        partition="day",
+        partition_dir=None,
+        max_open_partitions=4,
+        stream_workers=2,
+        **kwargs,
+    ):
+        """Open the main database and the existing partitions
+
+        *partition* is "hour" or "day". At most *max_open_partitions*
+        writer connections are kept open; *stream_workers* partitions are
+        read in parallel by stream_messages(). Other keyword arguments are
+        those of MQTTDatabase.
+        """
+        if partition not in PARTITION_PERIODS:
+            raise ValueError(f"Unknown partition length: {partition}")
+        if db_name == ":memory:" or db_name.startswith("file:"):
+            raise ValueError("Partitioned storage needs a database file name")
+        self.partition = partition
+        self.period = PARTITION_PERIODS[partition]
+        self.partition_dir = partition_dir or (
+            os.path.splitext(db_name)[0] + "_partitions"
+        )
+        self.max_open_partitions = max_open_partitions
+        self.stream_workers = stream_workers
+        self._partitions = {}
+        self._open_partitions = OrderedDict()
+        os.makedirs(self.partition_dir, exist_ok=True)
+        outdated = self._load_partitions()
+        # Partitions of an older schema get their rollups in the background
+        self._rollup_partitions = list(outdated)
+        super().__init__(db_name, **kwargs)
+
+        # Older schemas are upgraded by opening them for writing
+        with self.db_lock:
+            for partition in outdated:
+                self._open_partition(partition)
+                self._close_partition(partition)
+
+    def _load_partitions(self):
+        """Find the partition files and read their row counts and id ranges
+
+        Returns the partitions with an older schema version.
+        """
+        outdated = []
+        for name in os.listdir(self.partition_dir):
+            time_range = parse_partition_file_name(name)
+            if time_range is None:
+                continue
+            partition = Partition(*time_range, os.path.join(self.partition_dir, name))
+            conn = sqlite3.connect(partition.path)
+            try:
+                c = conn.cursor()
+                if c.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    outdated.append(partition)
+                c.execute("SELECT value FROM counters WHERE name = 'messages'")
+                partition.rows = c.fetchone()[0]
+                c.execute("SELECT MIN(id), MAX(id) FROM messages")
+                partition.min_id, partition.max_id = c.fetchone()
+            except sqlite3.DatabaseError:
+                # Created but never written, it is set up again when needed
+                pass
+            finally:
+                conn.close()
+            self._partitions[partition.start] = partition
+        return outdated
+
+    def _rollup_backfill_pending(self):
+        """Check the main file and the partitions of an older schema"""
+        return bool(self._rollup_partitions) or super()._rollup_backfill_pending()
+
+    def _backfill_rollups(self):
+        """Add the rows of upgraded partitions to their rollups, in chunks"""
+        while self._rollup_partitions and not self._migration_stop.is_set():
+            partition = self._rollup_partitions[0]
+            with self.db_lock:
+                done = self._partitions.get(partition.start) is not partition
+                if not done:
+                    self._open_partition(partition)
+                    with partition.conn:
+                        cursor = partition.conn.cursor()
+                        done = not self._backfill_rollup_chunk(cursor)
+            if done:
+                self._rollup_partitions.pop(0)
+            # Give the writer a chance to take the lock between chunks
+            time.sleep(0.01)
+        super()._backfill_rollups()
+
+    def _upgrade_pending(self):
+        """Check the upgrades of MQTTDatabase and rows left in the main file"""
+        return super()._upgrade_pending() or self._main_rows_pending()
+
+    def _upgrade_in_background(self):
+        """Upgrade the main file, then move its messages into partitions
+
+        Rows are moved last, after the last values were collected from
+        them and rows of an old schema were converted.
+        """
+        super()._upgrade_in_background()
+        if self._main_rows_pending():
+            self._move_main_rows()
+
+    def _main_rows_pending(self):
+        """Check whether the main file still has messages"""
+        c = self.conn.execute("SELECT 1 FROM messages LIMIT 1")
+        return c.fetchone() is not None
+
+    def _move_main_rows(self):
+        """Move the messages of the main file into partitions, in chunks"""
+        while not self._migration_stop.is_set():
+            with self.db_lock:
+                done = not self._move_main_chunk()
+                if not done:
+                    # The moved rows have old ids
+                    self._generation += 1
+            if done:
+                return
+            # Give the writer a chance to take the lock between chunks
+            time.sleep(0.01)
+
+    def _move_main_chunk(self):
+        """Move the oldest ids of the main file, False when none are left
+
+        The rows are committed to their partitions before they are deleted
+        from the main file; rows of an interrupted chunk that are already in
+        a partition are skipped. The caller holds db_lock.
+        """
+        c = self.conn.cursor()
+        c.execute(
+            f"""SELECT {MESSAGE_COLUMNS}, m.payload_id, m.topic_id, {MESSAGE_SIZE}
+                FROM {MESSAGE_TABLES} ORDER BY m.id LIMIT ?""",
+            (self.MIGRATION_CHUNK,),
+        )
+        rows = c.fetchall()
+        if not rows:
+            return False
+        for start, group in self._group_by_partition(
+            Message.from_row(row[:5]) for row in rows
+        ).items():
+            partition = self._writable_partition(start)
+            stored = partition.conn.execute(
+                "SELECT id FROM messages WHERE id BETWEEN ? AND ?",
+                (group[0].id, group[-1].id),
+            )
+            stored = {row[0] for row in stored}
+            group = [record for record in group if record.id not in stored]
+            if group:
+                self._insert(partition, group)
+        with self.conn:
+            # (id, payload_id, topic_id, ts, size, text) as for delete_oldest()
+            self._remove_from_rollups(
+                c, [(row[0], row[5], row[6], row[1], row[7], row[3]) for row in rows]
+            )
+            c.executemany(
+                "DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows]
+            )
+            self.payload_codec.collect_garbage(
+                c, {row[5] for row in rows if row[5] is not None}
+            )
+            c.execute(
+                "UPDATE counters SET value = MAX(value - ?, 0) WHERE name = 'messages'",
+                (len(rows),),
+            )
+        return True
+
+    def _max_message_id(self):
+        """Get the highest message id in use, including all partitions"""
+        max_id = super()._max_message_id()
+        for partition in self._partitions.values():
+            max_id = max(max_id, partition.max_id or 0)
+        return max_id
+
+    def get_partitions(self):
+        """Get the partitions as dicts, oldest first"""
+        return [partition.to_dict() for partition in self._select_partitions()]
+
+    def get_storage_info(self):
+        """Get the storage settings and the partition layout"""
+        info = super().get_storage_info()
+        info["partition"] = self.partition
+        info["partition_dir"] = self.partition_dir
+        info["partitions"] = len(self._partitions)
+        return info
+
+    def _select_partitions(self, filters=None):
+        """Partitions overlapping the start/end of *filters*, oldest first"""
+        start = end = None
+        if filters:
+            if filters.get("start") is not None:
+                start = to_epoch_us(filters["start"])
+            if filters.get("end") is not None:
+                end = to_epoch_us(filters["end"])
+        partitions = [
+            p
+            for p in list(self._partitions.values())
+            if (start is None or p.end > start) and (end is None or p.start <= end)
+        ]
+        partitions.sort(key=lambda p: p.start)
+        return partitions
+
+    def _writable_partition(self, ts):
+        """Partition for a message at *ts*, opened for writing; holds db_lock"""
+        partition = self._partitions.get(ts - ts % self.period)
+        if partition is None:
+            # Files of another partition length may cover the time as well
+            for candidate in self._partitions.values():
+                if candidate.start <= ts < candidate.end:
+                    partition = candidate
+                    break
+            else:
+                start = ts - ts % self.period
+                name = partition_file_name(start, self.partition)
+                partition = Partition(
+                    start,
+                    start + self.period,
+                    os.path.join(self.partition_dir, name),
+                )
+        self._open_partition(partition)
+        self._partitions.setdefault(partition.start, partition)
+        return partition
+
+    def _open_partition(self, partition):
+        """Open the writer connection of *partition*, creating its schema"""
+        if partition.conn is not None:
+            self._open_partitions.move_to_end(partition.start)
+            return
+        conn = sqlite3.connect(partition.path, check_same_thread=False)
+        try:
+            self._partition_codec(partition).register(conn)
+            self._apply_settings(conn)
+            c = conn.cursor()
+            version = c.execute("PRAGMA user_version").fetchone()[0]
+            self._create_message_tables(c)
+            c.execute("INSERT OR IGNORE INTO counters VALUES ('messages', 0)")
+            if self.fts_enabled:
+                self._init_search_index(c)
+                if version == 2:
+                    self._upgrade_search_index(c)
+            c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+            c.execute("SELECT name, id FROM topics")
+            partition.topic_ids = dict(c.fetchall())
+        except Exception:
+            conn.close()
+            raise
+        partition.conn = conn
+        self._open_partitions[partition.start] = partition
+        while len(self._open_partitions) > self.max_open_partitions:
+            _, oldest = self._open_partitions.popitem(last=False)
+            self._close_partition(oldest)
+
+    def _partition_codec(self, partition):
+        """PayloadCodec of *partition*, with the settings of the main file"""
+        if partition.codec is None:
+            partition.codec = PayloadCodec(
+                os.path.abspath(partition.path),
+                self.payload_codec.compress_threshold,
+                self.payload_codec.use_dictionaries,
+            )
+        return partition.codec
+
+    def _close_partition(self, partition):
+        """Close the writer connection of *partition*"""
+        self._open_partitions.pop(partition.start, None)
+        if partition.conn is not None:
+            partition.conn.close()
+            partition.conn = None
+            partition.topic_ids = {}
+
+    def _unlink_partition(self, partition):
+        """Delete the file of *partition*; holds db_lock"""
+        self._close_partition(partition)
+        os.remove(partition.path)
+        for suffix in ("-wal", "-shm"):
+            try:
+                os.remove(partition.path + suffix)
+            except FileNotFoundError:
+                pass
+        del self._partitions[partition.start]
+        self._generation += 1
+
+    @contextmanager
+    def _partition_reader(self, partition, timing="db_query"):
+        """Read connection to *partition*, None if it was dropped meanwhile"""
+        with metrics.time(timing):
+            try:
+                # mode=rw so a dropped partition isn't created again
+                conn = sqlite3.connect(
+                    f"file:{os.path.abspath(partition.path)}?mode=rw",
+                    uri=True,
+                    check_same_thread=False,
+                )
+            except sqlite3.OperationalError:
+                if os.path.exists(partition.path):
+                    raise
+                conn = None
+            try:
+                if conn is not None:
+                    self._partition_codec(partition).register(conn)
+                    conn.execute("PRAGMA query_only = 1")
+                    cache_size = int(self.settings["cache_size"])
+                    conn.execute(f"PRAGMA cache_size = {cache_size}")
+                yield conn
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _fetch(self, partition, sql, params=()):
+        """Run a query on *partition* and return all rows"""
+        with self._partition_reader(partition) as conn:
+            if conn is None:
+                return []
+            return conn.execute(sql, params).fetchall()
+
+    def save_messages(self, records):
+        """Insert Message records into the partitions of their timestamps"""
+        with self.db_lock:
+            for start, group in self._group_by_partition(records).items():
+                self._insert(self._writable_partition(start), group)
+
+    def _group_by_partition(self, records):
+        """Group Message records by the start of their partition period"""
+        groups = {}
+        for record in records:
+            ts = record.ts_ns // 1000
+            groups.setdefault(ts - ts % self.period, []).append(record)
+        return groups
+
+    def _insert(self, partition, records):
+        """Insert Message records into the open *partition*"""
+        self._insert_messages(
+            partition.conn, records, partition.topic_ids, partition.codec
+        )
+        ids = [record.id for record in records]
+        low, high = min(ids), max(ids)
+        partition.rows += len(records)
+        if partition.min_id is None or low < partition.min_id:
+            partition.min_id = low
+        if partition.max_id is None or high > partition.max_id:
+            partition.max_id = high
+
+    def clear_database(self):
+        """Delete all partitions and clear the main database"""
+        with self.db_lock:
+            for partition in list(self._partitions.values()):
+                self._unlink_partition(partition)
+        super().clear_database()
+
+    def get_all_messages(self, order_desc=True):
+        """Get all messages from database as (ts, topic, message, direction)"""
+        order = "DESC" if order_desc else "ASC"
+        partitions = self._select_partitions()
+        if order_desc:
+            partitions.reverse()
+        rows = []
+        # Partitions don't overlap in time, so their results just follow
+        for partition in partitions:
+            rows.extend(
+                self._fetch(
+                    partition,
+                    f"SELECT m.ts, t.name, {MESSAGE_PAYLOAD}, m.direction"
+                    f" FROM {MESSAGE_TABLES} ORDER BY m.ts {order}, m.id {order}",
+                )
+            )
+        return rows
+
+    def get_recent_messages(self, limit=10):
+        """Get the *limit* newest messages as Message records, newest first"""
+        rows = []
+        for partition in reversed(self._select_partitions()):
+            if len(rows) >= limit:
+                break
+            rows.extend(
+                self._fetch(
+                    partition,
+                    f"SELECT {MESSAGE_COLUMNS}"
+                    f" FROM {MESSAGE_TABLES} ORDER BY m.ts DESC, m.id DESC LIMIT ?",
+                    (limit - len(rows),),
+                )
+            )
+        return [Message.from_row(row) for row in rows]
+
+    def _data_version(self):
+        """Return (generation, newest message id of all partitions)"""
+        with self.db_lock:
+            max_id = max((p.max_id or 0 for p in self._partitions.values()), default=0)
+            return self._generation, max_id
+
+    def _aggregate_rows(self, queries, filters=None, id_range=None):
+        """Run aggregate *queries* on the partitions in the time range, oldest first
+
+        Partitions without rows in *id_range* are skipped, so a refresh
+        usually reads the newest partition only.
+        """
+        after_id = id_range[0] if id_range is not None else None
+        queries = self._aggregate_queries(queries, filters, id_range)
+        results = []
+        for partition in self._select_partitions(filters):
+            if partition.max_id is None:
+                continue
+            if after_id is not None and partition.max_id <= after_id:
+                continue
+            with self._partition_reader(partition, "db_analytics") as conn:
+                if conn is None:
+                    continue
+                results.append([conn.execute(*query).fetchall() for query in queries])
+        return results
+
+    def _aggregate_rollups(self, queries, resolution, filters=None):
+        """Run aggregate *queries* on the rollups of the partitions in the range"""
+        queries = self._rollup_queries(queries, resolution, filters)
+        results = []
+        for partition in self._select_partitions(filters):
+            with self._partition_reader(partition, "db_analytics") as conn:
+                if conn is None:
+                    continue
+                results.append([conn.execute(*query).fetchall() for query in queries])
+        return results
+
+    def get_message_count(self, filters=None):
+        """Get the number of stored messages
+
+        The unfiltered total is the sum of the partitions' counters,
+        filtered totals only query the partitions in the time range.
+        """
+        if not filters:
+            return sum(p.rows for p in self._select_partitions())
+        where, params = self._build_filters(filters)
+        total = 0
+        for partition in self._select_partitions(filters):
+            rows = self._fetch(
+                partition, f"SELECT COUNT(*) FROM {MESSAGE_TABLES}{where}", params
+            )
+            total += rows[0][0] if rows else 0
+        return total
+
+    def _message_rows(self, after_key, limit, filters, order_desc):
+        """Rows of get_messages_page() from the partitions, see MQTTDatabase
+
+        Partitions are visited in id order and only until no later one can
+        hold a row of the page.
+        """
+        where, params = self._build_filters(filters)
+        if after_key is not None:
+            where += " AND " if where else " WHERE "
+            where += "m.id < ?" if order_desc else "m.id > ?"
+            params.append(after_key)
+        order = "DESC" if order_desc else "ASC"
+
+        partitions = [
+            p
+            for p in self._select_partitions(filters)
+            if p.rows
+            and p.min_id is not None
+            and (
+                after_key is None
+                or (p.min_id < after_key if order_desc else p.max_id > after_key)
+            )
+        ]
+        if order_desc:
+            partitions.sort(key=lambda p: p.max_id, reverse=True)
+        else:
+            partitions.sort(key=lambda p: p.min_id)
+
+        rows = []
+        for partition in partitions:
+            if len(rows) >= limit:
+                bound = rows[limit - 1][0]
+                if order_desc and partition.max_id < bound:
+                    break
+                if not order_desc and partition.min_id > bound:
+                    break
+            rows.extend(
+                self._fetch(
+                    partition,
+                    f"SELECT {MESSAGE_COLUMNS} FROM {MESSAGE_TABLES}"
+                    f"{where} ORDER BY m.id {order} LIMIT ?",
+                    params + [limit],
+                )
+            )
+            rows.sort(key=lambda row: row[0], reverse=order_desc)
+            del rows[limit:]
+        return rows
+
+    def search(self, query, topic_filter=None, time_range=None, limit=100):
+        """Full-text search over all partitions in the time range
+
+        Ranks of the partitions' FTS5 indexes are merged, see MQTTDatabase.
+        """
+        search_query = self._search_query(query, topic_filter, time_range, limit)
+        if search_query is None:
+            return []
+        filters = {}
+        if time_range:
+            filters["start"], filters["end"] = time_range
+        rows = []
+        for partition in self._select_partitions(filters):
+            rows.extend(self._fetch(partition, *search_query))
+        rows.sort(key=lambda row: row[-1])
+        return [search_result(row) for row in rows[:limit]]
+
+    def stream_messages(self, filters=None, chunk_size=5000):
+        """Yield lists of up to *chunk_size* messages, partition by partition
+
+        Up to stream_workers partitions are read ahead on background
+        threads while the caller consumes the current one.
+        """
+        where, params = self._build_filters(filters)
+        sql = f"SELECT {MESSAGE_COLUMNS} FROM {MESSAGE_TABLES}{where} ORDER BY m.id"
+        partitions = self._select_partitions(filters)
+
+        if self.stream_workers <= 1 or len(partitions) <= 1:
+            for partition in partitions:
+                yield from self._stream_partition(partition, sql, params, chunk_size)
+            return
+
+        stop_event = threading.Event()
+        pending = []
+        try:
+            for partition in partitions:
+                pending.append(
+                    self._start_reader(partition, sql, params, chunk_size, stop_event)
+                )
+                if len(pending) < self.stream_workers:
+                    continue
+                yield from self._drain_reader(pending.pop(0))
+            while pending:
+                yield from self._drain_reader(pending.pop(0))
+        finally:
+            stop_event.set()
+
+    def _stream_partition(self, partition, sql, params, chunk_size):
+        """Yield chunks of one partition"""
+        with self._partition_reader(partition, "db_stream") as conn:
+            if conn is None:
+                return
+            c = conn.cursor()
+            c.execute(sql, params)
+            while True:
+                rows = c.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+
+    def _start_reader(self, partition, sql, params, chunk_size, stop_event):
+        """Read *partition* into a bounded queue on a background thread"""
+        chunks = queue.Queue(maxsize=4)
+
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                for rows in self._stream_partition(partition, sql, params, chunk_size):
+                    if not put(rows):
+                        return
+                put(None)
+            except Exception as e:
+                put(e)
+
+        threading.Thread(
+            target=read, name="mqtt-partition-reader", daemon=True
+        ).start()
+        return chunks
+
+    def _drain_reader(self, chunks):
+        """Yield the chunks of a reader started by _start_reader()"""
+        while True:
+            item = chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def drop_partitions(self, max_rows=None, before_ts=None):
+        """Unlink the oldest partitions whose rows would all be deleted
+
+        Partitions are dropped while they end before *before_ts* and their
+        rows add up to at most *max_rows*. Returns the number of rows.
+        """
+        if max_rows is None and before_ts is None:
+            return 0
+        dropped = 0
+        with self.db_lock:
+            for partition in self._select_partitions():
+                if before_ts is not None and partition.end > before_ts:
+                    break
+                if max_rows is not None and dropped + partition.rows > max_rows:
+                    break
+                rows = partition.rows
+                self._unlink_partition(partition)
+                dropped += rows
+        metrics.inc("partitions_dropped_rows", dropped)
+        return dropped
+
+    def delete_oldest(self, limit, before_ts=None, topic=None):
+        """Delete up to *limit* of the oldest messages, see MQTTDatabase
+
+        Partitions are visited oldest first until *limit* rows are deleted.
+        """
+        deleted = 0
+        with self.db_lock:
+            for partition in self._select_partitions():
+                if deleted >= limit:
+                    break
+                if before_ts is not None and partition.start >= before_ts:
+                    break
+                if not partition.rows:
+                    continue
+                self._open_partition(partition)
+                n = self._delete_oldest(
+                    partition.conn, partition.codec, limit - deleted, before_ts, topic
+                )
+                if n:
+                    partition.rows -= n
+                    partition.needs_vacuum = True
+                    partition.needs_merge = True
+                    deleted += n
+        return deleted
+
+    def get_topic_row_counts(self, min_count=0):
+        """Get (topic, count) of topics with more than *min_count* rows"""
+        counts = {}
+        for partition in self._select_partitions():
+            for topic, count in self._fetch(
+                partition,
+                "SELECT t.name, COUNT(*) FROM messages m"
+                " JOIN topics t ON t.id = m.topic_id GROUP BY m.topic_id",
+            ):
+                counts[topic] = counts.get(topic, 0) + count
+        return [(topic, n) for topic, n in counts.items() if n > min_count]
+
+    def get_space_info(self):
+        """Get page counts and sizes summed over the main file and partitions"""
+        info = super().get_space_info()
+        for partition in self._select_partitions():
+            with self._partition_reader(partition) as conn:
+                if conn is None:
+                    continue
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            info["page_count"] += page_count
+            info["freelist_count"] += free_pages
+            info["file_bytes"] += page_count * page_size
+            info["used_bytes"] += (page_count - free_pages) * page_size
+        return info
+
+    def get_payload_stats(self):
+        """Get the BLOB payload statistics summed over all partitions"""
+        total = super().get_payload_stats()
+        del total["savings_ratio"]
+        for partition in self._select_partitions():
+            with self._partition_reader(partition) as conn:
+                if conn is None:
+                    continue
+                stats = payload_stats(conn)
+            for key, value in stats.items():
+                total[key] += value
+        return savings_ratio(total)
+
+    def compact_search_index(self, pages):
+        """Merge the FTS5 index of the main file and of one partition
+
+        Only partitions with deleted rows are merged, one step per call.
+        """
+        merged = super().compact_search_index(pages)
+        if not self.fts_enabled:
+            return merged
+        with self.db_lock:
+            for partition in self._select_partitions():
+                if not partition.needs_merge:
+                    continue
+                self._open_partition(partition)
+                if self._merge_search_index(partition.conn, pages):
+                    return True
+                partition.needs_merge = False
+        return merged
+
+    def incremental_vacuum(self, pages):
+        """Return up to *pages* free pages of the main file and partitions"""
+        removed = super().incremental_vacuum(pages)
+        with self.db_lock:
+            for partition in self._select_partitions():
+                if removed >= pages:
+                    break
+                if not partition.needs_vacuum:
+                    continue
+                self._open_partition(partition)
+                c = partition.conn.cursor()
+                # 2 = INCREMENTAL, other files keep reusing their free pages
+                if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    partition.needs_vacuum = False
+                    continue
+                before = c.execute("PRAGMA page_count").fetchone()[0]
+                c.execute(f"PRAGMA incremental_vacuum({int(pages - removed)})")
+                c.fetchall()
+                partition.conn.commit()
+                removed += before - c.execute("PRAGMA page_count").fetchone()[0]
+                if not c.execute("PRAGMA freelist_count").fetchone()[0]:
+                    partition.needs_vacuum = False
+        return removed
+
+    def close(self):
+        """Drain pending writes and close the main database and partitions"""
+        super().close()
+        for partition in list(getattr(self, "_open_partitions", {}).values()):
+            self._close_partition(partition)
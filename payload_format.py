@@ -0,0 +1,348 @@
+import json
+import struct
+from payloads import BINARY_PREFIX
+
+# Formats returned by detect_format()
+EMPTY = "empty"
+JSON = "json"
+TEXT = "utf-8"
+CBOR = "cbor"
+MSGPACK = "msgpack"
+BINARY = "binary"
+
+# Larger payloads are not parsed as JSON, CBOR or MessagePack
+STRUCTURED_MAX_BYTES = 65536
+# Nesting accepted by the CBOR and MessagePack decoders
+_MAX_DEPTH = 64
+
+
+def detect_format(data):
+    """Return the format of the payload bytes *data*
+
+    UTF-8 text is reported as JSON if it parses as JSON. Other payloads
+    are CBOR or MessagePack if they decode completely to a map or an array,
+    otherwise binary.
+    """
+    if not data:
+        return EMPTY
+    try:
+        text = str(data, "utf-8")
+    except UnicodeDecodeError:
+        text = None
+    if text is not None:
+        if len(data) <= STRUCTURED_MAX_BYTES and text.lstrip()[:1] in ("{", "["):
+            try:
+                json.loads(text)
+                return JSON
+            except ValueError:
+                pass
+        return TEXT
+    if len(data) <= STRUCTURED_MAX_BYTES:
+        for name, decode in ((CBOR, decode_cbor), (MSGPACK, decode_msgpack)):
+            try:
+                if isinstance(decode(data), (dict, list)):
+                    return name
+            except (ValueError, IndexError, struct.error, RecursionError):
+                pass
+    return BINARY
+
+
+def hex_preview(data, limit=64):
+    """Hex of the first *limit* bytes of *data*, with the total size"""
+    shown = bytes(data[:limit]).hex()
+    if len(data) <= limit:
+        return f"{BINARY_PREFIX}{shown}>"
+    return f"{BINARY_PREFIX}{shown}... ({len(data)} bytes)>"
+
+
+def to_text(payload):
+    """Text stored for *payload* (str, bytes or Payload), see Payload.text"""
+    if isinstance(payload, str):
+        return payload
+    if isinstance(payload, Payload):
+        return payload.text
+    return Payload(payload).text
+
+
+def to_bytes(text):
+    """Payload bytes of a stored text, the reverse of to_text()
+
+    Binary payloads are stored as their complete hex; the hex previews of
+    older databases can't be converted back and stay text.
+    """
+    if text.startswith(BINARY_PREFIX) and text.endswith(">"):
+        try:
+            return bytes.fromhex(text[len(BINARY_PREFIX) : -1])
+        except ValueError:
+            pass
+    return text.encode("utf-8")
+
+
+class Payload:
+    """Raw payload of a received message, decoded only when displayed
+
+    The bytes received from paho are kept as they are. The format is
+    detected on first use and cached, str() returns a bounded preview for
+    the message log: JSON and text as received, CBOR and MessagePack
+    converted to JSON, binary data as a hex preview of HEX_PREVIEW_BYTES.
+    """
+
+    __slots__ = ("data", "_format")
+
+    # Bytes of binary payloads shown as hex
+    HEX_PREVIEW_BYTES = 64
+    # Characters of text payloads shown
+    TEXT_PREVIEW_CHARS = 4096
+
+    def __init__(self, data):
+        """Wrap the payload bytes *data*"""
+        self.data = data
+        self._format = None
+
+    @property
+    def format(self):
+        """Format of the payload, one of the constants of this module"""
+        if self._format is None:
+            self._format = detect_format(self.data)
+        return self._format
+
+    @property
+    def text(self):
+        """Full text as stored in the database: UTF-8 or the complete hex"""
+        try:
+            return str(self.data, "utf-8")
+        except UnicodeDecodeError:
+            return f"{BINARY_PREFIX}{bytes(self.data).hex()}>"
+
+    def value(self):
+        """Decoded JSON, CBOR or MessagePack value, None for other formats"""
+        fmt = self.format
+        if fmt == JSON:
+            return json.loads(str(self.data, "utf-8"))
+        if fmt == CBOR:
+            return decode_cbor(self.data)
+        if fmt == MSGPACK:
+            return decode_msgpack(self.data)
+        return None
+
+    def preview(self, limit=None):
+        """Display text of at most *limit* (TEXT_PREVIEW_CHARS) characters"""
+        limit = limit or self.TEXT_PREVIEW_CHARS
+        fmt = self.format
+        if fmt == BINARY:
+            return hex_preview(self.data, self.HEX_PREVIEW_BYTES)
+        if fmt in (CBOR, MSGPACK):
+            text = f"[{fmt}] " + json.dumps(
+                self.value(), ensure_ascii=False, default=self._json_default
+            )
+        else:
+            text = str(self.data[: limit * 4], "utf-8", "replace")
+        if len(text) > limit:
+            return text[:limit] + f"... ({len(self.data)} bytes)"
+        return text
+
+    def pretty(self):
+        """Indented JSON of structured payloads, otherwise the preview"""
+        if self.format in (JSON, CBOR, MSGPACK):
+            return json.dumps(
+                self.value(), indent=2, ensure_ascii=False, default=self._json_default
+            )
+        return self.preview()
+
+    def _json_default(self, value):
+        """JSON representation of byte strings inside CBOR/MessagePack values"""
+        if isinstance(value, (bytes, bytearray)):
+            return hex_preview(value, self.HEX_PREVIEW_BYTES)
+        return repr(value)
+
+    def __str__(self):
+        return self.preview()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __bytes__(self):
+        return bytes(self.data)
+
+    def __repr__(self):
+        return f"Payload({len(self.data)} bytes, {self.format})"
+
+
+def _read(data, pos, size):
+    """Return *size* bytes of *data* at *pos* and the position after them"""
+    end = pos + size
+    if end > len(data):
+        raise ValueError("Truncated payload")
+    return data[pos:end], end
+
+
+def _map_key(key):
+    """Map keys that can't be dict (or JSON) keys are shown as their repr"""
+    if isinstance(key, (str, int, float, bool)) or key is None:
+        return key
+    return repr(key)
+
+
+def decode_cbor(data):
+    """Decode a complete CBOR item (RFC 8949, definite lengths only)"""
+    value, pos = _cbor_item(bytes(data), 0, 0)
+    if pos != len(data):
+        raise ValueError("Trailing bytes after CBOR item")
+    return value
+
+
+def _cbor_item(data, pos, depth):
+    """Decode the CBOR item at *pos*, returns (value, next position)"""
+    if depth > _MAX_DEPTH:
+        raise ValueError("CBOR nesting too deep")
+    initial = data[pos]
+    pos += 1
+    major, info = initial >> 5, initial & 0x1F
+
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info in (22, 23):
+            return None, pos
+        for size, fmt in ((25, ">e"), (26, ">f"), (27, ">d")):
+            if info == size:
+                raw, pos = _read(data, pos, struct.calcsize(fmt))
+                return struct.unpack(fmt, raw)[0], pos
+        raise ValueError("Unsupported CBOR simple value")
+
+    if info < 24:
+        argument = info
+    elif info <= 27:
+        raw, pos = _read(data, pos, 1 << (info - 24))
+        argument = int.from_bytes(raw, "big")
+    else:
+        raise ValueError("Indefinite length CBOR item")
+
+    if major == 0:
+        return argument, pos
+    if major == 1:
+        return -1 - argument, pos
+    if major == 2:
+        return _read(data, pos, argument)
+    if major == 3:
+        raw, pos = _read(data, pos, argument)
+        return raw.decode("utf-8"), pos
+    if major == 6:
+        # Tags (dates, bignums, ...) are shown as their content
+        return _cbor_item(data, pos, depth + 1)
+    # Every item takes at least one byte
+    if argument > len(data) - pos:
+        raise ValueError("Truncated CBOR container")
+    if major == 4:
+        items = []
+        for _ in range(argument):
+            item, pos = _cbor_item(data, pos, depth + 1)
+            items.append(item)
+        return items, pos
+    items = {}
+    for _ in range(argument):
+        key, pos = _cbor_item(data, pos, depth + 1)
+        value, pos = _cbor_item(data, pos, depth + 1)
+        items[_map_key(key)] = value
+    return items, pos
+
+
+# MessagePack fixed size types: first byte -> struct format
+_MSGPACK_NUMBERS = {
+    0xCA: ">f",
+    0xCB: ">d",
+    0xCC: ">B",
+    0xCD: ">H",
+    0xCE: ">I",
+    0xCF: ">Q",
+    0xD0: ">b",
+    0xD1: ">h",
+    0xD2: ">i",
+    0xD3: ">q",
+}
+# First byte -> size of the length field of str, bin, array, map and ext
+_MSGPACK_LENGTHS = {
+    0xC4: ("bin", 1),
+    0xC5: ("bin", 2),
+    0xC6: ("bin", 4),
+    0xC7: ("ext", 1),
+    0xC8: ("ext", 2),
+    0xC9: ("ext", 4),
+    0xD9: ("str", 1),
+    0xDA: ("str", 2),
+    0xDB: ("str", 4),
+    0xDC: ("array", 2),
+    0xDD: ("array", 4),
+    0xDE: ("map", 2),
+    0xDF: ("map", 4),
+}
+
+
+def decode_msgpack(data):
+    """Decode a complete MessagePack object"""
+    value, pos = _msgpack_item(bytes(data), 0, 0)
+    if pos != len(data):
+        raise ValueError("Trailing bytes after MessagePack object")
+    return value
+
+
+def _msgpack_item(data, pos, depth):
+    """Decode the MessagePack object at *pos*, returns (value, next position)"""
+    if depth > _MAX_DEPTH:
+        raise ValueError("MessagePack nesting too deep")
+    first = data[pos]
+    pos += 1
+
+    if first <= 0x7F:
+        return first, pos
+    if first >= 0xE0:
+        return first - 0x100, pos
+    if first == 0xC0:
+        return None, pos
+    if first in (0xC2, 0xC3):
+        return first == 0xC3, pos
+    if first in _MSGPACK_NUMBERS:
+        fmt = _MSGPACK_NUMBERS[first]
+        raw, pos = _read(data, pos, struct.calcsize(fmt))
+        return struct.unpack(fmt, raw)[0], pos
+    if 0xD4 <= first <= 0xD8:
+        # fixext 1 to 16: type byte and data, shown as bytes
+        return _read(data, pos + 1, 1 << (first - 0xD4))
+
+    if 0x80 <= first <= 0x8F:
+        kind, length = "map", first & 0x0F
+    elif 0x90 <= first <= 0x9F:
+        kind, length = "array", first & 0x0F
+    elif 0xA0 <= first <= 0xBF:
+        kind, length = "str", first & 0x1F
+    elif first in _MSGPACK_LENGTHS:
+        kind, size = _MSGPACK_LENGTHS[first]
+        raw, pos = _read(data, pos, size)
+        length = int.from_bytes(raw, "big")
+        if kind == "ext":
+            pos += 1
+    else:
+        raise ValueError("Invalid MessagePack type")
+
+    if kind == "str":
+        raw, pos = _read(data, pos, length)
+        return raw.decode("utf-8"), pos
+    if kind in ("bin", "ext"):
+        return _read(data, pos, length)
+    # Every element takes at least one byte
+    if length > len(data) - pos:
+        raise ValueError("Truncated MessagePack container")
+    if kind == "array":
+        items = []
+        for _ in range(length):
+            item, pos = _msgpack_item(data, pos, depth + 1)
+            items.append(item)
+        return items, pos
+    items = {}
+    for _ in range(length):
+        key, pos = _msgpack_item(data, pos, depth + 1)
+        value, pos = _msgpack_item(data, pos, depth + 1)
+        items[_map_key(key)] = value
+    return items, pos
@@ -0,0 +1,294 @@
+import hashlib
+import sqlite3
+import zlib
+from collections import OrderedDict
+from metrics import registry as metrics
+
+# Bits of payloads.encoding
+BINARY = 1
+ZLIB = 2
+
+# Prefix of binary payloads in the text representation, see MQTTBackend
+BINARY_PREFIX = "<Binary Data: "
+
+# SQL expression of a message's payload text, for queries on "messages m"
+MESSAGE_PAYLOAD = (
+    "COALESCE(m.message, (SELECT payload_text(p.data, p.encoding, p.dict_id)"
+    " FROM payloads p WHERE p.id = m.payload_id))"
+)
+
+# SQL expression of a message's payload size in bytes, without decoding it
+MESSAGE_SIZE = (
+    "COALESCE(length(CAST(m.message AS BLOB)),"
+    " (SELECT p.size FROM payloads p WHERE p.id = m.payload_id), 0)"
+)
+
+
+def payload_expression(alias):
+    """MESSAGE_PAYLOAD for the messages row *alias*, e.g. new or old in triggers"""
+    return MESSAGE_PAYLOAD.replace("m.", f"{alias}.")
+
+
+def create_payload_tables(c):
+    """Create the payload and dictionary tables and the reference trigger"""
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS payloads
+                (id INTEGER PRIMARY KEY,
+                 hash BLOB NOT NULL UNIQUE,
+                 data BLOB NOT NULL,
+                 encoding INTEGER NOT NULL,
+                 dict_id INTEGER,
+                 size INTEGER NOT NULL,
+                 refs INTEGER NOT NULL DEFAULT 0)"""
+    )
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS payload_dictionaries
+                (id INTEGER PRIMARY KEY, topic_id INTEGER NOT NULL, data BLOB)"""
+    )
+    # Unreferenced payloads are removed by PayloadCodec.collect_garbage()
+    c.execute(
+        """CREATE TRIGGER IF NOT EXISTS messages_payload_delete
+                AFTER DELETE ON messages WHEN old.payload_id IS NOT NULL BEGIN
+                    UPDATE payloads SET refs = refs - 1 WHERE id = old.payload_id;
+                END"""
+    )
+
+
+class PayloadCodec:
+    """Stores payloads of one database file as deduplicated BLOBs
+
+    Identical payloads are stored once, found by a BLAKE2 hash. Payloads
+    of at least *compress_threshold* bytes are zlib compressed if that
+    makes them smaller. With *dictionaries*, the first payloads of a topic
+    are collected into a zlib dictionary that is used for the rest of the
+    topic's payloads, which helps with small, similar JSON documents.
+    Binary payloads are stored as raw bytes instead of the hex text.
+
+    register() adds the payload_text() SQL function that turns a stored
+    payload back into the text saved by save_message(); it has to be
+    registered on every connection to the file.
+    """
+
+    # Recently stored hashes remembered to skip the lookup in payloads
+    CACHE_SIZE = 100000
+    # Payloads collected per topic before its dictionary is built
+    DICTIONARY_SAMPLES = 16
+    # zlib uses at most the last 32 KB of a dictionary
+    DICTIONARY_SIZE = 32768
+    # Topics collecting samples at the same time
+    MAX_SAMPLED_TOPICS = 1000
+
+    def __init__(self, path=None, compress_threshold=64, dictionaries=True):
+        """Create the codec of the database file *path*"""
+        self.path = path
+        self.compress_threshold = compress_threshold
+        self.use_dictionaries = dictionaries
+        self._hash_ids = OrderedDict()
+        self._refs = {}
+        self._dictionaries = {}
+        self._topic_dictionaries = None
+        self._samples = {}
+        self._new_dictionaries = []
+
+    def register(self, conn):
+        """Add the payload_text() function to *conn*"""
+        conn.create_function("payload_text", 3, self.decode, deterministic=True)
+
+    def decode(self, data, encoding, dict_id):
+        """Return the text of a stored payload"""
+        if data is None:
+            return None
+        if encoding & ZLIB:
+            if dict_id is None:
+                data = zlib.decompress(data)
+            else:
+                zdict = self._dictionary(dict_id)
+                data = zlib.decompressobj(zdict=zdict).decompress(data)
+        if encoding & BINARY:
+            return f"{BINARY_PREFIX}{bytes(data).hex()}>"
+        return bytes(data).decode("utf-8")
+
+    def _dictionary(self, dict_id):
+        """Return a dictionary, loading it from the file if necessary"""
+        zdict = self._dictionaries.get(dict_id)
+        if zdict is None:
+            # Read on an own connection, this runs inside a query
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                row = conn.execute(
+                    "SELECT data FROM payload_dictionaries WHERE id = ?", (dict_id,)
+                ).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                raise ValueError(f"Missing payload dictionary {dict_id}")
+            zdict = self._dictionaries[dict_id] = row[0]
+        return zdict
+
+    def _load_topic_dictionaries(self, c):
+        """Load the dictionaries of the file on first use"""
+        c.execute("SELECT id, topic_id, data FROM payload_dictionaries")
+        self._topic_dictionaries = {}
+        for dict_id, topic_id, data in c.fetchall():
+            self._dictionaries[dict_id] = data
+            self._topic_dictionaries[topic_id] = dict_id
+
+    def store(self, c, topic_id, message):
+        """Store *message* (text or bytes) in a transaction, returns the payload id
+
+        Call flush() with the same cursor before the transaction commits.
+        """
+        if isinstance(message, (bytes, bytearray)):
+            data = bytes(message)
+            try:
+                data.decode("utf-8")
+                kind = 0
+            except UnicodeDecodeError:
+                kind = BINARY
+        elif message.startswith(BINARY_PREFIX) and message.endswith(">"):
+            try:
+                data = bytes.fromhex(message[len(BINARY_PREFIX) : -1])
+                kind = BINARY
+            except ValueError:
+                data, kind = message.encode("utf-8"), 0
+        else:
+            data, kind = message.encode("utf-8"), 0
+
+        if kind:
+            metrics.inc("binary_payloads")
+        digest = hashlib.blake2b(data, digest_size=16, person=bytes([kind])).digest()
+        payload_id = self._hash_ids.get(digest)
+        if payload_id is None:
+            payload_id = self._insert(c, topic_id, digest, data, kind)
+            self._hash_ids[digest] = payload_id
+            if len(self._hash_ids) > self.CACHE_SIZE:
+                self._hash_ids.popitem(last=False)
+        else:
+            self._hash_ids.move_to_end(digest)
+        self._refs[payload_id] = self._refs.get(payload_id, 0) + 1
+        return payload_id
+
+    def _insert(self, c, topic_id, digest, data, kind):
+        """Insert a payload unless it is stored already, returns its id"""
+        c.execute("SELECT id FROM payloads WHERE hash = ?", (digest,))
+        row = c.fetchone()
+        if row is not None:
+            return row[0]
+
+        encoding, dict_id, stored = kind, None, data
+        if len(data) >= self.compress_threshold:
+            if self._topic_dictionaries is None:
+                self._load_topic_dictionaries(c)
+            dict_id = self._topic_dictionaries.get(topic_id)
+            if dict_id is None and self.use_dictionaries:
+                dict_id = self._sample(c, topic_id, data)
+            if dict_id is None:
+                compressed = zlib.compress(data)
+            else:
+                compressor = zlib.compressobj(zdict=self._dictionaries[dict_id])
+                compressed = compressor.compress(data) + compressor.flush()
+            if len(compressed) < len(data):
+                encoding, stored = kind | ZLIB, compressed
+            else:
+                dict_id = None
+
+        c.execute(
+            "INSERT INTO payloads (hash, data, encoding, dict_id, size)"
+            " VALUES (?,?,?,?,?)",
+            (digest, stored, encoding, dict_id, len(data)),
+        )
+        return c.lastrowid
+
+    def _sample(self, c, topic_id, data):
+        """Collect *data* for the topic's dictionary, returns its id once built"""
+        samples = self._samples.get(topic_id)
+        if samples is None:
+            if len(self._samples) >= self.MAX_SAMPLED_TOPICS:
+                return None
+            samples = self._samples[topic_id] = []
+        samples.append(data)
+        if len(samples) < self.DICTIONARY_SAMPLES:
+            return None
+        del self._samples[topic_id]
+        # zlib prefers the most common strings at the end of the dictionary
+        zdict = b"".join(samples)[-self.DICTIONARY_SIZE :]
+        c.execute(
+            "INSERT INTO payload_dictionaries (topic_id, data) VALUES (?, ?)",
+            (topic_id, zdict),
+        )
+        dict_id = c.lastrowid
+        self._dictionaries[dict_id] = zdict
+        self._topic_dictionaries[topic_id] = dict_id
+        self._new_dictionaries.append((dict_id, topic_id))
+        return dict_id
+
+    def flush(self, c):
+        """Write the reference counts collected by store()"""
+        if self._refs:
+            c.executemany(
+                "UPDATE payloads SET refs = refs + ? WHERE id = ?",
+                [(count, payload_id) for payload_id, count in self._refs.items()],
+            )
+            self._refs = {}
+        self._new_dictionaries = []
+
+    def rollback(self):
+        """Forget the state of a transaction that was rolled back"""
+        self._hash_ids.clear()
+        self._refs = {}
+        for dict_id, topic_id in self._new_dictionaries:
+            self._dictionaries.pop(dict_id, None)
+            if self._topic_dictionaries is not None:
+                self._topic_dictionaries.pop(topic_id, None)
+        self._new_dictionaries = []
+
+    def collect_garbage(self, c, payload_ids):
+        """Delete the *payload_ids* no message refers to any more
+
+        Returns the number of deleted payloads.
+        """
+        c.executemany(
+            "DELETE FROM payloads WHERE id = ? AND refs <= 0",
+            [(payload_id,) for payload_id in payload_ids],
+        )
+        removed = c.rowcount
+        if removed:
+            # Cached ids may belong to deleted payloads
+            self._hash_ids.clear()
+        return removed
+
+    def clear(self, c):
+        """Delete all payloads and dictionaries"""
+        c.execute("DELETE FROM payloads")
+        c.execute("DELETE FROM payload_dictionaries")
+        self._hash_ids.clear()
+        self._refs = {}
+        self._dictionaries.clear()
+        self._topic_dictionaries = None
+        self._samples.clear()
+        self._new_dictionaries = []
+
+
+def payload_stats(conn):
+    """Return the payload and stored byte counts of one database file"""
+    row = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(refs), 0), COALESCE(SUM(size * refs), 0),"
+        " COALESCE(SUM(length(data)), 0) FROM payloads"
+    ).fetchone()
+    dictionary_bytes = conn.execute(
+        "SELECT COALESCE(SUM(length(data)), 0) FROM payload_dictionaries"
+    ).fetchone()[0]
+    return {
+        "payloads": row[0],
+        "messages": row[1],
+        "payload_bytes": row[2],
+        "stored_bytes": row[3] + dictionary_bytes,
+        "dictionary_bytes": dictionary_bytes,
+    }
+
+
+def savings_ratio(stats):
+    """Add the ratio of payload bytes to stored bytes to *stats*"""
+    stored = stats["stored_bytes"]
+    stats["savings_ratio"] = stats["payload_bytes"] / stored if stored else None
+    return stats
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from histogram import LatencyHistogram
+
+# Probe payloads start with this prefix, so other messages are skipped cheaply
+PROBE_PREFIX = b'{"probe":"'
+
+
+class _TopicProbe:
+    """Sequence tracking and latency histogram of one probe topic"""
+
+    __slots__ = (
+        "histogram",
+        "sent",
+        "received",
+        "duplicates",
+        "reordered",
+        "highest",
+        "missing",
+        "lost_overflow",
+    )
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.sent = 0
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.highest = None
+        self.missing = set()
+        self.lost_overflow = 0
+
+
+class ProbeMonitor:
+    """Measures publish-to-receive latency with probe messages
+
+    Probe payloads carry a session id, a per-topic sequence number and the
+    perf_counter_ns() of the publish. When they come back through a
+    subscription, the latency goes into a histogram per topic. Gaps in the
+    sequence count as lost until the missing probe arrives late, which
+    then counts as reordered. Sequence numbers seen twice are duplicates.
+    Counting starts with the first probe received on a topic.
+    """
+
+    # Missing sequence numbers remembered per topic for reorder detection
+    MISSING_LIMIT = 10000
+
+    def __init__(self, backend):
+        """Create an idle monitor that publishes through *backend*"""
+        self.backend = backend
+        self.session = os.urandom(4).hex()
+        self.lock = threading.Lock()
+        self.topics = {}
+        self._sequences = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, topics, interval=0.1, qos=0, padding=0):
+        """Subscribe to *topics* and publish a probe to each every *interval* s
+
+        *padding* adds that many bytes to every probe payload. Returns False
+        if the subscription failed, e.g. because the backend isn't connected.
+        """
+        self.stop()
+        topics = list(topics)
+        for topic in topics:
+            if not topic or "+" in topic or "#" in topic:
+                raise ValueError(f"Probe topics can't contain wildcards: {topic}")
+        if not self.backend.subscribe_many([(topic, qos) for topic in topics]):
+            return False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(topics, interval, qos, padding, self._stop_event),
+            name="mqtt-probe",
+            daemon=True,
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stop publishing probes, late probes are still counted"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        """Check if probes are being published"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self, topics, interval, qos, padding, stop_event):
+        """Publish probes until *stop_event* is set"""
+        pad = "x" * padding
+        next_time = time.perf_counter()
+        while not stop_event.is_set():
+            if self.backend.is_connected():
+                for topic in topics:
+                    self._send(topic, qos, pad)
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay < 0:
+                # Fell behind, don't send a burst to catch up
+                next_time = time.perf_counter()
+            elif stop_event.wait(delay):
+                break
+
+    def _send(self, topic, qos, pad):
+        """Publish one probe on *topic*"""
+        with self.lock:
+            seq = self._sequences.get(topic, 0)
+            self._sequences[topic] = seq + 1
+            probe = self.topics.get(topic)
+            if probe is None:
+                probe = self.topics[topic] = _TopicProbe()
+            probe.sent += 1
+
+        payload = {"probe": self.session, "seq": seq, "t_ns": time.perf_counter_ns()}
+        if pad:
+            payload["pad"] = pad
+        message = json.dumps(payload, separators=(",", ":"))
+        self.backend.publish(topic, message, qos=qos, record=False)
+
+    def handle(self, topic, payload, received_ns=None):
+        """Account a received message, returns True if it was one of our probes"""
+        if received_ns is None:
+            received_ns = time.perf_counter_ns()
+        if not payload.startswith(PROBE_PREFIX):
+            return False
+        try:
+            data = json.loads(payload)
+            if data["probe"] != self.session:
+                # Timestamps of other processes are not comparable
+                return False
+            seq = data["seq"]
+            sent_ns = data["t_ns"]
+        except (ValueError, KeyError, TypeError):
+            return False
+
+        with self.lock:
+            probe = self.topics.get(topic)
+            if probe is None:
+                probe = self.topics[topic] = _TopicProbe()
+            if probe.highest is None:
+                probe.highest = seq
+            elif seq > probe.highest:
+                probe.missing.update(range(probe.highest + 1, seq))
+                probe.highest = seq
+                if len(probe.missing) > self.MISSING_LIMIT:
+                    probe.lost_overflow += len(probe.missing)
+                    probe.missing.clear()
+            elif seq in probe.missing:
+                probe.missing.discard(seq)
+                probe.reordered += 1
+            else:
+                probe.duplicates += 1
+                return True
+            probe.received += 1
+        probe.histogram.record(received_ns - sent_ns)
+        return True
+
+    def get_stats(self, topic=None):
+        """Return probe statistics per topic, or of *topic* only
+
+        Each entry has sent, received, lost, reordered and duplicates plus
+        the latency summary in milliseconds.
+        """
+        with self.lock:
+            if topic is not None:
+                items = [(topic, self.topics[topic])] if topic in self.topics else []
+            else:
+                items = sorted(self.topics.items())
+            counters = [
+                (
+                    name,
+                    probe,
+                    {
+                        "topic": name,
+                        "sent": probe.sent,
+                        "received": probe.received,
+                        "lost": len(probe.missing) + probe.lost_overflow,
+                        "reordered": probe.reordered,
+                        "duplicates": probe.duplicates,
+                    },
+                )
+                for name, probe in items
+            ]
+        stats = {}
+        for name, probe, entry in counters:
+            entry["latency_ms"] = probe.histogram.summary(1e6)
+            stats[name] = entry
+        return stats
+
+    def reset(self):
+        """Forget all statistics, sequence numbers continue"""
+        with self.lock:
+            self.topics = {}
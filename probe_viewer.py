@@ -0,0 +1,152 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class ProbeViewer:
+    """Window to run latency probes and show their statistics per topic"""
+
+    REFRESH_MS = 1000
+
+    COLUMNS = (
+        ("Topic", 180),
+        ("Sent", 70),
+        ("Received", 70),
+        ("Lost", 60),
+        ("Reordered", 70),
+        ("Duplicates", 70),
+        ("p50 ms", 70),
+        ("p95 ms", 70),
+        ("p99 ms", 70),
+        ("Max ms", 70),
+    )
+
+    def __init__(self, root, monitor, log_callback=None):
+        """Create the window for the ProbeMonitor *monitor*"""
+        self.monitor = monitor
+        self.log_callback = log_callback
+        self._after_id = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Latency Probe")
+        self.window.geometry("900x350")
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=1)
+
+        self._create_controls()
+        self._create_tree()
+
+        self.window.bind("<Destroy>", self._on_destroy)
+        self._refresh()
+
+    def _create_controls(self):
+        """Create topic, interval and start/stop controls"""
+        control_frame = ttk.Frame(self.window)
+        control_frame.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        control_frame.columnconfigure(1, weight=1)
+
+        ttk.Label(control_frame, text="Topics:").grid(row=0, column=0, padx=5, pady=5)
+        self.topic_entry = ttk.Entry(control_frame, width=30)
+        self.topic_entry.insert(0, "probe/latency")
+        self.topic_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+
+        ttk.Label(control_frame, text="Interval (ms):").grid(
+            row=0, column=2, padx=5, pady=5
+        )
+        self.interval_entry = ttk.Entry(control_frame, width=6)
+        self.interval_entry.insert(0, "100")
+        self.interval_entry.grid(row=0, column=3, padx=5, pady=5)
+
+        ttk.Label(control_frame, text="QoS:").grid(row=0, column=4, padx=5, pady=5)
+        self.qos_box = ttk.Combobox(
+            control_frame, values=("0", "1", "2"), width=3, state="readonly"
+        )
+        self.qos_box.set("0")
+        self.qos_box.grid(row=0, column=5, padx=5, pady=5)
+
+        self.start_btn = ttk.Button(control_frame, text="Start", command=self._start)
+        self.start_btn.grid(row=0, column=6, padx=5, pady=5)
+
+        stop_btn = ttk.Button(control_frame, text="Stop", command=self._stop)
+        stop_btn.grid(row=0, column=7, padx=5, pady=5)
+
+        reset_btn = ttk.Button(control_frame, text="Reset", command=self._reset)
+        reset_btn.grid(row=0, column=8, padx=5, pady=5)
+
+    def _create_tree(self):
+        """Create the statistics table"""
+        names = [name for name, _ in self.COLUMNS]
+        self.tree = ttk.Treeview(self.window, columns=names, show="headings")
+        for name, width in self.COLUMNS:
+            self.tree.heading(name, text=name)
+            self.tree.column(name, width=width, anchor="w" if name == "Topic" else "e")
+        self.tree.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+
+        scrollbar = ttk.Scrollbar(
+            self.window, orient="vertical", command=self.tree.yview
+        )
+        scrollbar.grid(row=1, column=1, sticky="ns")
+        self.tree.configure(yscroll=scrollbar.set)
+
+    def _start(self):
+        """Start publishing probes on the entered topics"""
+        topics = [t.strip() for t in self.topic_entry.get().split(",") if t.strip()]
+        try:
+            interval = float(self.interval_entry.get()) / 1000
+            if interval <= 0:
+                raise ValueError("Interval must be positive")
+            started = self.monitor.start(topics, interval, int(self.qos_box.get()))
+        except ValueError as e:
+            self._log(f"Error starting probe: {e}")
+            return
+        if started:
+            self._log(f"Probing {', '.join(topics)} every {interval * 1000:g} ms")
+
+    def _stop(self):
+        """Stop publishing probes"""
+        self.monitor.stop()
+
+    def _reset(self):
+        """Clear the statistics"""
+        self.monitor.reset()
+        self._refresh(reschedule=False)
+
+    def _log(self, message):
+        """Report a message to the main log"""
+        if self.log_callback:
+            self.log_callback(message)
+
+    def _refresh(self, reschedule=True):
+        """Show the current statistics, reusing the Treeview items"""
+        stats = list(self.monitor.get_stats().values())
+        items = self.tree.get_children()
+        for index, entry in enumerate(stats):
+            latency = entry["latency_ms"]
+            values = (
+                entry["topic"],
+                entry["sent"],
+                entry["received"],
+                entry["lost"],
+                entry["reordered"],
+                entry["duplicates"],
+            ) + tuple(
+                f"{latency[key]:.3f}" if key in latency else "-"
+                for key in ("p50", "p95", "p99", "max")
+            )
+            if index < len(items):
+                self.tree.item(items[index], values=values)
+            else:
+                self.tree.insert("", "end", values=values)
+        if len(items) > len(stats):
+            self.tree.delete(*items[len(stats) :])
+
+        self.start_btn.config(
+            text="Restart" if self.monitor.is_running() else "Start"
+        )
+        if reschedule:
+            self._after_id = self.window.after(self.REFRESH_MS, self._refresh)
+
+    def _on_destroy(self, event):
+        """Stop refreshing once the window is closed"""
+        if event.widget is self.window and self._after_id is not None:
+            self.window.after_cancel(self._after_id)
+            self._after_id = None
@@ -0,0 +1,128 @@
+import enum
+import threading
+import time
+from payload_format import Payload, to_bytes, to_text
+
+
+class Direction(enum.IntEnum):
+    """Direction of a message, the database stores the lowercase name"""
+
+    RECEIVED = 0
+    SENT = 1
+
+    @classmethod
+    def parse(cls, value):
+        """Return the Direction of a member or its name ("received", "sent")"""
+        if isinstance(value, cls):
+            return value
+        return cls[value.upper()]
+
+    def __str__(self):
+        return self.name.lower()
+
+
+class TopicTable:
+    """Interned topic names: every name is kept once and gets a small id
+
+    Ids are handed out in order and never reused; they are only valid in
+    this process, the databases have their own topic ids.
+    """
+
+    def __init__(self):
+        """Create an empty table"""
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.names = []
+
+    def intern(self, name):
+        """Return the id of the topic *name*, adding it if it is new"""
+        topic_id = self.ids.get(name)
+        if topic_id is None:
+            with self.lock:
+                topic_id = self.ids.get(name)
+                if topic_id is None:
+                    topic_id = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = topic_id
+        return topic_id
+
+    def name(self, topic_id):
+        """Return the topic name of *topic_id*"""
+        return self.names[topic_id]
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Topic table shared by all modules
+topics = TopicTable()
+
+
+class Message:
+    """One MQTT message as kept in memory, from the backend to the UI
+
+    Only the raw payload bytes, an integer nanosecond timestamp, the id of
+    the interned topic and the Direction are stored, so a retained message
+    costs the payload plus a few machine words. The payload is decoded
+    only when it is displayed.
+    """
+
+    __slots__ = ("id", "ts_ns", "topic_id", "payload", "direction")
+
+    def __init__(self, message_id, ts_ns, topic_id, payload, direction):
+        """Create a record, see create() to start from a topic name"""
+        self.id = message_id
+        self.ts_ns = ts_ns
+        self.topic_id = topic_id
+        self.payload = payload
+        self.direction = direction
+
+    @classmethod
+    def create(cls, topic, payload, ts_ns=None, direction=Direction.RECEIVED):
+        """Create a record of *topic*, text payloads are converted to bytes
+
+        Text is encoded as UTF-8, the hex text of binary payloads is turned
+        back into the bytes, see payload_format.to_bytes().
+        """
+        if isinstance(payload, str):
+            payload = to_bytes(payload)
+        if ts_ns is None:
+            ts_ns = time.time_ns()
+        return cls(None, ts_ns, topics.intern(topic), payload, direction)
+
+    @classmethod
+    def from_row(cls, row):
+        """Create a record from a stored (id, ts, topic, message, direction) row"""
+        message_id, ts, topic, message, direction = row
+        return cls(
+            message_id,
+            ts * 1000,
+            topics.intern(topic),
+            to_bytes(message) if message is not None else b"",
+            Direction.parse(direction),
+        )
+
+    @property
+    def topic(self):
+        """Topic name, shared by all records of the topic"""
+        return topics.names[self.topic_id]
+
+    @property
+    def timestamp(self):
+        """Timestamp in epoch microseconds, as stored in the database"""
+        return self.ts_ns // 1000
+
+    @property
+    def text(self):
+        """Payload as stored in the database, see payload_format.to_text()"""
+        return to_text(self.payload)
+
+    def preview(self, limit=None):
+        """Bounded display text of the payload, see Payload.preview()"""
+        return Payload(self.payload).preview(limit)
+
+    def __repr__(self):
+        return (
+            f"Message({self.id}, {self.ts_ns}, {self.topic!r},"
+            f" {len(self.payload)} bytes, {self.direction})"
+        )
@@ -0,0 +1,244 @@
+import csv
+import gzip
+import json
+import lzma
+import re
+import threading
+import time
+from datetime import datetime
+
+# Payloads that were stored as "<Binary Data: 0a1b...>" are replayed as bytes
+_BINARY_PAYLOAD = re.compile(r"<Binary Data: ([0-9a-f]*)>\Z")
+
+# File extension -> open function for compressed export files
+_OPENERS = {".gz": gzip.open, ".xz": lzma.open}
+
+
+def database_rows(database, filters=None, chunk_size=5000):
+    """Yield (timestamp, topic, message) rows from the database, oldest first"""
+    for rows in database.stream_messages(filters, chunk_size):
+        for message_id, ts, topic, message, direction in rows:
+            yield ts, topic, message
+
+
+def export_file_rows(filepath, direction=None):
+    """Yield (timestamp, topic, message) rows from a file written by the exporter
+
+    The format (json, ndjson or csv) and compression (.gz, .xz) are taken
+    from the file name. The file is read line by line, so exports larger
+    than memory can be replayed. With *direction* only records of that
+    direction are returned.
+    """
+    name = filepath
+    open_file = open
+    for extension, opener in _OPENERS.items():
+        if name.endswith(extension):
+            name = name[: -len(extension)]
+            open_file = opener
+            break
+
+    with open_file(filepath, "rt", encoding="utf-8", newline="") as f:
+        if name.endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = _json_records(f)
+        for record in records:
+            if direction and record.get("direction") != direction:
+                continue
+            timestamp = _parse_timestamp(record["timestamp"])
+            yield timestamp, record["topic"], record["message"]
+
+
+def _json_records(f):
+    """Parse NDJSON or the exporter's one-record-per-line JSON array"""
+    for line in f:
+        line = line.strip().rstrip(",")
+        if line and line not in ("[", "]", "[]"):
+            yield json.loads(line)
+
+
+def _parse_timestamp(value):
+    """Convert an exported local time string to epoch microseconds"""
+    try:
+        value = datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        value = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    return int(value.timestamp()) * 1000000 + value.microsecond
+
+
+def remap_topic(topic, topic_map):
+    """Replace the first matching prefix of *topic* using (old, new) pairs"""
+    for old, new in topic_map:
+        if topic.startswith(old):
+            return new + topic[len(old) :]
+    return topic
+
+
+class MessageReplayer:
+    """Republishes recorded messages through MQTTBackend.publish
+
+    Messages are sent on the schedule given by their original timestamps,
+    divided by *speed*. A speed of None (or 0) sends as fast as possible.
+    *rate_limit* caps the number of messages per second in every mode.
+    """
+
+    def __init__(
+        self,
+        backend,
+        speed=1.0,
+        rate_limit=None,
+        topic_map=None,
+        qos=0,
+        retain=False,
+        record=False,
+    ):
+        """Create a replayer that publishes via *backend*
+
+        *topic_map* is a dict or a list of (old_prefix, new_prefix) pairs.
+        With *record* the replayed messages are also saved as "sent".
+        """
+        self.backend = backend
+        self.speed = speed or None
+        self.rate_limit = rate_limit or None
+        if isinstance(topic_map, dict):
+            topic_map = list(topic_map.items())
+        self.topic_map = topic_map or []
+        self.qos = qos
+        self.retain = retain
+        self.record = record
+        self.stop_event = threading.Event()
+
+        self.lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        """Reset the counters of the last run"""
+        with self.lock:
+            self.published = 0
+            self.failed = 0
+            self.started = None
+            self.finished = None
+            self.lag = 0.0
+            self.max_lag = 0.0
+            self.total_lag = 0.0
+            self.error = None
+
+    def replay(self, rows, stop_event=None):
+        """Publish (timestamp, topic, message) *rows* and return the stats
+
+        Blocks until all rows were sent, stop() was called, *stop_event* was
+        set or the backend lost its connection.
+        """
+        if stop_event is not None:
+            self.stop_event = stop_event
+        else:
+            self.stop_event.clear()
+        self._reset_stats()
+
+        wait = self.stop_event.wait
+        # Without speed or rate limit there is no schedule to lag behind
+        scheduled = self.speed is not None or self.rate_limit is not None
+        first_ts = None
+        start = time.perf_counter()
+        with self.lock:
+            self.started = start
+
+        try:
+            for index, (ts, topic, message) in enumerate(rows):
+                if self.stop_event.is_set():
+                    break
+
+                # Time at which this message is due, relative to start
+                due = 0.0
+                if self.speed is not None:
+                    if first_ts is None:
+                        first_ts = ts
+                    due = (ts - first_ts) / 1000000 / self.speed
+                if self.rate_limit is not None:
+                    due = max(due, index / self.rate_limit)
+
+                delay = start + due - time.perf_counter()
+                if delay > 0 and wait(delay):
+                    break
+
+                if self.topic_map:
+                    topic = remap_topic(topic, self.topic_map)
+                ok = self.backend.publish(
+                    topic,
+                    _decode_payload(message),
+                    qos=self.qos,
+                    retain=self.retain,
+                    record=self.record,
+                )
+
+                lag = 0.0
+                if scheduled:
+                    lag = max(0.0, time.perf_counter() - start - due)
+                with self.lock:
+                    if ok:
+                        self.published += 1
+                    else:
+                        self.failed += 1
+                    self.lag = lag
+                    self.total_lag += lag
+                    if lag > self.max_lag:
+                        self.max_lag = lag
+                if not ok and not self.backend.is_connected():
+                    raise ConnectionError("Not connected to broker")
+        except Exception as e:
+            with self.lock:
+                self.error = str(e)
+        finally:
+            with self.lock:
+                self.finished = time.perf_counter()
+        return self.get_stats()
+
+    def replay_async(self, rows, done_callback=None, stop_event=None):
+        """Run replay() on a background thread
+
+        *done_callback* is called from that thread as done_callback(stats).
+        Returns the started thread.
+        """
+
+        def run():
+            stats = self.replay(rows, stop_event)
+            if done_callback:
+                done_callback(stats)
+
+        thread = threading.Thread(target=run, name="mqtt-replay", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Stop a running replay after the current message"""
+        self.stop_event.set()
+
+    def get_stats(self):
+        """Return published messages, achieved rate and lag behind schedule"""
+        with self.lock:
+            if self.started is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self.finished or time.perf_counter()) - self.started
+            sent = self.published + self.failed
+            return {
+                "published": self.published,
+                "failed": self.failed,
+                "elapsed_s": elapsed,
+                "rate": self.published / elapsed if elapsed > 0 else 0.0,
+                "lag_ms": self.lag * 1000,
+                "max_lag_ms": self.max_lag * 1000,
+                "avg_lag_ms": self.total_lag / sent * 1000 if sent else 0.0,
+                "running": self.started is not None and self.finished is None,
+                "error": self.error,
+            }
+
+
+def _decode_payload(message):
+    """Turn a stored message back into the payload that was received"""
+    if message is None:
+        return None
+    match = _BINARY_PAYLOAD.match(message)
+    if match:
+        return bytes.fromhex(match.group(1))
+    return message
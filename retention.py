@@ -0,0 +1,287 @@
+import math
+import threading
+import time
+from metrics import registry as metrics
+from subscriptions import SubscriptionManager
+
+
+class RetentionPolicy:
+    """Limits on the stored message history, None means unlimited
+
+    *max_age* is in seconds, *max_size* in bytes of used database pages.
+    *max_rows_per_topic* applies to every topic, *topic_limits* maps topic
+    filters (wildcards allowed) to row limits for the matching topics; the
+    smallest matching limit wins.
+    """
+
+    def __init__(
+        self,
+        max_age=None,
+        max_rows=None,
+        max_size=None,
+        max_rows_per_topic=None,
+        topic_limits=None,
+    ):
+        """Create a policy from the given limits"""
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self.max_size = max_size
+        self.max_rows_per_topic = max_rows_per_topic
+        self.topic_limits = dict(topic_limits or {})
+        self._limit_filters = SubscriptionManager()
+        for topic_filter in self.topic_limits:
+            self._limit_filters.add(topic_filter)
+
+    @classmethod
+    def from_value(cls, value):
+        """Return *value* if it is a policy, otherwise build one from a dict"""
+        if value is None or isinstance(value, cls):
+            return value
+        return cls(**value)
+
+    def is_empty(self):
+        """Check whether the policy limits nothing"""
+        return (
+            self.max_age is None
+            and self.max_rows is None
+            and self.max_size is None
+            and self.max_rows_per_topic is None
+            and not self.topic_limits
+        )
+
+    def topic_limit(self, topic):
+        """Return the row limit of *topic*, or None"""
+        limits = [
+            self.topic_limits[s.topic_filter]
+            for s in self._limit_filters.match(topic)
+        ]
+        if self.max_rows_per_topic is not None:
+            limits.append(self.max_rows_per_topic)
+        return min(limits) if limits else None
+
+    def has_topic_limits(self):
+        """Check whether any per-topic limit is set"""
+        return self.max_rows_per_topic is not None or bool(self.topic_limits)
+
+    def min_topic_limit(self):
+        """Return the smallest per-topic limit"""
+        limits = list(self.topic_limits.values())
+        if self.max_rows_per_topic is not None:
+            limits.append(self.max_rows_per_topic)
+        return min(limits)
+
+    def to_dict(self):
+        """Return the limits as a dict"""
+        return {
+            "max_age": self.max_age,
+            "max_rows": self.max_rows,
+            "max_size": self.max_size,
+            "max_rows_per_topic": self.max_rows_per_topic,
+            "topic_limits": dict(self.topic_limits),
+        }
+
+
+class RetentionManager:
+    """Background job that enforces a RetentionPolicy on an MQTTDatabase
+
+    Messages are deleted oldest first in batches of *batch_size* rows, each
+    in its own short transaction, with a pause between batches so the
+    writer gets the lock. While the writer queue is more than half full
+    the job waits. Freed pages are returned to the file system with
+    incremental VACUUM if the database was created with auto_vacuum.
+    """
+
+    # Pages returned to the file system per incremental VACUUM step
+    VACUUM_PAGES = 1024
+    # Pages of the FTS5 index merged per step before the size is measured
+    MERGE_PAGES = 256
+
+    def __init__(self, database, policy, interval=60.0, batch_size=1000, pause=0.05):
+        """Create the job, it checks the limits every *interval* seconds"""
+        self.database = database
+        self.policy = RetentionPolicy.from_value(policy)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.deleted = 0
+        self.reclaimed_bytes = 0
+        self.last_report = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run the job on a background thread"""
+        if self._thread is not None:
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="mqtt-retention", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the job after the current batch"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        """Check whether the background thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def trigger(self):
+        """Run the next check now instead of waiting for the interval"""
+        self._wake_event.set()
+
+    def _run(self):
+        """Check the limits until stop()"""
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                metrics.inc("retention_errors")
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+
+    def run_once(self):
+        """Enforce the policy once, returns a report of what was deleted"""
+        # Rows not yet indexed or migrated must not be deleted
+        if self.database.is_migrating() or self.policy.is_empty():
+            return None
+
+        started = time.monotonic()
+        before = self.database.get_space_info()
+        policy = self.policy
+        deleted = {"age": 0, "rows": 0, "size": 0, "topics": 0}
+
+        if policy.max_age is not None:
+            cutoff = time.time_ns() // 1000 - int(policy.max_age * 1000000)
+            deleted["age"] = self._delete(None, before_ts=cutoff)
+
+        if policy.has_topic_limits():
+            counts = self.database.get_topic_row_counts(policy.min_topic_limit())
+            for topic, count in counts:
+                limit = policy.topic_limit(topic)
+                if limit is not None and count > limit:
+                    deleted["topics"] += self._delete(count - limit, topic=topic)
+
+        if policy.max_rows is not None:
+            excess = self.database.get_message_count() - policy.max_rows
+            if excess > 0:
+                deleted["rows"] = self._delete(excess)
+
+        if policy.max_size is not None:
+            deleted["size"] = self._delete_to_size(policy.max_size)
+
+        self._vacuum()
+        after = self.database.get_space_info()
+        report = {
+            "deleted": deleted,
+            "deleted_total": sum(deleted.values()),
+            "freed_bytes": before["used_bytes"] - after["used_bytes"],
+            "reclaimed_bytes": before["file_bytes"] - after["file_bytes"],
+            "file_bytes": after["file_bytes"],
+            "duration_s": time.monotonic() - started,
+        }
+        with self.lock:
+            self.runs += 1
+            self.deleted += report["deleted_total"]
+            self.reclaimed_bytes += max(report["reclaimed_bytes"], 0)
+            self.last_report = report
+            self.last_error = None
+        metrics.inc("retention_deleted_rows", report["deleted_total"])
+        metrics.inc("retention_reclaimed_bytes", max(report["reclaimed_bytes"], 0))
+        return report
+
+    def _delete(self, count, before_ts=None, topic=None):
+        """Delete up to *count* (None: all) matching oldest rows in batches"""
+        total = 0
+        if topic is None:
+            # Whole partitions are unlinked instead of deleted row by row
+            total = self.database.drop_partitions(count, before_ts)
+        while not self._stop_event.is_set():
+            limit = self.batch_size
+            if count is not None:
+                limit = min(limit, count - total)
+                if limit <= 0:
+                    break
+            self._wait_for_writer()
+            n = self.database.delete_oldest(limit, before_ts, topic)
+            total += n
+            if n < limit:
+                break
+            time.sleep(self.pause)
+        return total
+
+    def _delete_to_size(self, max_size):
+        """Delete the oldest rows until the used pages fit into *max_size*
+
+        Each pass deletes the rows estimated from the average row size.
+        Deleted rows only become tombstones in the FTS5 index, so the index
+        is compacted before the size is measured again; a pass that frees
+        nothing measurable ends the run instead of deleting further.
+        """
+        total = 0
+        used = self.database.get_space_info()["used_bytes"]
+        if used > max_size:
+            # Rows deleted by earlier runs may still be in the index
+            used = self._used_bytes()
+        while not self._stop_event.is_set():
+            rows = self.database.get_message_count()
+            if used <= max_size or rows == 0:
+                break
+            excess = math.ceil((used - max_size) / (used / rows))
+            n = self._delete(min(max(excess, 1), rows))
+            total += n
+            if n == 0:
+                break
+            previous, used = used, self._used_bytes()
+            if used >= previous:
+                break
+        return total
+
+    def _used_bytes(self):
+        """Used bytes once the FTS5 index has dropped the deleted rows"""
+        while not self._stop_event.is_set():
+            self._wait_for_writer()
+            if not self.database.compact_search_index(self.MERGE_PAGES):
+                break
+            time.sleep(self.pause)
+        return self.database.get_space_info()["used_bytes"]
+
+    def _vacuum(self):
+        """Return free pages to the file system in small steps"""
+        while not self._stop_event.is_set():
+            self._wait_for_writer()
+            if self.database.incremental_vacuum(self.VACUUM_PAGES) == 0:
+                break
+            time.sleep(self.pause)
+
+    def _wait_for_writer(self):
+        """Wait while the writer queue is more than half full"""
+        while not self._stop_event.is_set():
+            stats = self.database.get_writer_stats()
+            if stats["queue_depth"] * 2 <= stats["queue_capacity"]:
+                return
+            self._stop_event.wait(self.pause)
+
+    def get_stats(self):
+        """Return the totals and the report of the last run"""
+        with self.lock:
+            return {
+                "running": self.is_running(),
+                "policy": self.policy.to_dict(),
+                "runs": self.runs,
+                "deleted": self.deleted,
+                "reclaimed_bytes": self.reclaimed_bytes,
+                "last_report": self.last_report,
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,38 @@
+from collections import deque
+
+
+class MessageRingBuffer:
+    """Fixed-capacity buffer holding the most recent Message records
+
+    The records are kept as the backend created them (see records.py), so
+    a retained message costs its payload bytes and one small object.
+    """
+
+    def __init__(self, capacity=10000):
+        """Initialize an empty buffer, the oldest records are evicted first"""
+        self.capacity = capacity
+        self.records = deque(maxlen=capacity)
+
+    def append(self, record):
+        """Add a single record"""
+        self.records.append(record)
+
+    def extend(self, records):
+        """Add several records at once"""
+        self.records.extend(records)
+
+    def clear(self):
+        """Remove all records"""
+        self.records.clear()
+
+    def latest(self, count):
+        """Return up to *count* of the newest records, oldest first"""
+        if count >= len(self.records):
+            return list(self.records)
+        return list(self.records)[-count:]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
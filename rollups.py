@@ -0,0 +1,149 @@
+import math
+
+# Rollup resolutions and their bucket length in microseconds
+ROLLUPS = {"minute": 60 * 1000000, "hour": 3600 * 1000000}
+
+# Longer payloads are not parsed as numbers
+NUMBER_MAX_BYTES = 64
+_NUMBER_START = frozenset(b"+-.0123456789")
+
+_UPSERT = """INSERT INTO {table}
+                  (bucket, topic_id, count, bytes, num_count, num_min, num_max, num_sum)
+             VALUES (?,?,?,?,?,?,?,?)
+             ON CONFLICT (bucket, topic_id) DO UPDATE SET
+                 count = count + excluded.count,
+                 bytes = bytes + excluded.bytes,
+                 num_count = num_count + excluded.num_count,
+                 num_min = COALESCE(min(num_min, excluded.num_min), num_min,
+                                    excluded.num_min),
+                 num_max = COALESCE(max(num_max, excluded.num_max), num_max,
+                                    excluded.num_max),
+                 num_sum = num_sum + excluded.num_sum"""
+
+
+def rollup_table(resolution):
+    """Table name of the rollup *resolution* ("minute" or "hour")"""
+    if resolution not in ROLLUPS:
+        raise ValueError(f"Unknown rollup resolution: {resolution}")
+    return f"rollup_{resolution}"
+
+
+def create_rollup_tables(c):
+    """Create the rollup tables, returns True if they didn't exist
+
+    One row per bucket and topic with the message count, the payload bytes
+    and count, min, max and sum of the payloads that are plain numbers.
+    The key starts with the bucket, so time ranges are range scans and the
+    writer updates the end of the tree.
+    """
+    c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_minute'"
+    )
+    created = c.fetchone() is None
+    for resolution in ROLLUPS:
+        c.execute(
+            f"""CREATE TABLE IF NOT EXISTS {rollup_table(resolution)}
+                    (bucket INTEGER NOT NULL,
+                     topic_id INTEGER NOT NULL,
+                     count INTEGER NOT NULL,
+                     bytes INTEGER NOT NULL,
+                     num_count INTEGER NOT NULL,
+                     num_min REAL,
+                     num_max REAL,
+                     num_sum REAL NOT NULL,
+                     PRIMARY KEY (bucket, topic_id)) WITHOUT ROWID"""
+        )
+    return created
+
+
+def parse_number(payload):
+    """Return the value of a payload (text or bytes) that is a plain number
+
+    None for everything else, including NaN and infinity. The first
+    character is checked before float() is tried.
+    """
+    if not payload or len(payload) > NUMBER_MAX_BYTES:
+        return None
+    first = payload[0]
+    if isinstance(first, str):
+        first = ord(first)
+    if first not in _NUMBER_START:
+        return None
+    try:
+        value = float(payload)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+class RollupBatch:
+    """Aggregates of a batch of messages for the rollup tables
+
+    add() is called for every message of a batch; write() merges the
+    per-minute aggregates and the per-hour aggregates derived from them
+    into the tables with one upsert per table and bucket, in the
+    transaction of the batch.
+    """
+
+    __slots__ = ("minutes",)
+
+    def __init__(self):
+        """Create an empty batch"""
+        # (bucket, topic_id) -> [count, bytes, num_count, min, max, sum]
+        self.minutes = {}
+
+    def add(self, topic_id, ts, size, number=None, count=1):
+        """Add one message of *size* bytes, with its value if it is a number
+
+        With a *count* of -1 the message is removed again; min and max
+        can't be taken back and keep the deleted value.
+        """
+        key = (ts - ts % ROLLUPS["minute"], topic_id)
+        row = self.minutes.get(key)
+        if row is None:
+            row = self.minutes[key] = [0, 0, 0, None, None, 0.0]
+        row[0] += count
+        row[1] += size * count
+        if number is not None:
+            row[2] += count
+            row[5] += number * count
+            if count > 0:
+                row[3] = number if row[3] is None else min(row[3], number)
+                row[4] = number if row[4] is None else max(row[4], number)
+
+    def write(self, c):
+        """Upsert the aggregates into the rollup tables and empty the batch"""
+        if not self.minutes:
+            return
+        hours = {}
+        for (bucket, topic_id), row in self.minutes.items():
+            key = (bucket - bucket % ROLLUPS["hour"], topic_id)
+            merged = hours.get(key)
+            if merged is None:
+                hours[key] = list(row)
+            else:
+                _merge_row(merged, row)
+        for resolution, rows in (("minute", self.minutes), ("hour", hours)):
+            table = rollup_table(resolution)
+            c.executemany(
+                _UPSERT.format(table=table),
+                [(*key, *row) for key, row in rows.items()],
+            )
+            # Buckets whose messages were all deleted
+            emptied = [key for key, row in rows.items() if row[0] < 0]
+            c.executemany(
+                f"DELETE FROM {table} WHERE bucket = ? AND topic_id = ? AND count <= 0",
+                emptied,
+            )
+        self.minutes = {}
+
+
+def _merge_row(row, other):
+    """Merge the aggregate *other* into *row*"""
+    row[0] += other[0]
+    row[1] += other[1]
+    row[2] += other[2]
+    row[5] += other[5]
+    if other[3] is not None:
+        row[3] = other[3] if row[3] is None else min(row[3], other[3])
+        row[4] = other[4] if row[4] is None else max(row[4], other[4])
@@ -0,0 +1,103 @@
+import tkinter as tk
+from tkinter import ttk
+from database import format_timestamp
+
+
+class StateViewer:
+    """Window with the current (last received) value of every topic
+
+    Rows come from the in-memory LastValueCache, so refreshing doesn't
+    touch the message history.
+    """
+
+    REFRESH_MS = 1000
+    # Rows shown at once, narrow the prefix to see other topics
+    MAX_ROWS = 1000
+    # Characters of the payload shown in the table
+    PAYLOAD_PREVIEW = 200
+
+    COLUMNS = (("Topic", 250), ("Value", 400), ("Updated", 150))
+
+    def __init__(self, root, cache):
+        """Create the window for the LastValueCache *cache*"""
+        self.cache = cache
+        self._after_id = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Current State")
+        self.window.geometry("850x450")
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=1)
+
+        self._create_controls()
+        self._create_tree()
+
+        self.window.bind("<Destroy>", self._on_destroy)
+        self._refresh()
+
+    def _create_controls(self):
+        """Create the topic prefix filter and the status label"""
+        control_frame = ttk.Frame(self.window)
+        control_frame.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        control_frame.columnconfigure(1, weight=1)
+
+        ttk.Label(control_frame, text="Topic prefix:").grid(
+            row=0, column=0, padx=5, pady=5
+        )
+        self.prefix_entry = ttk.Entry(control_frame)
+        self.prefix_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.prefix_entry.bind("<KeyRelease>", lambda e: self._refresh(False))
+
+        self.status_label = ttk.Label(control_frame, text="")
+        self.status_label.grid(row=0, column=2, padx=5, pady=5)
+
+    def _create_tree(self):
+        """Create the state table"""
+        names = [name for name, _ in self.COLUMNS]
+        self.tree = ttk.Treeview(self.window, columns=names, show="headings")
+        for name, width in self.COLUMNS:
+            self.tree.heading(name, text=name)
+            self.tree.column(name, width=width, anchor="w")
+        self.tree.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+
+        scrollbar = ttk.Scrollbar(
+            self.window, orient="vertical", command=self.tree.yview
+        )
+        scrollbar.grid(row=1, column=1, sticky="ns")
+        self.tree.configure(yscroll=scrollbar.set)
+
+    def _refresh(self, reschedule=True):
+        """Show the cached values, reusing the Treeview items"""
+        values = self.cache.items(self.prefix_entry.get(), self.MAX_ROWS + 1)
+        shown = values[: self.MAX_ROWS]
+        rows = [
+            (
+                value.topic,
+                str(value.payload)[: self.PAYLOAD_PREVIEW].replace("\n", " "),
+                format_timestamp(value.timestamp),
+            )
+            for value in shown
+        ]
+
+        items = self.tree.get_children()
+        for index, row in enumerate(rows):
+            if index < len(items):
+                self.tree.item(items[index], values=row)
+            else:
+                self.tree.insert("", "end", values=row)
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows) :])
+
+        more = "+" if len(values) > len(shown) else ""
+        self.status_label.config(
+            text=f"{len(shown)}{more} of {len(self.cache)} topics"
+        )
+
+        if reschedule:
+            self._after_id = self.window.after(self.REFRESH_MS, self._refresh)
+
+    def _on_destroy(self, event):
+        """Stop refreshing once the window is closed"""
+        if event.widget is self.window and self._after_id is not None:
+            self.window.after_cancel(self._after_id)
+            self._after_id = None
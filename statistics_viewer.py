@@ -0,0 +1,300 @@
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from tkinter import ttk
+from database import format_timestamp
+
+
+def _format_gap(us):
+    """Readable duration of *us* microseconds"""
+    if us is None:
+        return "-"
+    if us < 1000:
+        return f"{us:.0f} µs"
+    if us < 1000000:
+        return f"{us / 1000:.1f} ms"
+    if us < 60000000:
+        return f"{us / 1000000:.1f} s"
+    if us < 3600000000:
+        return f"{us / 60000000:.1f} min"
+    return f"{us / 3600000000:.1f} h"
+
+
+class StatisticsViewer:
+    """Window with message statistics aggregated by the database
+
+    Shows the busiest topics, a histogram of the message rate and the
+    distribution of the time between messages of a topic. The queries run
+    on a background thread (see MessageAnalytics, which caches them and
+    only reads new rows on a refresh), results are handed to the UI thread
+    through a queue.
+    """
+
+    # Interval of the automatic refresh
+    REFRESH_MS = 5000
+    # Interval the UI thread checks for results
+    POLL_MS = 100
+    # Selectable time ranges: (label, seconds or None, histogram bucket seconds)
+    RANGES = (
+        ("All", None, 3600),
+        ("Last hour", 3600, 60),
+        ("Last day", 86400, 1800),
+        ("Last week", 7 * 86400, 3 * 3600),
+    )
+    TOP_COLUMNS = (
+        ("Topic", 300),
+        ("Messages", 90),
+        ("Bytes", 100),
+        ("First seen", 150),
+        ("Last seen", 150),
+    )
+    # Histogram bars drawn at most, older buckets are left out
+    MAX_BARS = 200
+
+    def __init__(self, root, database):
+        """Create the window for the MQTTDatabase *database*"""
+        self.database = database
+        self._results = deque()
+        self._running = False
+        self._after_id = None
+        self._poll_id = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Statistics")
+        self.window.geometry("900x650")
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=1)
+        self.window.rowconfigure(2, weight=1)
+
+        self._create_controls()
+        self._create_top_topics()
+        self._create_histogram()
+
+        self.window.bind("<Destroy>", self._on_destroy)
+        self._poll_id = self.window.after(self.POLL_MS, self._poll)
+        self._refresh()
+
+    def _create_controls(self):
+        """Create the time range, topic prefix and top N controls"""
+        control_frame = ttk.Frame(self.window)
+        control_frame.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        control_frame.columnconfigure(7, weight=1)
+
+        ttk.Label(control_frame, text="Range:").grid(row=0, column=0, padx=5, pady=5)
+        self.range_combo = ttk.Combobox(
+            control_frame,
+            values=[label for label, _, _ in self.RANGES],
+            width=10,
+            state="readonly",
+        )
+        self.range_combo.current(0)
+        self.range_combo.grid(row=0, column=1, padx=5, pady=5)
+        self.range_combo.bind("<<ComboboxSelected>>", lambda e: self._refresh(False))
+
+        ttk.Label(control_frame, text="Topic prefix:").grid(
+            row=0, column=2, padx=5, pady=5
+        )
+        self.prefix_entry = ttk.Entry(control_frame, width=25)
+        self.prefix_entry.grid(row=0, column=3, padx=5, pady=5)
+        self.prefix_entry.bind("<Return>", lambda e: self._refresh(False))
+
+        ttk.Label(control_frame, text="Top:").grid(row=0, column=4, padx=5, pady=5)
+        self.top_spin = ttk.Spinbox(control_frame, from_=5, to=500, width=5)
+        self.top_spin.set(20)
+        self.top_spin.grid(row=0, column=5, padx=5, pady=5)
+
+        ttk.Button(
+            control_frame, text="Refresh", command=lambda: self._refresh(False)
+        ).grid(row=0, column=6, padx=5, pady=5)
+
+        self.status_label = ttk.Label(control_frame, text="")
+        self.status_label.grid(row=0, column=7, padx=5, pady=5, sticky="e")
+
+    def _create_top_topics(self):
+        """Create the table of the busiest topics"""
+        frame = ttk.LabelFrame(self.window, text="Top topics", padding="5")
+        frame.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+
+        names = [name for name, _ in self.TOP_COLUMNS]
+        self.top_tree = ttk.Treeview(frame, columns=names, show="headings")
+        for name, width in self.TOP_COLUMNS:
+            self.top_tree.heading(name, text=name)
+            anchor = "e" if name in ("Messages", "Bytes") else "w"
+            self.top_tree.column(name, width=width, anchor=anchor)
+        self.top_tree.grid(row=0, column=0, sticky="nsew")
+
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.top_tree.yview)
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        self.top_tree.configure(yscroll=scrollbar.set)
+
+    def _create_histogram(self):
+        """Create the message rate chart and the gap distribution table"""
+        frame = ttk.Frame(self.window)
+        frame.grid(row=2, column=0, padx=5, pady=5, sticky="nsew")
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+
+        chart_frame = ttk.LabelFrame(frame, text="Messages over time", padding="5")
+        chart_frame.grid(row=0, column=0, padx=(0, 5), sticky="nsew")
+        chart_frame.columnconfigure(0, weight=1)
+        chart_frame.rowconfigure(0, weight=1)
+        self.canvas = tk.Canvas(chart_frame, background="white", height=200)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.canvas.bind("<Configure>", lambda e: self._draw_histogram())
+        self._histogram = []
+        self._bucket_seconds = 60
+
+        gap_frame = ttk.LabelFrame(frame, text="Time between messages", padding="5")
+        gap_frame.grid(row=0, column=1, sticky="nsew")
+        gap_frame.rowconfigure(0, weight=1)
+        self.gap_tree = ttk.Treeview(
+            gap_frame, columns=("Gap", "Count"), show="headings", height=9
+        )
+        self.gap_tree.heading("Gap", text="Gap")
+        self.gap_tree.heading("Count", text="Count")
+        self.gap_tree.column("Gap", width=110, anchor="w")
+        self.gap_tree.column("Count", width=80, anchor="e")
+        self.gap_tree.grid(row=0, column=0, sticky="nsew")
+        self.gap_label = ttk.Label(gap_frame, text="")
+        self.gap_label.grid(row=1, column=0, sticky="w")
+
+    def _query(self):
+        """Filters, top N and histogram bucket of the current controls"""
+        label = self.range_combo.get()
+        seconds, bucket = next((s, b) for name, s, b in self.RANGES if name == label)
+        filters = {}
+        if seconds is not None:
+            # Rounded down to the minute, so refreshes within a minute
+            # share the cached aggregates
+            now_us = int(time.time()) // 60 * 60 * 1000000
+            filters["start"] = now_us - seconds * 1000000
+        prefix = self.prefix_entry.get().strip()
+        if prefix:
+            filters["topic_prefix"] = prefix
+        try:
+            limit = max(1, int(self.top_spin.get()))
+        except ValueError:
+            limit = 20
+        return filters, limit, bucket
+
+    def _refresh(self, reschedule=True):
+        """Start the queries on a background thread unless they are running"""
+        if reschedule:
+            self._after_id = self.window.after(self.REFRESH_MS, self._refresh)
+        if self._running:
+            return
+        self._running = True
+        filters, limit, bucket = self._query()
+        threading.Thread(
+            target=self._run_queries,
+            args=(filters, limit, bucket),
+            name="mqtt-statistics",
+            daemon=True,
+        ).start()
+
+    def _run_queries(self, filters, limit, bucket):
+        """Run the analytics queries; runs on the query thread"""
+        started = time.perf_counter()
+        try:
+            result = {
+                "top": self.database.get_top_topics(limit, filters=filters),
+                "histogram": self.database.get_message_histogram(bucket, filters),
+                "gaps": self.database.get_gap_distribution(filters),
+                "bucket": bucket,
+                "elapsed": time.perf_counter() - started,
+            }
+        except Exception as e:
+            result = {"error": str(e)}
+        self._results.append(result)
+
+    def _poll(self):
+        """Show the results of finished queries"""
+        self._poll_id = self.window.after(self.POLL_MS, self._poll)
+        if not self._results:
+            return
+        result = self._results.popleft()
+        self._running = False
+        if "error" in result:
+            self.status_label.config(text=f"Error: {result['error']}")
+            return
+        self._show_top_topics(result["top"])
+        self._show_gaps(result["gaps"])
+        self._histogram = result["histogram"]
+        self._bucket_seconds = result["bucket"]
+        self._draw_histogram()
+        self.status_label.config(
+            text=f"Updated {time.strftime('%H:%M:%S')}"
+            f" in {result['elapsed'] * 1000:.0f} ms"
+        )
+
+    def _show_top_topics(self, stats):
+        """Fill the top topics table"""
+        self.top_tree.delete(*self.top_tree.get_children())
+        for s in stats:
+            self.top_tree.insert(
+                "",
+                "end",
+                values=(
+                    s["topic"],
+                    s["count"],
+                    s["bytes"],
+                    format_timestamp(s["first_ts"]),
+                    format_timestamp(s["last_ts"]),
+                ),
+            )
+
+    def _show_gaps(self, gaps):
+        """Fill the gap distribution table"""
+        self.gap_tree.delete(*self.gap_tree.get_children())
+        lower = 0
+        for upper, count in gaps["buckets"]:
+            if upper is None:
+                label = f">= {_format_gap(lower)}"
+            else:
+                label = f"< {_format_gap(upper)}"
+                lower = upper
+            self.gap_tree.insert("", "end", values=(label, count))
+        self.gap_label.config(
+            text=f"min {_format_gap(gaps['min_us'])}, "
+            f"mean {_format_gap(gaps['mean_us'])}, "
+            f"max {_format_gap(gaps['max_us'])}"
+        )
+
+    def _draw_histogram(self):
+        """Draw the message counts per bucket as bars"""
+        self.canvas.delete("all")
+        rows = self._histogram[-self.MAX_BARS :]
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if not rows or width < 50 or height < 40:
+            return
+        left, top, bottom = 10, 20, height - 20
+        bar_width = (width - 2 * left) / len(rows)
+        highest = max(count for _, count in rows)
+        for index, (_, count) in enumerate(rows):
+            x = left + index * bar_width
+            y = bottom - (bottom - top) * count / highest
+            self.canvas.create_rectangle(
+                x, y, x + max(bar_width - 1, 1), bottom, fill="#1f77b4", width=0
+            )
+        self.canvas.create_text(
+            left, top - 5, anchor="sw", text=f"max {highest} / {self._bucket_seconds} s"
+        )
+        self.canvas.create_text(
+            left, bottom + 3, anchor="nw", text=format_timestamp(rows[0][0])
+        )
+        self.canvas.create_text(
+            width - left, bottom + 3, anchor="ne", text=format_timestamp(rows[-1][0])
+        )
+
+    def _on_destroy(self, event):
+        """Stop refreshing once the window is closed"""
+        if event.widget is not self.window:
+            return
+        for after_id in (self._after_id, self._poll_id):
+            if after_id is not None:
+                self.window.after_cancel(after_id)
+        self._after_id = self._poll_id = None
@@ -0,0 +1,172 @@
+import threading
+
+
+class Subscription:
+    """One topic filter with its QoS, handlers and counters"""
+
+    __slots__ = (
+        "topic_filter",
+        "qos",
+        "handlers",
+        "message_count",
+        "byte_count",
+        "last_timestamp",
+    )
+
+    def __init__(self, topic_filter, qos=0):
+        """Create a subscription for *topic_filter*"""
+        self.topic_filter = topic_filter
+        self.qos = qos
+        self.handlers = []
+        self.message_count = 0
+        self.byte_count = 0
+        self.last_timestamp = None
+
+
+class _FilterNode:
+    """Level of the filter index, wildcards are stored as '+' and '#' children"""
+
+    __slots__ = ("children", "subscription")
+
+    def __init__(self):
+        self.children = {}
+        self.subscription = None
+
+
+def validate_filter(topic_filter):
+    """Raise ValueError if *topic_filter* is not a valid MQTT topic filter"""
+    if not topic_filter:
+        raise ValueError("Topic filter must not be empty")
+    levels = topic_filter.split("/")
+    for index, level in enumerate(levels):
+        if "#" in level and (level != "#" or index != len(levels) - 1):
+            raise ValueError(f"'#' must be the last level on its own: {topic_filter}")
+        if "+" in level and level != "+":
+            raise ValueError(f"'+' must occupy a whole level: {topic_filter}")
+
+
+class SubscriptionManager:
+    """Set of active topic filters with local wildcard dispatch
+
+    Filters are compiled into a trie; the subscriptions matching a topic
+    are cached until the set of filters changes, so routing a message is
+    a single dict lookup for topics that were seen before.
+    """
+
+    # Maximum number of topics kept in the match cache
+    CACHE_SIZE = 100000
+
+    def __init__(self):
+        """Create an empty manager"""
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self._root = _FilterNode()
+        self._cache = {}
+
+    def add(self, topic_filter, qos=0, handler=None):
+        """Add or update a filter, returns its Subscription"""
+        validate_filter(topic_filter)
+        with self.lock:
+            subscription = self.subscriptions.get(topic_filter)
+            if subscription is None:
+                subscription = Subscription(topic_filter, qos)
+                self.subscriptions[topic_filter] = subscription
+                node = self._root
+                for level in topic_filter.split("/"):
+                    node = node.children.setdefault(level, _FilterNode())
+                node.subscription = subscription
+                self._cache = {}
+            subscription.qos = qos
+            if handler is not None and handler not in subscription.handlers:
+                subscription.handlers.append(handler)
+            return subscription
+
+    def remove(self, topic_filter):
+        """Remove a filter, returns False if it wasn't subscribed"""
+        with self.lock:
+            if self.subscriptions.pop(topic_filter, None) is None:
+                return False
+            self._remove_from_index(self._root, topic_filter.split("/"), 0)
+            self._cache = {}
+            return True
+
+    def _remove_from_index(self, node, levels, index):
+        """Unlink the filter from the trie, pruning empty nodes"""
+        if index == len(levels):
+            node.subscription = None
+        else:
+            child = node.children.get(levels[index])
+            if child is None:
+                return
+            self._remove_from_index(child, levels, index + 1)
+            if child.subscription is None and not child.children:
+                del node.children[levels[index]]
+
+    def clear(self):
+        """Remove all filters"""
+        with self.lock:
+            self.subscriptions = {}
+            self._root = _FilterNode()
+            self._cache = {}
+
+    def get(self, topic_filter):
+        """Return the Subscription of *topic_filter*, or None"""
+        return self.subscriptions.get(topic_filter)
+
+    def filters(self):
+        """Return (topic_filter, qos) tuples of all subscriptions"""
+        with self.lock:
+            return [(s.topic_filter, s.qos) for s in self.subscriptions.values()]
+
+    def match(self, topic):
+        """Return the subscriptions whose filter matches *topic*"""
+        matches = self._cache.get(topic)
+        if matches is not None:
+            return matches
+
+        with self.lock:
+            found = []
+            self._match(self._root, topic.split("/"), 0, found)
+            matches = tuple(found)
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache = {}
+            self._cache[topic] = matches
+        return matches
+
+    def _match(self, node, levels, index, found):
+        """Collect subscriptions below *node* that match levels[index:]"""
+        # Wildcards on the first level don't match $-topics
+        system_topic = index == 0 and levels[0].startswith("$")
+
+        wildcard = node.children.get("#")
+        if wildcard is not None and not system_topic:
+            found.append(wildcard.subscription)
+
+        if index == len(levels):
+            if node.subscription is not None:
+                found.append(node.subscription)
+            return
+
+        child = node.children.get(levels[index])
+        if child is not None:
+            self._match(child, levels, index + 1, found)
+        child = node.children.get("+")
+        if child is not None and not system_topic:
+            self._match(child, levels, index + 1, found)
+
+    def dispatch(self, topic, payload, timestamp=None):
+        """Route a message to the matching subscriptions
+
+        Updates the counters of every matching subscription and calls its
+        handlers as handler(topic, payload, timestamp). Returns the
+        matching subscriptions.
+        """
+        matches = self.match(topic)
+        size = len(payload) if payload is not None else 0
+        for subscription in matches:
+            subscription.message_count += 1
+            subscription.byte_count += size
+            subscription.last_timestamp = timestamp
+            for handler in subscription.handlers:
+                handler(topic, payload, timestamp)
+        return matches
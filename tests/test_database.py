@@ -0,0 +1,26 @@
+from database import MQTTDatabase
+from records import Direction, Message
+
+
+def test_readers_return_message_records(tmp_path):
+    database = MQTTDatabase(str(tmp_path / "messages.db"))
+    try:
+        database.save(Message.create("plant/temperature", "21.5", 1000000000))
+        database.save(
+            Message.create("plant/valve", "open", 2000000000, Direction.SENT)
+        )
+        database.flush()
+
+        recent = database.get_recent_messages(10)
+        assert [(r.topic, r.text, r.direction) for r in recent] == [
+            ("plant/valve", "open", Direction.SENT),
+            ("plant/temperature", "21.5", Direction.RECEIVED),
+        ]
+        page = database.get_messages_page(after_key=recent[0].id)
+        assert [record.id for record in page] == [recent[1].id]
+        [(record, snippet)] = database.search("valve")
+        assert record.id == recent[0].id
+        assert record.timestamp == 2000000
+        assert isinstance(snippet, str)
+    finally:
+        database.close()
@@ -0,0 +1,25 @@
+from database import MQTTDatabase
+from last_values import LastValueCache
+from payload_format import Payload
+
+
+def test_restart_keeps_lru_order(tmp_path):
+    path = str(tmp_path / "last_values.db")
+    database = MQTTDatabase(path)
+    cache = LastValueCache(store=database)
+    cache.start()
+    for index, topic in enumerate(["old", "middle", "new"]):
+        cache.update(topic, Payload(b"1"), 1000000 + index)
+    cache.close()
+    database.close()
+
+    database = MQTTDatabase(path)
+    cache = LastValueCache(capacity=3, store=database)
+    cache.start()
+    try:
+        cache.update("fresh", Payload(b"2"), 2000000)
+        assert list(cache.values) == ["middle", "new", "fresh"]
+        assert cache.evictions == 1
+    finally:
+        cache.close()
+        database.close()
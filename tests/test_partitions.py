@@ -0,0 +1,34 @@
+import time
+from database import MQTTDatabase
+from partitions import PartitionedDatabase
+
+DAY = 86400 * 1000000
+
+
+def test_single_file_rows_move_into_partitions(tmp_path):
+    path = str(tmp_path / "messages.db")
+    database = MQTTDatabase(path)
+    for index in range(10):
+        database.save_message(DAY + index * DAY // 4, f"plant/{index % 2}", str(index))
+    database.save_message(3 * DAY, "plant/raw", b"\xff\x00")
+    database.close()
+
+    database = PartitionedDatabase(path, partition="day")
+    try:
+        while database.is_migrating():
+            time.sleep(0.01)
+        main = database.conn.execute("SELECT COUNT(*) FROM messages").fetchone()
+        assert main == (0,)
+        assert len(database.get_partitions()) == 3
+        assert database.get_message_count() == 11
+        assert database.get_message_count({"topic": "plant/1"}) == 5
+        page = database.get_messages_page(limit=4)
+        assert [record.id for record in page] == [11, 10, 9, 8]
+        assert page[0].payload == b"\xff\x00"
+        assert [record.text for record, _ in database.search("7")] == ["7"]
+        recent = database.get_recent_messages(2)
+        assert [record.topic for record in recent] == ["plant/1", "plant/raw"]
+        counts = {s["topic"]: s["count"] for s in database.get_topic_stats()}
+        assert counts == {"plant/0": 5, "plant/1": 5, "plant/raw": 1}
+    finally:
+        database.close()
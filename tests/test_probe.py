@@ -0,0 +1,46 @@
+import paho.mqtt.client as mqtt
+from backend import MQTTBackend
+from database import MQTTDatabase
+
+
+class _LoopbackClient:
+    """Client whose published messages come straight back to the backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        message = mqtt.MQTTMessage(topic=topic.encode())
+        message.payload = payload.encode() if isinstance(payload, str) else payload
+        self.backend._on_message(self, None, message)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+def test_probe_round_trip_is_not_stored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    received = []
+    backend = MQTTBackend(
+        message_callback=received.append,
+        database=MQTTDatabase(str(tmp_path / "probe.db")),
+    )
+    try:
+        backend.client = _LoopbackClient(backend)
+        for _ in range(3):
+            backend.probes._send("probe/latency", 0, "")
+        backend.database.flush()
+
+        stats = backend.probes.get_stats("probe/latency")
+        assert stats["probe/latency"]["received"] == 3
+        assert backend.database.get_message_count() == 0
+        assert backend.get_last_value("probe/latency") is None
+        assert received == []
+    finally:
+        backend.close()
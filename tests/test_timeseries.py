@@ -0,0 +1,13 @@
+from timeseries import extract_numbers
+
+
+def test_plain_numbers():
+    assert extract_numbers(b"21.5") == {"": 21.5}
+    for payload in (b"nan", b"inf", b"-Infinity"):
+        assert extract_numbers(payload) == {}
+
+
+def test_json_skips_non_finite_numbers():
+    payload = b'{"temperature": 21.5, "min": -Infinity, "avg": NaN, "big": 1e999}'
+    assert extract_numbers(payload) == {"temperature": 21.5}
+    assert extract_numbers(b"[1, Infinity, 10" + b"0" * 400 + b"]") == {"0": 1.0}
@@ -0,0 +1,268 @@
+import json
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from payload_format import CBOR, MSGPACK, Payload
+from subscriptions import SubscriptionManager
+
+
+def extract_numbers(data, max_fields=32):
+    """Return {field: value} of the numbers in the payload bytes *data*
+
+    A plain number is returned under the field "". Numbers in JSON, CBOR
+    and MessagePack documents are returned under their dotted path, e.g.
+    "sensor.temperature" or "values.0"; booleans, NaN and infinity are
+    skipped.
+    """
+    try:
+        value = float(data)
+    except (TypeError, ValueError):
+        pass
+    else:
+        return {"": value} if math.isfinite(value) else {}
+    if data[:1] in (b"{", b"["):
+        try:
+            value = json.loads(data)
+        except ValueError:
+            return {}
+    else:
+        payload = Payload(data)
+        if payload.format not in (CBOR, MSGPACK):
+            return {}
+        value = payload.value()
+    numbers = {}
+    _flatten(value, "", numbers, max_fields)
+    return numbers
+
+
+def _flatten(value, path, numbers, max_fields):
+    """Collect the numbers of a decoded document into *numbers*"""
+    if len(numbers) >= max_fields:
+        return
+    if isinstance(value, bool):
+        return
+    if isinstance(value, (int, float)):
+        try:
+            value = float(value)
+        except OverflowError:
+            return
+        if math.isfinite(value):
+            numbers[path] = value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(item, f"{path}.{key}" if path else str(key), numbers, max_fields)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            key = f"{path}.{index}" if path else str(index)
+            _flatten(item, key, numbers, max_fields)
+
+
+def lttb(xs, ys, threshold):
+    """Downsample points to *threshold* points with Largest-Triangle-Three-Buckets
+
+    Keeps the first and last point and, per bucket, the point spanning the
+    largest triangle with its neighbours, so peaks survive. Returns two
+    lists.
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return list(xs), list(ys)
+
+    out_x = [xs[0]]
+    out_y = [ys[0]]
+    bucket = (count - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        # Average of the next bucket is the third corner of the triangle
+        next_start = end
+        next_end = min(int((i + 2) * bucket) + 1, count)
+        if next_start >= next_end:
+            avg_x, avg_y = xs[count - 1], ys[count - 1]
+        else:
+            n = next_end - next_start
+            avg_x = sum(xs[next_start:next_end]) / n
+            avg_y = sum(ys[next_start:next_end]) / n
+
+        ax, ay = xs[a], ys[a]
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        a = best
+
+    out_x.append(xs[count - 1])
+    out_y.append(ys[count - 1])
+    return out_x, out_y
+
+
+def min_max_buckets(xs, ys, buckets):
+    """Reduce points to the minimum and maximum of *buckets* equal slices
+
+    Much cheaper than lttb() on large inputs since min() and max() run
+    over array slices; used to pre-reduce before lttb(). Returns two arrays.
+    """
+    count = len(xs)
+    if buckets * 2 >= count:
+        return xs, ys
+    out_x = array("d")
+    out_y = array("d")
+    size = count / buckets
+    for i in range(buckets):
+        start = int(i * size)
+        end = int((i + 1) * size)
+        chunk = ys[start:end]
+        low = min(chunk)
+        high = max(chunk)
+        low_index = start + chunk.index(low)
+        high_index = start + chunk.index(high)
+        # In time order, so the line doesn't jump back
+        for index in sorted({low_index, high_index}):
+            out_x.append(xs[index])
+            out_y.append(ys[index])
+    return out_x, out_y
+
+
+def downsample(xs, ys, points):
+    """Reduce a series to about *points* points for plotting"""
+    if len(xs) > points * 8:
+        xs, ys = min_max_buckets(xs, ys, points * 2)
+    return lttb(xs, ys, points)
+
+
+class TimeSeries:
+    """Ring buffer of (timestamp, value) samples in two array('d')
+
+    The arrays are allocated once with *capacity* slots, appending
+    overwrites the oldest sample. Timestamps are epoch seconds.
+    """
+
+    def __init__(self, capacity=20000):
+        """Create an empty series of at most *capacity* samples"""
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.count = 0
+        self.total = 0
+        self._next = 0
+
+    def append(self, timestamp, value):
+        """Add a sample, timestamps are expected in increasing order"""
+        with self.lock:
+            index = self._next
+            self.times[index] = timestamp
+            self.values[index] = value
+            self._next = (index + 1) % self.capacity
+            if self.count < self.capacity:
+                self.count += 1
+            self.total += 1
+
+    def window(self, start=None):
+        """Return (times, values) arrays of the samples since *start*, in order"""
+        with self.lock:
+            if self.count < self.capacity:
+                times = self.times[: self.count]
+                values = self.values[: self.count]
+            else:
+                split = self._next
+                times = self.times[split:] + self.times[:split]
+                values = self.values[split:] + self.values[:split]
+        if start is not None:
+            first = bisect_left(times, start)
+            if first:
+                times = times[first:]
+                values = values[first:]
+        return times, values
+
+    def stats(self, start=None):
+        """Return count, min, max and mean of the samples since *start*"""
+        _, values = self.window(start)
+        if not values:
+            return {"count": 0, "min": None, "max": None, "mean": None}
+        return {
+            "count": len(values),
+            "min": min(values),
+            "max": max(values),
+            "mean": sum(values) / len(values),
+        }
+
+    def clear(self):
+        """Remove all samples"""
+        with self.lock:
+            self.count = 0
+            self._next = 0
+
+    def __len__(self):
+        return self.count
+
+
+class TimeSeriesStore:
+    """Numeric time series of the topics matching the tracked filters
+
+    update() is called for every received message. Topics not matching a
+    tracked filter cost one cached filter lookup; for the others the
+    numbers of the payload are extracted (see extract_numbers()) and
+    appended to one TimeSeries per (topic, field). At most *max_series*
+    series of *capacity* samples (16 bytes each) are created.
+    """
+
+    def __init__(self, capacity=20000, max_series=500):
+        """Create an empty store, every series keeps *capacity* samples"""
+        self.capacity = capacity
+        self.max_series = max_series
+        self.lock = threading.Lock()
+        self.series = {}
+        self.dropped = 0
+        self._filters = SubscriptionManager()
+
+    def track(self, topic_filter):
+        """Extract numbers of the topics matching *topic_filter*"""
+        self._filters.add(topic_filter)
+
+    def untrack(self, topic_filter):
+        """Stop extracting numbers for *topic_filter*, existing series are kept"""
+        self._filters.remove(topic_filter)
+
+    def filters(self):
+        """Return the tracked topic filters"""
+        return [topic_filter for topic_filter, _ in self._filters.filters()]
+
+    def update(self, topic, payload, timestamp):
+        """Append the numbers of *payload* (bytes) received at *timestamp* (µs)"""
+        if not self._filters.match(topic):
+            return
+        numbers = extract_numbers(payload)
+        if not numbers:
+            return
+        seconds = timestamp / 1000000
+        for field, value in numbers.items():
+            key = (topic, field)
+            series = self.series.get(key)
+            if series is None:
+                with self.lock:
+                    if len(self.series) >= self.max_series:
+                        self.dropped += 1
+                        continue
+                    series = self.series.setdefault(key, TimeSeries(self.capacity))
+            series.append(seconds, value)
+
+    def get(self, topic, field=""):
+        """Return the TimeSeries of a topic field, or None"""
+        return self.series.get((topic, field))
+
+    def keys(self):
+        """Return the (topic, field) keys of all series, sorted"""
+        return sorted(self.series)
+
+    def clear(self):
+        """Remove all series"""
+        with self.lock:
+            self.series = {}
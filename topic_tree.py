@@ -0,0 +1,183 @@
+import math
+import threading
+import time
+
+
+class TopicNode:
+    """One level of the topic hierarchy with statistics"""
+
+    __slots__ = (
+        "name",
+        "topic",
+        "parent",
+        "children",
+        "message_count",
+        "byte_count",
+        "total_messages",
+        "total_bytes",
+        "last_payload",
+        "last_timestamp",
+        "_rate",
+        "_rate_time",
+    )
+
+    def __init__(self, name, topic, parent=None):
+        """Create an empty node for the full *topic* path"""
+        self.name = name
+        self.topic = topic
+        self.parent = parent
+        self.children = {}
+        # Messages published to exactly this topic
+        self.message_count = 0
+        self.byte_count = 0
+        # Messages published to this topic or any topic below it
+        self.total_messages = 0
+        self.total_bytes = 0
+        self.last_payload = None
+        self.last_timestamp = None
+        self._rate = 0.0
+        self._rate_time = None
+
+    def rate(self, now=None, time_constant=10.0):
+        """Exponentially weighted messages per second at *now*"""
+        if self._rate_time is None:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        return self._rate * math.exp(-(now - self._rate_time) / time_constant)
+
+    def _record(self, now, time_constant):
+        """Add one event to the rate estimate"""
+        if self._rate_time is not None:
+            self._rate *= math.exp(-(now - self._rate_time) / time_constant)
+        self._rate += 1.0 / time_constant
+        self._rate_time = now
+
+
+class TopicTree:
+    """In-memory trie of all seen topics with per-topic statistics
+
+    update() is O(depth) per message. Reads from other threads are
+    protected by a lock.
+    """
+
+    def __init__(self, rate_time_constant=10.0):
+        """Create an empty tree, rates are averaged over *rate_time_constant* s"""
+        self.root = TopicNode("", "")
+        self.lock = threading.Lock()
+        self.rate_time_constant = rate_time_constant
+        self.topic_count = 0
+
+    def update(self, topic, payload, timestamp=None, now=None):
+        """Record a message on *topic*, returns the topic's node
+
+        *timestamp* is stored as the last timestamp (epoch microseconds),
+        *now* is the monotonic time used for the rate estimate.
+        """
+        if now is None:
+            now = time.monotonic()
+        size = len(payload) if payload is not None else 0
+        tau = self.rate_time_constant
+
+        with self.lock:
+            node = self.root
+            node.total_messages += 1
+            node.total_bytes += size
+            for level in topic.split("/"):
+                child = node.children.get(level)
+                if child is None:
+                    path = f"{node.topic}/{level}" if node is not self.root else level
+                    child = TopicNode(level, path, node)
+                    node.children[level] = child
+                node = child
+                node.total_messages += 1
+                node.total_bytes += size
+                node._record(now, tau)
+
+            if node.message_count == 0:
+                self.topic_count += 1
+            node.message_count += 1
+            node.byte_count += size
+            node.last_payload = payload
+            node.last_timestamp = timestamp
+            return node
+
+    def get(self, topic):
+        """Return the node of *topic*, or None if it was never seen"""
+        with self.lock:
+            node = self.root
+            for level in topic.split("/"):
+                node = node.children.get(level)
+                if node is None:
+                    return None
+            return node
+
+    def match(self, topic_filter):
+        """Return the nodes of all seen topics matching an MQTT filter
+
+        Supports the + (single level) and # (multi level) wildcards.
+        Following the MQTT rules, wildcards on the first level don't match
+        topics starting with '$'.
+        """
+        levels = topic_filter.split("/")
+        results = []
+        with self.lock:
+            self._match(self.root, levels, 0, results)
+        return results
+
+    def _match(self, node, levels, index, results):
+        """Collect matching nodes below *node* for levels[index:]"""
+        if index == len(levels):
+            if node.message_count:
+                results.append(node)
+            return
+
+        level = levels[index]
+        if level == "#":
+            # '#' also matches the parent level itself ("a/#" matches "a")
+            if node.message_count and node is not self.root:
+                results.append(node)
+            for name, child in node.children.items():
+                if index == 0 and name.startswith("$"):
+                    continue
+                self._collect(child, results)
+        elif level == "+":
+            for name, child in node.children.items():
+                if index == 0 and name.startswith("$"):
+                    continue
+                self._match(child, levels, index + 1, results)
+        else:
+            child = node.children.get(level)
+            if child is not None:
+                self._match(child, levels, index + 1, results)
+
+    def _collect(self, node, results):
+        """Collect every node with messages in the subtree of *node*"""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.message_count:
+                results.append(node)
+            stack.extend(node.children.values())
+
+    def stats(self, topic_filter="#", now=None):
+        """Return statistics dicts for all topics matching *topic_filter*"""
+        if now is None:
+            now = time.monotonic()
+        return [
+            {
+                "topic": node.topic,
+                "messages": node.message_count,
+                "bytes": node.byte_count,
+                "rate": node.rate(now, self.rate_time_constant),
+                "last_timestamp": node.last_timestamp,
+                "last_payload": node.last_payload,
+            }
+            for node in self.match(topic_filter)
+        ]
+
+    def clear(self):
+        """Forget all topics"""
+        with self.lock:
+            self.root = TopicNode("", "")
+            self.topic_count = 0
@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+from metrics import registry as metrics
+
+
+class MessageWriter:
+    """Background writer that batches messages into group-committed inserts"""
+
+    _STOP = object()
+
+    def __init__(self, database, batch_size=500, max_latency=0.05, queue_size=10000):
+        """Initialize the writer and start its thread
+
+        batch_size  -- maximum number of rows written per transaction
+        max_latency -- maximum seconds a queued row waits before it is flushed
+        queue_size  -- capacity of the bounded queue; when full, new rows are dropped
+        """
+        self.database = database
+        self.batch_size = max(1, int(batch_size))
+        self.max_latency = max(0.0, float(max_latency))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+
+        # Backpressure statistics
+        self.stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.total_flush_time = 0.0
+        self._commit_timing = metrics.timing("db_commit")
+        metrics.gauge("writer_queue_depth", lambda writer: writer.queue.qsize(), self)
+
+        self._closed = False
+        self.thread = threading.Thread(
+            target=self._run, name="mqtt-db-writer", daemon=True
+        )
+        self.thread.start()
+
+    def enqueue(self, row):
+        """Queue a row for writing, returns False if it had to be dropped"""
+        if self._closed:
+            return False
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += 1
+            metrics.inc("writer_dropped")
+            return False
+        with self.stats_lock:
+            self.enqueued += 1
+        return True
+
+    def flush(self, timeout=None):
+        """Block until every row queued before this call has been written"""
+        if self._closed or not self.thread.is_alive():
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """Write all pending rows and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        metrics.unregister(self)
+        if self.thread.is_alive():
+            self.queue.put(self._STOP)
+            self.thread.join(timeout)
+
+    def get_stats(self):
+        """Return a snapshot of the writer statistics"""
+        with self.stats_lock:
+            batches = self.batches
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "written": self.written,
+                "batches": batches,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "last_flush_ms": self.last_flush_time * 1000,
+                "max_flush_ms": self.max_flush_time * 1000,
+                "avg_flush_ms": (
+                    self.total_flush_time / batches * 1000 if batches else 0.0
+                ),
+                "avg_batch_size": self.written / batches if batches else 0.0,
+            }
+
+    def _run(self):
+        """Collect rows from the queue and write them in batches"""
+        running = True
+        while True:
+            if running:
+                item = self.queue.get()
+            else:
+                # Stop was requested: drain what is left without waiting
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            batch = []
+            waiters = []
+            deadline = time.monotonic() + self.max_latency
+
+            while True:
+                if item is self._STOP:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+
+                # A stop or flush request ends the batch early, but everything
+                # that is already queued still has to be written first
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    if not running or waiters:
+                        item = self.queue.get_nowait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, batch):
+        """Write one batch in a single transaction and record timings"""
+        start = time.perf_counter()
+        try:
+            self.database.save_messages(batch)
+        except Exception as e:
+            with self.stats_lock:
+                self.errors += 1
+                self.last_error = str(e)
+            metrics.inc("db_write_errors")
+            return
+        elapsed = time.perf_counter() - start
+        self._commit_timing.record(elapsed * 1e9)
+        metrics.inc("db_rows_written", len(batch))
+        with self.stats_lock:
+            self.written += len(batch)
+            self.batches += 1
+            self.last_flush_time = elapsed
+            self.total_flush_time += elapsed
+            if elapsed > self.max_flush_time:
+                self.max_flush_time = elapsed